@@ -0,0 +1,98 @@
+"""
+Массовое создание учеников при импорте (parser_tool).
+
+PBKDF2 с числом итераций Django по умолчанию — около 100 мс процессора на
+пароль, поэтому импорт города в несколько тысяч учеников упирается в одно
+ядро. hash_passwords раздаёт пароли пачками пулу процессов (у каждого хеша
+своя соль, как у make_password), а bulk_create_students записывает
+пользователей и профили пачками по batch_size.
+"""
+import math
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from . import ledger
+from .models import Profile, Transaction, User
+
+BATCH_SIZE = 500
+# На меньшем числе паролей запуск процессов не окупается
+PARALLEL_THRESHOLD = 16
+MAX_CHUNK = 50
+
+
+def _init_worker(settings_module):
+    # При запуске через spawn (Windows, macOS) процесс начинает без Django
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def _hash_chunk(passwords):
+    return [make_password(password) for password in passwords]
+
+
+def hash_passwords(passwords, workers=None, progress=None):
+    """
+    Хеши паролей в исходном порядке. workers — число процессов (по умолчанию
+    по числу ядер); progress(готово, всего) вызывается после каждой пачки.
+    """
+    passwords = list(passwords)
+    total = len(passwords)
+    workers = workers or os.cpu_count() or 1
+    # Несколько пачек на процесс, чтобы ядра догружались и прогресс шёл чаще
+    size = max(1, min(MAX_CHUNK, math.ceil(total / (workers * 4))))
+    chunks = [passwords[start:start + size] for start in range(0, total, size)]
+
+    hashed = []
+
+    def collect(results):
+        for chunk in results:
+            hashed.extend(chunk)
+            if progress:
+                progress(len(hashed), total)
+
+    if workers == 1 or total < PARALLEL_THRESHOLD:
+        collect(map(_hash_chunk, chunks))
+    else:
+        settings_module = os.environ.get('DJANGO_SETTINGS_MODULE', 'astrocoins.settings')
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(settings_module,)) as pool:
+            collect(pool.map(_hash_chunk, chunks))
+    return hashed
+
+
+def bulk_create_students(users, astrocoins=None, batch_size=BATCH_SIZE, progress=None):
+    """
+    Создаёт пользователей (пароли уже захешированы) и их профили пачками.
+    bulk_create не шлёт post_save, поэтому профили создаются здесь же;
+    astrocoins — {username: стартовый баланс}. Профиль открывается с нулём,
+    а стартовый баланс проводится через журнал (core.ledger) в той же
+    транзакции, иначе сверка балансов увидит его как расхождение.
+    Возвращает созданных.
+    """
+    astrocoins = astrocoins or {}
+    created = []
+    for start in range(0, len(users), batch_size):
+        with transaction.atomic():
+            batch = User.objects.bulk_create(users[start:start + batch_size])
+            Profile.objects.bulk_create([Profile(user=user) for user in batch])
+            # bulk_credit начисляет одну сумму: по запросу на каждую различную сумму
+            by_amount = defaultdict(list)
+            for user in batch:
+                amount = astrocoins.get(user.username, 0)
+                if amount > 0:
+                    by_amount[amount].append(user)
+            for amount, recipients in by_amount.items():
+                ledger.bulk_credit(
+                    recipients, amount,
+                    kind=Transaction.KIND_ADJUSTMENT,
+                    description='Стартовый баланс при импорте',
+                    metadata={'source': 'import'},
+                )
+        created.extend(batch)
+        if progress:
+            progress(len(created), len(users))
+    return created
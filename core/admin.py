@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.safestring import mark_safe
+from . import search
 from .models import User, Profile, Transaction, Product, Purchase, ProductCategory, Group, Parent, City, School, Course
 
 @admin.register(Parent)
@@ -77,6 +78,8 @@ class ProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'astrocoins', 'created_at')
     search_fields = ('user__username', 'user__email')
     list_filter = ('created_at',)
+    # Баланс меняется только через журнал (core.ledger), иначе он разойдётся с историей
+    readonly_fields = ('astrocoins',)
     fieldsets = (
         ('Пользователь', {'fields': ('user',)}),
         ('Баланс', {'fields': ('astrocoins',)}),
@@ -85,8 +88,8 @@ class ProfileAdmin(admin.ModelAdmin):
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
-    list_display = ('sender', 'receiver', 'amount', 'get_transaction_type_display', 'created_at')
-    list_filter = ('transaction_type', 'created_at')
+    list_display = ('sender', 'receiver', 'amount', 'get_transaction_type_display', 'kind', 'created_at')
+    list_filter = ('transaction_type', 'kind', 'created_at')
     search_fields = ('sender__username', 'receiver__username', 'description')
     
     def get_transaction_type_display(self, obj):
@@ -106,10 +109,17 @@ class TransactionAdmin(admin.ModelAdmin):
         ('Детали транзакции', {
             'fields': ('amount', 'transaction_type', 'description')
         }),
+        ('Журнал', {
+            'fields': ('account', 'delta', 'balance_after')
+        }),
+        ('Связи операции', {
+            'fields': ('kind', 'purchase', 'award', 'award_reason', 'metadata')
+        }),
         ('Информация', {
             'fields': ('created_at',)
         }),
     )
+    readonly_fields = ('account', 'delta', 'balance_after', 'kind', 'purchase', 'award', 'award_reason', 'metadata')
 
 @admin.register(ProductCategory)
 class ProductCategoryAdmin(admin.ModelAdmin):
@@ -225,6 +235,12 @@ class ProductAdmin(admin.ModelAdmin):
             return mark_safe(f'<img src="{obj.image.url}" width="100" height="100" style="object-fit: cover; border-radius: 8px;" />')
         return 'Нет изображения'
     get_image.short_description = 'Изображение'
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по индексам core.search вместо icontains по трём полям"""
+        if not search_term.strip():
+            return queryset, False
+        return search.filter_products(queryset, search_term), False
     
     def save_model(self, request, obj, form, change):
         """Автоматически привязывает товар к городу администратора"""
@@ -0,0 +1,128 @@
+"""
+Начисление наград ученикам.
+
+Награда сразу целой группе (или любому списку учеников) проводится в одной
+транзакции БД за постоянное число запросов: проверка ограничений одним
+сгруппированным запросом, один UPDATE балансов и по одному bulk INSERT для
+записей журнала и наград.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import ledger
+from .models import CoinAward, Transaction
+
+logger = logging.getLogger(__name__)
+
+# Максимум начислений одному ученику от одного учителя за день (защита от спама)
+DAILY_AWARD_LIMIT = 10
+
+SKIP_COOLDOWN = 'cooldown'
+SKIP_DAILY_LIMIT = 'daily_limit'
+
+
+class AwardResult:
+    """Итог пакетного начисления: кому начислено и кто пропущен с причиной"""
+
+    def __init__(self, reason):
+        self.reason = reason
+        self.awards = []
+        self.skipped = []  # пары (ученик, SKIP_COOLDOWN | SKIP_DAILY_LIMIT)
+
+    @property
+    def awarded_count(self):
+        return len(self.awards)
+
+    def skip_message(self, code):
+        if code == SKIP_COOLDOWN:
+            return f'эту награду можно выдать только раз в {self.reason.cooldown_days} дней'
+        return 'превышен дневной лимит начислений'
+
+
+def find_ineligible(student_ids, teacher, reason, now=None):
+    """
+    Возвращает {student_id: причина} для учеников, которым сейчас нельзя выдать
+    награду. Кулдаун причины и дневной лимит учителя проверяются одним запросом.
+    """
+    now = now or timezone.now()
+    day_start = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    today_filter = Q(teacher=teacher, created_at__gte=day_start)
+    conditions = today_filter
+    annotations = {'today_count': Count('id', filter=today_filter)}
+    if reason.cooldown_days > 0:
+        cooldown_filter = Q(reason=reason, created_at__gte=now - timedelta(days=reason.cooldown_days))
+        conditions |= cooldown_filter
+        annotations['cooldown_count'] = Count('id', filter=cooldown_filter)
+
+    rows = (CoinAward.objects
+            .filter(student_id__in=student_ids)
+            .filter(conditions)
+            .values('student_id')
+            .annotate(**annotations))
+
+    ineligible = {}
+    for row in rows:
+        if row.get('cooldown_count'):
+            ineligible[row['student_id']] = SKIP_COOLDOWN
+        elif row['today_count'] >= DAILY_AWARD_LIMIT:
+            ineligible[row['student_id']] = SKIP_DAILY_LIMIT
+    return ineligible
+
+
+def award_students(students, teacher, reason, comment=''):
+    """
+    Выдаёт награду reason каждому ученику из students от имени teacher.
+    Ученики, упёршиеся в кулдаун или дневной лимит, пропускаются и попадают в
+    AwardResult.skipped; остальным монеты начисляются одним пакетом.
+    """
+    students = list(students)
+    result = AwardResult(reason)
+    if not students:
+        return result
+
+    now = timezone.now()
+    description = f"{reason.name}\n{comment if comment else ''}"
+
+    with transaction.atomic():
+        ineligible = find_ineligible([student.pk for student in students], teacher, reason, now)
+        eligible = []
+        for student in students:
+            if student.pk in ineligible:
+                result.skipped.append((student, ineligible[student.pk]))
+            else:
+                eligible.append(student)
+
+        if eligible:
+            # bulk_create не вызывает CoinAward.save(), поэтому монеты не начисляются повторно.
+            # Награды создаются первыми, чтобы записи журнала ссылались на них
+            result.awards = CoinAward.objects.bulk_create([
+                CoinAward(
+                    student=student,
+                    teacher=teacher,
+                    reason=reason,
+                    amount=reason.coins,
+                    comment=comment,
+                    created_at=now,
+                )
+                for student in eligible
+            ])
+            ledger.bulk_credit(
+                eligible, reason.coins,
+                sender=teacher,
+                kind=Transaction.KIND_AWARD,
+                description=description,
+                created_at=now,
+                award_reason=reason,
+                per_user_links={award.student_id: {'award': award} for award in result.awards},
+            )
+
+    logger.info(
+        f"Пакетное начисление: teacher_id={teacher.id}, reason_id={reason.id}, amount={reason.coins}, "
+        f"начислено={result.awarded_count}, пропущено={len(result.skipped)}"
+    )
+    return result
@@ -0,0 +1,84 @@
+"""
+Кеш балансов пользователей.
+
+Страницы читают баланс через get_balance() из кеша (Redis в продакшене)
+вместо запроса к Profile. Кеш обновляет core.ledger в той же транзакции, что
+меняет баланс:
+
+* пока строка профиля заблокирована, номер версии баланса увеличивается
+  (cache.incr), поэтому порядок версий совпадает с порядком коммитов;
+* после коммита новое значение записывается под ключом новой версии.
+
+Читатель берёт текущую версию и значение под ней; при промахе читает Profile
+и кладёт значение через cache.add, не перетирая запись ledger. Значение,
+прочитанное до коммита, может попасть только под ключ версии, которую ledger
+перезапишет после коммита или которую уже никто не читает.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Profile
+
+# Страховка на случай, если процесс упал между коммитом и записью в кеш
+BALANCE_TTL = 300
+
+
+def _version_key(user_id):
+    return f'balance:version:{user_id}'
+
+
+def _value_key(user_id, version):
+    return f'balance:{user_id}:{version}'
+
+
+def _initial_version():
+    # Если ключ версии вытеснен из кеша, новая версия всё равно больше прежних
+    return int(time.time() * 1000)
+
+
+def _current_version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), _initial_version(), None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def bump(user_id, balance):
+    """
+    Отмечает изменение баланса. Вызывается в транзакции, изменившей баланс,
+    пока строка профиля заблокирована; значение попадёт в кеш после коммита.
+    """
+    key = _version_key(user_id)
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), None)
+        version = cache.incr(key)
+    transaction.on_commit(lambda: cache.set(_value_key(user_id, version), balance, BALANCE_TTL))
+
+
+def get_balance(user):
+    """Баланс пользователя (объект или id) из кеша, при промахе — из Profile"""
+    user_id = getattr(user, 'pk', user)
+    version = _current_version(user_id)
+    balance = cache.get(_value_key(user_id, version))
+    if balance is None:
+        balance = Profile.objects.filter(user_id=user_id).values_list('astrocoins', flat=True).first() or 0
+        cache.add(_value_key(user_id, version), balance, BALANCE_TTL)
+    return balance
+
+
+def versions(user_ids):
+    """
+    {id: номер версии баланса} для многих пользователей одним чтением кеша.
+    Номер меняется при каждом изменении баланса — годится для ETag.
+    """
+    keys = {_version_key(user_id): user_id for user_id in user_ids}
+    found = cache.get_many(keys)
+    result = {keys[key]: version for key, version in found.items()}
+    for user_id in set(keys.values()) - set(result):
+        result[user_id] = _current_version(user_id)
+    return result
@@ -0,0 +1,64 @@
+"""
+Корзина магазина.
+
+Хранится в сессии как {id товара: количество}, поэтому добавление товара не
+обращается к базе. Цены и остатки берутся из базы только при показе корзины
+и при оформлении (core.purchases.checkout).
+"""
+from .models import Product
+
+SESSION_KEY = 'cart'
+MAX_QUANTITY = 10
+MAX_ITEMS = 20
+
+
+class Cart:
+    def __init__(self, session):
+        self.session = session
+        self.items = {int(product_id): quantity
+                      for product_id, quantity in session.get(SESSION_KEY, {}).items()}
+
+    def __len__(self):
+        return sum(self.items.values())
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def _save(self):
+        # В сессии ключи JSON — строки
+        self.session[SESSION_KEY] = {str(product_id): quantity for product_id, quantity in self.items.items()}
+
+    def set(self, product_id, quantity):
+        """Устанавливает количество товара; 0 убирает товар из корзины"""
+        quantity = max(0, min(int(quantity), MAX_QUANTITY))
+        if quantity == 0:
+            self.items.pop(product_id, None)
+        elif product_id in self.items or len(self.items) < MAX_ITEMS:
+            self.items[product_id] = quantity
+        else:
+            return False
+        self._save()
+        return True
+
+    def add(self, product_id, quantity=1):
+        return self.set(product_id, self.items.get(product_id, 0) + quantity)
+
+    def clear(self):
+        self.items = {}
+        self._save()
+
+    def lines(self, city_id=None):
+        """
+        [(товар, количество)] по возрастанию id товара одним запросом.
+        Товары, снятые с продажи или из другого города, из корзины убираются.
+        """
+        products = Product.objects.filter(id__in=self.items, available=True).select_related('category')
+        if city_id:
+            products = products.filter(city_id=city_id)
+        products = list(products.order_by('id'))
+
+        found = {product.id for product in products}
+        if found != set(self.items):
+            self.items = {product_id: quantity for product_id, quantity in self.items.items() if product_id in found}
+            self._save()
+        return [(product, self.items[product.id]) for product in products]
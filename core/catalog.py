@@ -0,0 +1,90 @@
+"""
+Каталог магазина.
+
+Категории города и их товары загружаются двумя запросами (категории и один
+Prefetch товаров), а готовая сетка товаров кешируется отдельно для каждой пары
+(город, роль). Сохранение или удаление Product и ProductCategory увеличивает
+версию каталога города (см. core.signals), и старые записи кеша перестают
+читаться.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+
+from . import recommendations
+from .models import Product, ProductCategory
+
+# Страховка для изменений в обход сигналов (queryset.update, перенос товара в другой город)
+CATALOG_TTL = 10 * 60
+
+# Каталог пользователей без города (главный суперадмин) — все категории всех городов
+ALL_CITIES = 'all'
+
+
+def _version_key(city_key):
+    return f'shop:catalog:version:{city_key}'
+
+
+def _catalog_version(city_key):
+    version = cache.get(_version_key(city_key))
+    if version is None:
+        cache.add(_version_key(city_key), int(time.time() * 1000), None)
+        version = cache.get(_version_key(city_key))
+    return version
+
+
+def invalidate(city_id):
+    """Сбрасывает сетку города и общую сетку после коммита текущей транзакции"""
+    def bump():
+        for city_key in {city_id or ALL_CITIES, ALL_CITIES}:
+            try:
+                cache.incr(_version_key(city_key))
+            except ValueError:
+                pass  # Версии ещё нет — кеш этого города пуст
+    transaction.on_commit(bump)
+
+
+def role_key(user):
+    # Суперадмин видит кнопки редактирования, администраторы — пустые категории
+    return 'superuser' if user.is_superuser else user.role
+
+
+def categories_for(city_id):
+    """Категории города с товарами города в filtered_products (None — все города)"""
+    categories = ProductCategory.objects.order_by('order')
+    products = Product.objects.order_by('-featured', '-created_at')
+    if city_id:
+        categories = categories.filter(city_id=city_id)
+        products = products.filter(city_id=city_id)
+    return categories.prefetch_related(Prefetch('products', queryset=products, to_attr='filtered_products'))
+
+
+def catalog_html(user):
+    """Сетка товаров для пользователя: из кеша или рендер по одному запросу к товарам"""
+    city_id = getattr(user, 'city_id', None)
+    city_key = city_id or ALL_CITIES
+    role = role_key(user)
+    key = f'shop:catalog:{city_key}:{role}:{_catalog_version(city_key)}'
+
+    html = cache.get(key)
+    if html is None:
+        categories = list(categories_for(city_id))
+        if not city_id:
+            # Без города товары показываются только в категории своего города
+            for category in categories:
+                category.filtered_products = [product for product in category.filtered_products
+                                              if product.city_id == category.city_id]
+        # Убираем категории без товаров ТОЛЬКО для учеников
+        # Администраторы должны видеть все категории, чтобы добавлять в них товары
+        if user.role == 'student':
+            categories = [category for category in categories if category.filtered_products]
+        # «Популярное» — из предрасчитанной таблицы (core.recommendations), товары уже загружены
+        products = {product.id: product for category in categories for product in category.filtered_products}
+        popular = [products[product_id] for product_id in recommendations.popular_ids(city_id)
+                   if product_id in products]
+        html = render_to_string('core/shop_catalog.html', {'categories': categories, 'popular': popular, 'user': user})
+        cache.set(key, html, CATALOG_TTL)
+    return html
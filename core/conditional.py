@@ -0,0 +1,42 @@
+"""
+Условные GET для JSON API модальных окон.
+
+Сначала вью читает короткий штамп версии данных — updated_at, число и
+максимальный id связанных строк — и строит из него ETag. Если браузер
+прислал тот же ETag в If-None-Match, отвечаем 304 без основного запроса и
+сериализации. Ответы кешируются только в браузере (private) и каждый раз
+перепроверяются (no-cache), поэтому после правки модальное окно сразу
+показывает новые данные.
+"""
+import hashlib
+
+from django.http import HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+
+
+def make_etag(*parts):
+    """ETag из частей штампа версии"""
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def _patch(response, etag):
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_json(request, etag, build):
+    """
+    304, если у браузера уже есть версия etag; иначе JsonResponse(build()).
+    build вызывается только при промахе.
+    """
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return _patch(HttpResponseNotModified(), etag)
+    return _patch(JsonResponse(build()), etag)
+
+
+def parse_ids(value, limit=100):
+    """«1,2,3» → [1, 2, 3] без повторов; ValueError на мусоре"""
+    ids = [int(item) for item in value.split(',') if item.strip()]
+    return list(dict.fromkeys(ids))[:limit]
@@ -0,0 +1,10 @@
+from django.utils.functional import SimpleLazyObject
+
+from .balances import get_balance
+
+
+def balance(request):
+    """Баланс текущего пользователя для шапки и страниц магазина; читается из кеша только при выводе"""
+    if not request.user.is_authenticated:
+        return {}
+    return {'balance': SimpleLazyObject(lambda: get_balance(request.user))}
@@ -0,0 +1,85 @@
+"""
+Выдача купленных товаров.
+
+Список к выдаче по группе или городу строится одним запросом, а отметка
+«выдано» / «не выдано» для любого числа покупок — одним UPDATE ... WHERE
+id IN (...). Права проверяются в том же запросе: покупки вне области
+сотрудника (scope_purchases) просто не попадают под UPDATE.
+"""
+from collections import Counter
+from itertools import groupby
+
+from django.utils import timezone
+
+from .models import Group, Purchase
+
+# Сколько покупок можно отметить одним запросом
+MAX_BATCH = 500
+
+
+def scope_purchases(user):
+    """
+    Покупки, выдачей которых может управлять сотрудник: администратор города —
+    своего города, суперпользователь — все, учитель — учеников своих групп
+    """
+    if user.is_superuser:
+        if user.role == 'city_admin' and user.city_id:
+            return Purchase.objects.filter(user__city_id=user.city_id)
+        return Purchase.objects.all()
+    if user.is_teacher():
+        return Purchase.objects.filter(user__group__teacher=user)
+    return Purchase.objects.none()
+
+
+def scope_groups(user):
+    """Группы, по которым сотрудник может смотреть список к выдаче"""
+    if user.is_superuser:
+        if user.role == 'city_admin' and user.city_id:
+            return Group.objects.filter(school__city_id=user.city_id)
+        return Group.objects.all()
+    if user.is_teacher():
+        return Group.objects.filter(teacher=user)
+    return Group.objects.none()
+
+
+def set_delivered(user, purchase_ids, delivered=True):
+    """
+    Отмечает покупки purchase_ids выданными (или снимает отметку) одним UPDATE.
+    Покупки вне области user и уже отмеченные пропускаются.
+    Возвращает число изменённых покупок.
+    """
+    purchase_ids = list(purchase_ids)[:MAX_BATCH]
+    if not purchase_ids:
+        return 0
+    return (scope_purchases(user)
+            .filter(id__in=purchase_ids, delivered=not delivered)
+            .update(delivered=delivered, delivered_date=timezone.now() if delivered else None))
+
+
+def pickup_purchases(user, group_id=None, include_delivered=False):
+    """Покупки к выдаче с учениками, группами и товарами — один запрос"""
+    purchases = scope_purchases(user).select_related('user', 'user__group', 'product')
+    if group_id:
+        purchases = purchases.filter(user__group_id=group_id)
+    if not include_delivered:
+        purchases = purchases.filter(delivered=False)
+    return purchases.order_by('user__group__name', 'user__group_id', 'user__last_name', 'user__first_name', 'user_id', 'created_at')
+
+
+def pickup_list(purchases):
+    """
+    Раскладывает покупки по группам и ученикам для выдачи:
+    ([{'group', 'students': [{'student', 'items'}]}], [(товар, количество)])
+    """
+    groups = []
+    totals = Counter()
+    for group_id, group_purchases in groupby(purchases, key=lambda purchase: purchase.user.group_id):
+        group_purchases = list(group_purchases)
+        students = []
+        for _, items in groupby(group_purchases, key=lambda purchase: purchase.user_id):
+            items = list(items)
+            students.append({'student': items[0].user, 'items': items})
+        for purchase in group_purchases:
+            totals[purchase.product.name] += purchase.quantity
+        groups.append({'group': group_purchases[0].user.group, 'students': students})
+    return groups, sorted(totals.items())
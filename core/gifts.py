@@ -0,0 +1,94 @@
+"""
+Ежегодные подарки ученикам.
+
+Подарки на день рождения выдаются пакетной командой grant_birthday_gifts по
+расписанию, а не при открытии дашборда: именинники дня находятся по индексу
+(месяц, день), монеты начисляются одной пакетной операцией журнала, а запись
+AnnualGift с уникальностью (пользователь, год, вид) делает повторный запуск
+безопасным.
+"""
+import calendar
+import logging
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import ledger
+from .models import AnnualGift, Transaction, User
+
+logger = logging.getLogger(__name__)
+
+BIRTHDAY_GIFT_AMOUNT = 100
+BIRTHDAY_GIFT_DESCRIPTION = '🎉 Поздравляем с днём рождения! Подарок от Астро-Маркета'
+
+
+def is_birthday(birth_date, today):
+    """Родившиеся 29 февраля в невисокосный год празднуют 28 февраля"""
+    if birth_date is None:
+        return False
+    if (birth_date.month, birth_date.day) == (today.month, today.day):
+        return True
+    return (birth_date.month, birth_date.day) == (2, 29) and (today.month, today.day) == (2, 28) \
+        and not calendar.isleap(today.year)
+
+
+def birthday_students(today):
+    """Активные ученики, у которых сегодня день рождения"""
+    condition = Q(birth_date__month=today.month, birth_date__day=today.day)
+    if (today.month, today.day) == (2, 28) and not calendar.isleap(today.year):
+        condition |= Q(birth_date__month=2, birth_date__day=29)
+    return User.objects.filter(condition, role='student', is_active=True)
+
+
+def birthday_gift_amount(user, year):
+    """Сумма подарка на день рождения, выданного в этом году, или None"""
+    return (AnnualGift.objects
+            .filter(user=user, year=year, kind=AnnualGift.KIND_BIRTHDAY)
+            .values_list('amount', flat=True)
+            .first())
+
+
+def grant_birthday_gifts(today=None, amount=BIRTHDAY_GIFT_AMOUNT):
+    """
+    Выдаёт подарки всем сегодняшним именинникам, которые их ещё не получили.
+    Возвращает список награждённых пользователей.
+    """
+    today = today or timezone.localdate()
+    candidates = {user.pk: user for user in birthday_students(today)}
+    if not candidates:
+        return []
+
+    table = connection.ops.quote_name(AnnualGift._meta.db_table)
+    user_ids = sorted(candidates)
+    rows_sql = ', '.join(['(%s, %s, %s, %s, %s)'] * len(user_ids))
+    now = timezone.now()
+    params = []
+    for user_id in user_ids:
+        params += [user_id, AnnualGift.KIND_BIRTHDAY, today.year, amount, now]
+
+    with transaction.atomic():
+        # Запись о подарке вставляется первой: параллельный запуск упрётся в
+        # уникальность и получит пустой RETURNING, поэтому монеты не начислятся дважды
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, kind, year, amount, created_at) VALUES {rows_sql} '
+                f'ON CONFLICT (user_id, year, kind) DO NOTHING RETURNING user_id',
+                params
+            )
+            granted_ids = sorted(row[0] for row in cursor.fetchall())
+
+        granted = [candidates[user_id] for user_id in granted_ids]
+        if granted:
+            ledger.bulk_credit(
+                granted, amount,
+                kind=Transaction.KIND_BIRTHDAY_GIFT,
+                description=BIRTHDAY_GIFT_DESCRIPTION,
+                created_at=now,
+                metadata={'year': today.year},
+            )
+
+    logger.info(
+        f'Подарки на день рождения {today:%d.%m.%Y}: именинников={len(candidates)}, выдано={len(granted)}'
+    )
+    return granted
@@ -0,0 +1,120 @@
+"""
+Дисковый кеш HTTP-ответов для парсеров algoritmika25.ru.
+
+CachedSession — requests.Session, которая записывает каждый ответ в
+каталог кеша: метаданные в <ключ>.json, тело в <ключ>.body. Ключ —
+адрес, метод и пространство имён сессии (логин учителя: страница /admin
+у каждого своя). Повторный GET уходит с If-None-Match / If-Modified-Since,
+и на 304 тело берётся с диска. В режиме replay сеть не используется
+вовсе: весь конвейер идёт по записанным ответам, а промах — ReplayMiss.
+Модуль не зависит от Django, его импортирует и standalone-парсер.
+"""
+import hashlib
+import json
+import os
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_CACHE_DIR = os.environ.get('ALGORITMIKA_HTTP_CACHE', '.http_cache')
+
+# Заголовки ответа, которые нужны при воспроизведении
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Location')
+
+
+def _write(path, data):
+    with open(f'{path}.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(f'{path}.tmp', path)
+
+
+class ReplayMiss(requests.ConnectionError):
+    """В режиме replay запрошен адрес, которого нет в кеше"""
+
+
+class CachedSession(requests.Session):
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, replay=False, namespace=''):
+        super().__init__()
+        self.cache_dir = cache_dir
+        self.replay = replay
+        self.namespace = namespace
+        self.stats = {'network': 0, 'not_modified': 0, 'replayed': 0}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _key(self, method, url):
+        return hashlib.sha256(f'{self.namespace}\n{method.upper()}\n{url}'.encode()).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key[:2], key)
+        return f'{base}.json', f'{base}.body'
+
+    def _load(self, key):
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return meta, body
+
+    def _store(self, key, method, url, response):
+        meta_path, body_path = self._paths(key)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        meta = {
+            'method': method.upper(),
+            'url': url,
+            'final_url': response.url,
+            'status': response.status_code,
+            'reason': response.reason,
+            'encoding': response.encoding,
+            'headers': {name: response.headers[name] for name in STORED_HEADERS if name in response.headers},
+            'fetched_at': time.time(),
+        }
+        # Сначала тело, затем метаданные: запись без тела не появится
+        _write(body_path, response.content)
+        _write(meta_path, json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+    @staticmethod
+    def _response(meta, body, request=None):
+        response = requests.Response()
+        response.status_code = meta['status']
+        response.reason = meta.get('reason')
+        response.url = meta['final_url']
+        response.encoding = meta.get('encoding')
+        response.headers = CaseInsensitiveDict(meta.get('headers', {}))
+        response._content = body
+        response.request = request
+        return response
+
+    def request(self, method, url, **kwargs):
+        key = self._key(method, url)
+        cached = self._load(key)
+
+        if self.replay:
+            if cached is None:
+                raise ReplayMiss(f'Нет записанного ответа для {method.upper()} {url}')
+            self.stats['replayed'] += 1
+            return self._response(*cached)
+
+        revalidate = cached is not None and method.upper() == 'GET'
+        if revalidate:
+            validators = {}
+            meta_headers = cached[0].get('headers', {})
+            if 'ETag' in meta_headers:
+                validators['If-None-Match'] = meta_headers['ETag']
+            if 'Last-Modified' in meta_headers:
+                validators['If-Modified-Since'] = meta_headers['Last-Modified']
+            kwargs['headers'] = {**validators, **(kwargs.get('headers') or {})}
+
+        response = super().request(method, url, **kwargs)
+        if revalidate and response.status_code == 304:
+            self.stats['not_modified'] += 1
+            return self._response(*cached, request=response.request)
+
+        self.stats['network'] += 1
+        if response.status_code < 500:
+            self._store(key, method, url, response)
+        return response
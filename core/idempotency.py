@@ -0,0 +1,101 @@
+"""
+Ключи идемпотентности для POST-запросов, которые двигают монеты.
+
+Клиент присылает ключ (заголовок Idempotency-Key или скрытое поле формы
+idempotency_key). Первый запрос с ключом выполняется как обычно, а его ответ
+сохраняется в кеше на IDEMPOTENCY_TTL. Повтор с тем же ключом — двойной клик
+или повторная отправка клиентом — получает сохранённый ответ и не доходит до
+view, а значит не блокирует строки Product и Profile.
+"""
+import re
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+FIELD = 'idempotency_key'
+
+IDEMPOTENCY_TTL = 60 * 60
+# Сколько живёт отметка «запрос выполняется», если процесс упал, не успев ответить
+PENDING_TIMEOUT = 30
+# Сколько повтор ждёт завершения первого запроса, прежде чем ответить 409
+WAIT_TIMEOUT = 5
+WAIT_STEP = 0.1
+
+PENDING = 'pending'
+KEY_RE = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+
+def _cache_key(request, key):
+    # Путь входит в ключ: одна и та же форма покупки отправляется на разные товары
+    return f'idempotency:{request.user.pk}:{request.path}:{key}'
+
+
+def _store(cache_key, response):
+    cache.set(cache_key, {
+        'status': response.status_code,
+        'content': response.content,
+        'content_type': response.get('Content-Type'),
+        'location': response.get('Location'),
+    }, IDEMPOTENCY_TTL)
+
+
+def _replay(saved):
+    response = HttpResponse(saved['content'], status=saved['status'], content_type=saved['content_type'])
+    if saved['location']:
+        response['Location'] = saved['location']
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _wait_for_result(cache_key):
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    saved = cache.get(cache_key)
+    while saved == PENDING and time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        saved = cache.get(cache_key)
+    return saved
+
+
+def idempotent(view):
+    """
+    Декоратор view: POST с ключом идемпотентности выполняется не больше одного раза.
+    Запросы без ключа обрабатываются как раньше. Ставится после login_required.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            return view(request, *args, **kwargs)
+
+        key = request.META.get(HEADER) or request.POST.get(FIELD)
+        if not key:
+            return view(request, *args, **kwargs)
+        if not KEY_RE.match(key):
+            return HttpResponseBadRequest('Некорректный ключ идемпотентности')
+
+        cache_key = _cache_key(request, key)
+        if not cache.add(cache_key, PENDING, PENDING_TIMEOUT):
+            # Ключ уже встречался: ждём, пока первый запрос закончит, и отдаём его ответ
+            saved = _wait_for_result(cache_key)
+            if isinstance(saved, dict):
+                return _replay(saved)
+            if saved == PENDING:
+                return JsonResponse({'success': False, 'error': 'Запрос уже обрабатывается'}, status=409)
+            # Первый запрос завершился ошибкой и освободил ключ — выполняем заново
+            cache.add(cache_key, PENDING, PENDING_TIMEOUT)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            cache.delete(cache_key)
+            raise
+
+        if response.status_code >= 500 or getattr(response, 'streaming', False):
+            cache.delete(cache_key)
+        else:
+            _store(cache_key, response)
+        return response
+
+    return wrapper
@@ -0,0 +1,129 @@
+"""
+Уменьшенные копии изображений товаров.
+
+Оригинал в Product.image может весить до 5 МБ, поэтому для магазина из него
+делаются копии WebP и JPEG нескольких ширин. Их имена и размеры хранятся в
+Product.image_variants (см. тег product_picture в core.templatetags.images),
+так что страница строит srcset без обращения к хранилищу. Копии пересоздаются,
+когда меняется файл оригинала: в image_variants записано имя исходника.
+"""
+import io
+import logging
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = (320, 640, 960)
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 6},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+VARIANTS_DIR = 'products/variants'
+
+
+def is_current(product):
+    """Копии соответствуют текущему файлу оригинала"""
+    if not product.image:
+        return not product.image_variants
+    return product.image_variants.get('source') == product.image.name
+
+
+def _variant_name(product, stem, width, extension):
+    return f'{VARIANTS_DIR}/{product.pk}/{stem}-{width}w.{extension}'
+
+
+def _open_source(field):
+    field.open('rb')
+    try:
+        image = Image.open(field)
+        image.load()
+    finally:
+        field.close()
+    # Фото с телефона хранят поворот в EXIF — применяем его до уменьшения
+    return ImageOps.exif_transpose(image)
+
+
+def _flatten(image):
+    """RGB для JPEG: прозрачный фон заменяется белым"""
+    if image.mode != 'RGBA':
+        return image
+    background = Image.new('RGB', image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def build_variants(product):
+    """
+    Создаёт копии изображения товара и возвращает новое значение image_variants.
+    Ширины больше исходной не создаются; если оригинал уже узкий, делается одна
+    копия его ширины.
+    """
+    source = _open_source(product.image)
+    if source.mode not in ('RGB', 'RGBA'):
+        has_alpha = source.mode in ('LA', 'PA') or 'transparency' in source.info
+        source = source.convert('RGBA' if has_alpha else 'RGB')
+    widths = [width for width in WIDTHS if width < source.width] or [source.width]
+    stem = os.path.splitext(os.path.basename(product.image.name))[0]
+
+    variants = {
+        'source': product.image.name,
+        'width': source.width,
+        'height': source.height,
+    }
+    for extension, options in FORMATS.items():
+        variants[extension] = []
+        for width in widths:
+            height = round(source.height * width / source.width)
+            resized = source.resize((width, height), Image.LANCZOS)
+            if extension == 'jpeg':
+                resized = _flatten(resized)
+            buffer = io.BytesIO()
+            resized.save(buffer, **options)
+
+            name = _variant_name(product, stem, width, extension)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            name = default_storage.save(name, ContentFile(buffer.getvalue()))
+            variants[extension].append([width, name])
+    return variants
+
+
+def delete_variants(variants):
+    for extension in FORMATS:
+        for _, name in variants.get(extension, []):
+            if default_storage.exists(name):
+                default_storage.delete(name)
+
+
+def refresh_variants(product, force=False):
+    """
+    Приводит копии в соответствие с оригиналом: создаёт новые и удаляет
+    устаревшие. Возвращает True, если image_variants изменились.
+    """
+    if not force and is_current(product):
+        return False
+
+    old_variants = product.image_variants or {}
+    new_variants = {}
+    if product.image:
+        try:
+            new_variants = build_variants(product)
+        except (OSError, ValueError) as error:
+            # Битый или отсутствующий файл: магазин покажет оригинал, а повторная
+            # попытка будет только после замены файла или запуска с force
+            logger.warning(f'Не удалось обработать изображение товара {product.pk}: {error}')
+            new_variants = {'source': product.image.name}
+
+    new_names = {name for extension in FORMATS for _, name in new_variants.get(extension, [])}
+    stale = {extension: [item for item in old_variants.get(extension, []) if item[1] not in new_names]
+             for extension in FORMATS}
+    delete_variants(stale)
+
+    product.image_variants = new_variants
+    # update() не вызывает сигналы и не запускает обработку повторно
+    type(product).objects.filter(pk=product.pk).update(image_variants=new_variants)
+    return True
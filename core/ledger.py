@@ -0,0 +1,474 @@
+"""
+Журнал движения астрокоинов.
+
+Все изменения Profile.astrocoins проходят через этот модуль. Каждая операция —
+одна запись в Transaction (журнал только дополняется) и один условный UPDATE
+баланса прямо в базе, без чтения профиля и арифметики в Python. Новый баланс
+после коммита попадает в кеш core.balances, откуда его читают страницы.
+
+Вид операции (kind) и ссылки записи (purchase, award, award_reason, metadata)
+передаются именованными аргументами и сохраняются в Transaction как есть.
+"""
+import logging
+import random
+import time
+from datetime import timedelta
+
+from django.db import OperationalError, connection, transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from . import balances
+from .models import Profile, Transaction, BalanceSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Записи моложе этого возраста не попадают в снимок: транзакции, которые ещё
+# не закоммичены, могли получить меньший id, чем уже видимые записи
+SNAPSHOT_LAG = timedelta(minutes=5)
+
+# Ошибки PostgreSQL, после которых транзакцию можно просто повторить:
+# deadlock_detected и serialization_failure
+RETRYABLE_SQLSTATES = {'40P01', '40001'}
+TRANSFER_RETRIES = 5
+RETRY_BACKOFF = 0.02  # секунды; удваивается с каждой попыткой
+
+
+class LedgerError(Exception):
+    """Базовая ошибка журнала"""
+
+
+class InsufficientFunds(LedgerError):
+    """На балансе недостаточно астрокоинов для списания"""
+
+
+def _check_amount(amount):
+    if not isinstance(amount, int) or amount <= 0:
+        raise ValueError(f'Сумма операции должна быть положительным целым числом, получено: {amount!r}')
+
+
+def _apply_delta(user_id, delta, allow_negative=False):
+    """
+    Изменяет баланс одним UPDATE и возвращает новое значение.
+    Для списаний условие в WHERE не даёт уйти в минус без блокировки строки заранее.
+    """
+    table = connection.ops.quote_name(Profile._meta.db_table)
+    sql = f'UPDATE {table} SET astrocoins = astrocoins + %s WHERE user_id = %s'
+    params = [delta, user_id]
+    if delta < 0 and not allow_negative:
+        sql += ' AND astrocoins >= %s'
+        params.append(-delta)
+    sql += ' RETURNING astrocoins'
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+
+    if row is None:
+        # Медленный путь только для ошибок: выясняем причину отказа
+        if not Profile.objects.filter(user_id=user_id).exists():
+            raise Profile.DoesNotExist(f'Профиль пользователя {user_id} не найден')
+        raise InsufficientFunds(f'Недостаточно AstroCoins у пользователя {user_id} для списания {-delta} AC')
+    # Строка заблокирована до конца транзакции: кеш обновится в порядке коммитов
+    balances.bump(user_id, row[0])
+    return row[0]
+
+
+def _post(account, delta, *, sender, receiver, amount, transaction_type, kind, description,
+          allow_negative=False, **links):
+    """Проводит одну запись журнала: UPDATE баланса и INSERT записи в одной транзакции БД"""
+    with transaction.atomic():
+        balance = _apply_delta(account.pk, delta, allow_negative)
+        return Transaction.objects.create(
+            sender=sender,
+            receiver=receiver,
+            amount=amount,
+            transaction_type=transaction_type,
+            kind=kind,
+            description=description,
+            account=account,
+            delta=delta,
+            balance_after=balance,
+            **links
+        )
+
+
+def credit(user, amount, *, sender=None, transaction_type='EARN', kind=Transaction.KIND_OTHER, description='',
+           **links):
+    """Начисляет amount астрокоинов пользователю user"""
+    _check_amount(amount)
+    return _post(
+        user, amount,
+        sender=sender or user,
+        receiver=user,
+        amount=amount,
+        transaction_type=transaction_type,
+        kind=kind,
+        description=description,
+        **links
+    )
+
+
+def debit(user, amount, *, sender=None, receiver=None, transaction_type='SPEND', kind=Transaction.KIND_OTHER,
+          description='', allow_negative=False, **links):
+    """
+    Списывает amount астрокоинов у пользователя user.
+    Если денег не хватает, выбрасывает InsufficientFunds (кроме allow_negative=True).
+    """
+    _check_amount(amount)
+    return _post(
+        user, -amount,
+        sender=sender or user,
+        receiver=receiver or user,
+        amount=amount,
+        transaction_type=transaction_type,
+        kind=kind,
+        description=description,
+        allow_negative=allow_negative,
+        **links
+    )
+
+
+def bulk_credit(users, amount, *, sender=None, transaction_type='EARN', kind=Transaction.KIND_OTHER,
+                description='', created_at=None, per_user_links=None, **links):
+    """
+    Начисляет одинаковую сумму сразу нескольким пользователям.
+    Один UPDATE на все балансы и один INSERT на все записи журнала, сколько бы
+    пользователей ни было. Возвращает записи журнала в порядке id пользователей.
+    Без sender отправителем каждой записи считается сам получатель, как в credit().
+    per_user_links — {id пользователя: ссылки} для полей, своих у каждой записи.
+    """
+    per_user_links = per_user_links or {}
+    _check_amount(amount)
+    users = {user.pk: user for user in users}
+    if not users:
+        return []
+
+    user_ids = sorted(users)
+    created_at = created_at or timezone.now()
+    with transaction.atomic():
+        # Блокируем профили по возрастанию id, как и остальные пакетные операции,
+        # чтобы два параллельных пакета не ждали друг друга по кругу
+        locked = list(Profile.objects.select_for_update()
+                      .filter(user_id__in=user_ids)
+                      .order_by('user_id')
+                      .values_list('user_id', flat=True))
+        if len(locked) != len(user_ids):
+            missing = sorted(set(user_ids) - set(locked))
+            raise Profile.DoesNotExist(f'Профили пользователей не найдены: {missing}')
+
+        table = connection.ops.quote_name(Profile._meta.db_table)
+        placeholders = ', '.join(['%s'] * len(user_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET astrocoins = astrocoins + %s '
+                f'WHERE user_id IN ({placeholders}) RETURNING user_id, astrocoins',
+                [amount, *user_ids]
+            )
+            new_balances = dict(cursor.fetchall())
+        for user_id, balance in new_balances.items():
+            balances.bump(user_id, balance)
+
+        return Transaction.objects.bulk_create([
+            Transaction(
+                sender=sender or users[user_id],
+                receiver=users[user_id],
+                amount=amount,
+                transaction_type=transaction_type,
+                kind=kind,
+                description=description,
+                account=users[user_id],
+                delta=amount,
+                balance_after=new_balances[user_id],
+                created_at=created_at,
+                **links,
+                **per_user_links.get(user_id, {})
+            )
+            for user_id in user_ids
+        ])
+
+
+def _is_retryable(error):
+    cause = error.__cause__
+    code = getattr(cause, 'pgcode', None) or getattr(cause, 'sqlstate', None)
+    return code in RETRYABLE_SQLSTATES
+
+
+def _with_retries(operation, retries):
+    """
+    Выполняет operation() и повторяет её при взаимной блокировке или конфликте
+    сериализации, выжидая растущую паузу со случайным разбросом. Внутри чужой
+    транзакции повтор невозможен — ошибка пробрасывается сразу.
+    """
+    attempt = 0
+    while True:
+        try:
+            return operation()
+        except OperationalError as error:
+            if attempt >= retries or connection.in_atomic_block or not _is_retryable(error):
+                raise
+            delay = RETRY_BACKOFF * 2 ** attempt
+            attempt += 1
+            logger.warning(f'Конфликт блокировок, повтор {attempt} из {retries}: {error}')
+            time.sleep(random.uniform(delay / 2, delay))
+
+
+def transfer(sender, receiver, amount, *, commission=0, retries=TRANSFER_RETRIES):
+    """
+    Переводит amount астрокоинов от sender к receiver.
+    Комиссия списывается с отправителя сверх суммы перевода и никому не зачисляется.
+    Возвращает пару записей журнала (списание, зачисление).
+
+    Оба профиля блокируются в порядке user_id, поэтому встречные переводы
+    A→B и B→A ждут друг друга, а не блокируют по кругу. Если база всё же
+    прервала транзакцию из-за конфликта, перевод повторяется до retries раз.
+    """
+    _check_amount(amount)
+    if commission < 0:
+        raise ValueError('Комиссия не может быть отрицательной')
+    if sender.pk == receiver.pk:
+        raise LedgerError('Нельзя переводить AstroCoins самому себе')
+
+    total_cost = amount + commission
+
+    def attempt():
+        with transaction.atomic():
+            locked = list(Profile.objects.select_for_update()
+                          .filter(user_id__in=[sender.pk, receiver.pk])
+                          .order_by('user_id')
+                          .values_list('user_id', flat=True))
+            if len(locked) != 2:
+                missing = sorted({sender.pk, receiver.pk} - set(locked))
+                raise Profile.DoesNotExist(f'Профили пользователей не найдены: {missing}')
+
+            outgoing = _post(
+                sender, -total_cost,
+                sender=sender,
+                receiver=receiver,
+                amount=total_cost,
+                transaction_type='TRANSFER',
+                kind=Transaction.KIND_TRANSFER_OUT,
+                description=f'Перевод к {receiver.username} ({amount} AC + комиссия {commission} AC)',
+                metadata={'amount': amount, 'commission': commission},
+            )
+            incoming = _post(
+                receiver, amount,
+                sender=sender,
+                receiver=receiver,
+                amount=amount,
+                transaction_type='TRANSFER',
+                kind=Transaction.KIND_TRANSFER_IN,
+                description=f'Перевод от {sender.username}',
+            )
+        return outgoing, incoming
+
+    return _with_retries(attempt, retries)
+
+
+def set_balance(user, new_balance, *, actor, description=None):
+    """
+    Ручная корректировка баланса администратором.
+    Разница с текущим балансом проводится обычной записью журнала; если баланс
+    не изменился, возвращает None.
+    """
+    if new_balance < 0:
+        raise ValueError('Баланс не может быть отрицательным')
+
+    with transaction.atomic():
+        # Блокируем строку, чтобы разница считалась от актуального значения
+        current = Profile.objects.select_for_update().values_list('astrocoins', flat=True).get(user=user)
+        delta = new_balance - current
+        if delta == 0:
+            return None
+
+        description = description or f'Корректировка баланса администратором (было: {current}, стало: {new_balance})'
+        return _post(
+            user, delta,
+            sender=actor,
+            receiver=user,
+            amount=abs(delta),
+            transaction_type='EARN' if delta > 0 else 'SPEND',
+            kind=Transaction.KIND_ADJUSTMENT,
+            description=description,
+            metadata={'previous': current, 'new': new_balance},
+        )
+
+
+def bulk_set_balance(targets, *, actor, description=None, metadata=None, **links):
+    """
+    Пакетная версия set_balance: targets — {пользователь: новый баланс}.
+    Профили блокируются по возрастанию id, новые балансы записываются одним
+    UPDATE, записи журнала с разницей — одним INSERT. Неизменившиеся балансы
+    пропускаются. metadata дополняет {'previous', 'new'} каждой записи.
+    Возвращает записи журнала в порядке id пользователей.
+    """
+    users = {user.pk: user for user in targets}
+    wanted = {user.pk: new_balance for user, new_balance in targets.items()}
+    if any(new_balance < 0 for new_balance in wanted.values()):
+        raise ValueError('Баланс не может быть отрицательным')
+    if not users:
+        return []
+
+    user_ids = sorted(users)
+    with transaction.atomic():
+        # Разница считается от заблокированных актуальных значений, как в set_balance
+        current = dict(Profile.objects.select_for_update()
+                       .filter(user_id__in=user_ids)
+                       .order_by('user_id')
+                       .values_list('user_id', 'astrocoins'))
+        if len(current) != len(user_ids):
+            missing = sorted(set(user_ids) - set(current))
+            raise Profile.DoesNotExist(f'Профили пользователей не найдены: {missing}')
+        changed = [user_id for user_id in user_ids if wanted[user_id] != current[user_id]]
+        if not changed:
+            return []
+
+        table = connection.ops.quote_name(Profile._meta.db_table)
+        values = ', '.join(['(%s, %s)'] * len(changed))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} AS p SET astrocoins = v.balance '
+                f'FROM (VALUES {values}) AS v(user_id, balance) '
+                f'WHERE p.user_id = v.user_id RETURNING p.user_id, p.astrocoins',
+                [value for user_id in changed for value in (user_id, wanted[user_id])]
+            )
+            new_balances = dict(cursor.fetchall())
+        for user_id, balance in new_balances.items():
+            balances.bump(user_id, balance)
+
+        entries = []
+        for user_id in changed:
+            previous, new_balance = current[user_id], new_balances[user_id]
+            delta = new_balance - previous
+            entries.append(Transaction(
+                sender=actor,
+                receiver=users[user_id],
+                amount=abs(delta),
+                transaction_type='EARN' if delta > 0 else 'SPEND',
+                kind=Transaction.KIND_ADJUSTMENT,
+                description=description or f'Корректировка баланса администратором (было: {previous}, стало: {new_balance})',
+                account=users[user_id],
+                delta=delta,
+                balance_after=new_balance,
+                metadata={'previous': previous, 'new': new_balance, **(metadata or {})},
+                **links
+            ))
+        return Transaction.objects.bulk_create(entries)
+
+
+def balance_at(user, moment):
+    """
+    Баланс пользователя на момент moment.
+    Берётся последний снимок до этого момента и к нему добавляются только более
+    поздние записи журнала этого пользователя.
+    """
+    snapshot = (BalanceSnapshot.objects
+                .filter(user=user, created_at__lte=moment)
+                .order_by('-created_at')
+                .first())
+    entries = Transaction.objects.filter(account=user, delta__isnull=False, created_at__lte=moment)
+    if snapshot:
+        entries = entries.filter(id__gt=snapshot.last_entry_id)
+    start = snapshot.balance if snapshot else 0
+    return start + (entries.aggregate(total=Sum('delta'))['total'] or 0)
+
+
+def reconcile(user_ids):
+    """
+    Сверка профилей с журналом: {user_id: (баланс в профиле, баланс по журналу)}.
+    Баланс по журналу — последний снимок плюс записи после него. Профили,
+    снимки и записи читаются одним сгруппированным запросом, то есть из одного
+    согласованного состояния базы.
+    """
+    if not user_ids:
+        return {}
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT p.user_id, p.astrocoins, COALESCE(s.balance, 0) + COALESCE(SUM(t.delta), 0)
+            FROM {quote(Profile._meta.db_table)} p
+            LEFT JOIN LATERAL (
+                SELECT balance, last_entry_id FROM {quote(BalanceSnapshot._meta.db_table)}
+                WHERE user_id = p.user_id
+                ORDER BY created_at DESC, id DESC
+                LIMIT 1
+            ) s ON TRUE
+            LEFT JOIN {quote(Transaction._meta.db_table)} t
+                ON t.account_id = p.user_id AND t.delta IS NOT NULL AND t.id > COALESCE(s.last_entry_id, 0)
+            WHERE p.user_id = ANY(%s)
+            GROUP BY p.user_id, p.astrocoins, s.balance
+            """,
+            [list(user_ids)]
+        )
+        return {user_id: (actual, expected) for user_id, actual, expected in cursor.fetchall()}
+
+
+def correct_drift(user_id):
+    """
+    Записывает в журнал расхождение профиля с историей, не меняя баланс:
+    после записи журнал снова объясняет текущий баланс. Возвращает запись
+    или None, если расхождения нет.
+    """
+    with transaction.atomic():
+        # Блокировка не даёт параллельной операции изменить баланс между сверкой и записью
+        Profile.objects.select_for_update().filter(user_id=user_id).exists()
+        actual, expected = reconcile([user_id]).get(user_id, (0, 0))
+        drift = actual - expected
+        if drift == 0:
+            return None
+        return Transaction.objects.create(
+            sender_id=user_id,
+            receiver_id=user_id,
+            amount=abs(drift),
+            transaction_type='EARN' if drift > 0 else 'SPEND',
+            kind=Transaction.KIND_ADJUSTMENT,
+            description=f'Сверка с журналом: учтено расхождение {drift:+d} AC',
+            account_id=user_id,
+            delta=drift,
+            balance_after=actual,
+            metadata={'reconciliation': True, 'expected': expected},
+        )
+
+
+def take_snapshots(chunk_size=1000):
+    """
+    Фиксирует балансы пользователей, у которых появились новые записи журнала
+    с момента предыдущего снимка. Возвращает количество созданных снимков.
+    """
+    cutoff = timezone.now() - SNAPSHOT_LAG
+    since = BalanceSnapshot.objects.aggregate(last=Max('last_entry_id'))['last'] or 0
+
+    fresh = Transaction.objects.filter(account__isnull=False, id__gt=since, created_at__lt=cutoff)
+    watermark = fresh.aggregate(last=Max('id'))['last']
+    if watermark is None:
+        return 0
+
+    # Последняя запись каждого счёта уже хранит итоговый баланс — сумма не нужна
+    last_ids = (fresh.filter(id__lte=watermark)
+                .values('account')
+                .annotate(last_id=Max('id'))
+                .values_list('last_id', flat=True))
+
+    created = 0
+    batch = []
+    entries = Transaction.objects.filter(id__in=last_ids).values('id', 'account_id', 'balance_after')
+    for entry in entries.iterator(chunk_size=chunk_size):
+        # Снимок учитывает записи счёта до его собственной последней записи:
+        # запись с меньшим id, но моложе cutoff, останется после снимка
+        batch.append(BalanceSnapshot(
+            user_id=entry['account_id'],
+            balance=entry['balance_after'],
+            last_entry_id=entry['id'],
+            created_at=cutoff,
+        ))
+        if len(batch) >= chunk_size:
+            BalanceSnapshot.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+    if batch:
+        BalanceSnapshot.objects.bulk_create(batch)
+        created += len(batch)
+
+    logger.info(f'Снимки балансов: создано {created}, журнал учтён до записи {watermark}')
+    return created
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from core import partitions
+
+
+class Command(BaseCommand):
+    help = ('Обслуживание помесячных секций журнала транзакций: создаёт секции на месяцы вперёд '
+            'и архивирует месяцы старше --keep-months. Итог архивируемого месяца сначала '
+            'сворачивается в снимки балансов. Запускать по расписанию раз в месяц')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, default=12,
+                            help='Сколько последних месяцев (включая текущий) оставить в горячей таблице')
+        parser.add_argument('--compress', action='store_true',
+                            help='Сжать архивируемые месяцы в TransactionArchive и удалить секции '
+                                 '(по умолчанию секции только отсоединяются)')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет сделано')
+
+    def handle(self, *args, **options):
+        if not partitions.is_partitioned():
+            raise CommandError('Таблица транзакций не секционирована (нужен PostgreSQL и миграция 0022)')
+        if options['keep_months'] < 1:
+            raise CommandError('--keep-months должен быть не меньше 1')
+
+        if not options['dry_run']:
+            for name in partitions.ensure_partitions():
+                self.stdout.write(f'📁 Создана секция {name}')
+
+        cutoff = partitions.add_months(partitions.current_month(), 1 - options['keep_months'])
+        old = [(name, month) for name, month in partitions.list_partitions() if month < cutoff]
+        if not old:
+            self.stdout.write(f'Секций старше {cutoff:%m.%Y} нет, архивировать нечего')
+            return
+
+        for name, month in old:
+            if options['dry_run']:
+                self.stdout.write(f'   будет архивирована {name} ({month:%m.%Y})')
+                continue
+            folded = partitions.archive_partition(name, month, compress=options['compress'])
+            action = 'сжата в архив' if options['compress'] else 'отсоединена'
+            self.stdout.write(f'🗄️ {name}: {action}, новых снимков балансов: {folded}')
+
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'✅ Архивировано месяцев: {len(old)}'))
@@ -0,0 +1,167 @@
+import re
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import Transaction, Purchase, CoinAward, AwardReason
+
+
+# Насколько далеко по времени может быть покупка или награда от записи журнала.
+# Старый код создавал их в том же запросе, сразу до или после списания
+MATCH_WINDOW = timedelta(minutes=5)
+
+TRANSFER_OUT_RE = re.compile(r'\((\d+) AC \+ комиссия (\d+) AC\)')
+ADJUSTMENT_RE = re.compile(r'было: (-?\d+), стало: (-?\d+)')
+
+
+class Command(BaseCommand):
+    help = ('Размечает старые транзакции: по тексту описания заполняет вид операции (kind), '
+            'ссылки на покупку, награду и причину награды и metadata. Работает пачками; '
+            'повторный запуск обрабатывает только ещё не размеченные записи')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Сколько записей обрабатывать за раз')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет размечено')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        dry_run = options['dry_run']
+        self.reasons = {reason.name: reason.id for reason in AwardReason.objects.all()}
+
+        stats = Counter()
+        linked = Counter()
+        last_id = 0
+        while True:
+            chunk = list(Transaction.objects
+                         .filter(kind='', id__gt=last_id)
+                         .order_by('id')
+                         .only('id', 'sender_id', 'receiver_id', 'transaction_type', 'description', 'created_at')
+                         [:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+
+            for entry in chunk:
+                self.classify(entry)
+                stats[entry.kind] += 1
+
+            with transaction.atomic():
+                linked['purchase'] += self.link_purchases(chunk)
+                linked['award'] += self.link_awards(chunk)
+                if not dry_run:
+                    Transaction.objects.bulk_update(
+                        chunk, ['kind', 'purchase', 'award', 'award_reason', 'metadata'], batch_size=500
+                    )
+            self.stdout.write(f'   обработано до записи {last_id}')
+
+        if not stats:
+            self.stdout.write('Неразмеченных транзакций нет')
+            return
+
+        self.stdout.write('\n📊 Итоги разметки:')
+        for kind, count in stats.most_common():
+            self.stdout.write(f'   {kind}: {count}')
+        self.stdout.write(f"   связано с покупками: {linked['purchase']}, с наградами: {linked['award']}")
+        if dry_run:
+            self.stdout.write(self.style.WARNING('Пробный запуск: изменения не сохранены'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✅ Размечено транзакций: {sum(stats.values())}'))
+
+    def classify(self, entry):
+        """Определяет вид операции и данные по тексту описания"""
+        description = entry.description or ''
+        first_line = description.split('\n', 1)[0]
+        # Поля не загружались через only(): задаём их явно, иначе bulk_update дочитает каждое отдельным запросом
+        entry.metadata = {}
+        entry.purchase_id = entry.award_id = entry.award_reason_id = None
+
+        if 'BIRTHDAY_GIFT' in description:
+            entry.kind = Transaction.KIND_BIRTHDAY_GIFT
+            entry.metadata = {'year': entry.created_at.year}
+        elif description.startswith('Покупка '):
+            entry.kind = Transaction.KIND_PURCHASE
+        elif description.startswith('Перевод к '):
+            entry.kind = Transaction.KIND_TRANSFER_OUT
+            match = TRANSFER_OUT_RE.search(description)
+            if match:
+                entry.metadata = {'amount': int(match.group(1)), 'commission': int(match.group(2))}
+        elif description.startswith('Перевод от '):
+            entry.kind = Transaction.KIND_TRANSFER_IN
+        elif description.startswith('Отмена: '):
+            entry.kind = Transaction.KIND_AWARD_REVERSAL
+            entry.award_reason_id = self.reasons.get(first_line[len('Отмена: '):])
+        elif description.startswith('Награда от преподавателя: '):
+            entry.kind = Transaction.KIND_BONUS
+            entry.metadata = {'reason': description[len('Награда от преподавателя: '):]}
+        elif description.startswith('Корректировка баланса'):
+            entry.kind = Transaction.KIND_ADJUSTMENT
+            match = ADJUSTMENT_RE.search(description)
+            if match:
+                entry.metadata = {'previous': int(match.group(1)), 'new': int(match.group(2))}
+        elif entry.transaction_type == 'EARN' and first_line in self.reasons:
+            entry.kind = Transaction.KIND_AWARD
+            entry.award_reason_id = self.reasons[first_line]
+        else:
+            entry.kind = Transaction.KIND_OTHER
+
+    def link_purchases(self, chunk):
+        """Связывает записи о покупках с Purchase того же пользователя и товара, ближайшей по времени"""
+        entries = [entry for entry in chunk if entry.kind == Transaction.KIND_PURCHASE]
+        if not entries:
+            return 0
+
+        candidates = (Purchase.objects
+                      .filter(user_id__in={entry.sender_id for entry in entries},
+                              created_at__gte=min(entry.created_at for entry in entries) - MATCH_WINDOW,
+                              created_at__lte=max(entry.created_at for entry in entries) + MATCH_WINDOW,
+                              ledger_entries__isnull=True)
+                      .values_list('id', 'user_id', 'product_id', 'product__name', 'created_at'))
+        by_key = {}
+        for purchase_id, user_id, product_id, product_name, created_at in candidates:
+            by_key.setdefault((user_id, product_name), []).append(((purchase_id, product_id), created_at))
+
+        count = 0
+        for entry in entries:
+            options = by_key.get((entry.sender_id, entry.description[len('Покупка '):]))
+            match = self.nearest(entry, options)
+            if match is not None:
+                entry.purchase_id, product_id = match
+                entry.metadata = {'product_id': product_id}
+                count += 1
+        return count
+
+    def link_awards(self, chunk):
+        """Связывает начисления наград с CoinAward того же ученика, учителя и причины"""
+        entries = [entry for entry in chunk if entry.kind == Transaction.KIND_AWARD]
+        if not entries:
+            return 0
+
+        candidates = (CoinAward.objects
+                      .filter(student_id__in={entry.receiver_id for entry in entries},
+                              created_at__gte=min(entry.created_at for entry in entries) - MATCH_WINDOW,
+                              created_at__lte=max(entry.created_at for entry in entries) + MATCH_WINDOW,
+                              ledger_entries__isnull=True)
+                      .values_list('id', 'student_id', 'teacher_id', 'reason_id', 'created_at'))
+        by_key = {}
+        for award_id, student_id, teacher_id, reason_id, created_at in candidates:
+            by_key.setdefault((student_id, teacher_id, reason_id), []).append((award_id, created_at))
+
+        count = 0
+        for entry in entries:
+            options = by_key.get((entry.receiver_id, entry.sender_id, entry.award_reason_id))
+            match = self.nearest(entry, options)
+            if match is not None:
+                entry.award_id = match
+                count += 1
+        return count
+
+    def nearest(self, entry, options):
+        """Забирает из options ближайший по времени объект в пределах MATCH_WINDOW"""
+        if not options:
+            return None
+        best = min(options, key=lambda option: abs(option[1] - entry.created_at))
+        if abs(best[1] - entry.created_at) > MATCH_WINDOW:
+            return None
+        options.remove(best)
+        return best[0]
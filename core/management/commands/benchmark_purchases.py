@@ -0,0 +1,160 @@
+import multiprocessing
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+from django.db.models import Sum
+from core import ledger
+from core.models import City, Product, ProductCategory, Profile, Purchase, Transaction, User
+from core.purchases import OutOfStock, PriceChanged, buy_product
+
+USERNAME_PREFIX = 'bench_buyer_'
+BENCH_NAME = 'bench_flash_sale'
+
+
+def _buy_locking(user, product_id):
+    """Прежний путь покупки: блокировка строки товара на всю транзакцию (для сравнения)"""
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(id=product_id, available=True)
+        if product.stock <= 0:
+            raise OutOfStock(f'Товар {product_id} закончился')
+        order = Purchase.objects.create(user=user, product=product, total_price=product.price)
+        ledger.debit(user, product.price, kind=Transaction.KIND_PURCHASE, description=f'Покупка {product.name}',
+                     purchase=order, metadata={'product_id': product.id})
+        product.stock -= 1
+        product.save()
+
+
+def _worker(user_id, product_id, attempts, locking, start, results):
+    """Один покупатель со своим соединением: ждёт общего старта и пытается купить attempts раз"""
+    connections.close_all()
+    user = User.objects.get(id=user_id)
+    product = Product.objects.get(id=product_id)
+    start.wait()
+
+    bought = sold_out = failed = 0
+    latencies = []
+    for _ in range(attempts):
+        began = time.perf_counter()
+        try:
+            if locking:
+                _buy_locking(user, product_id)
+            else:
+                buy_product(user, product)
+            bought += 1
+        except (OutOfStock, PriceChanged):
+            sold_out += 1
+        except Exception:
+            failed += 1
+        latencies.append(time.perf_counter() - began)
+
+    connections.close_all()
+    results.put({'bought': bought, 'sold_out': sold_out, 'failed': failed, 'latencies': latencies})
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест распродажи: N покупателей в отдельных процессах одновременно покупают '
+            'один товар с малым остатком. Показывает покупок и попыток в секунду, задержки и '
+            'проверяет, что продано не больше остатка и списано ровно за проданное. '
+            'С --locking измеряет прежний путь с select_for_update. '
+            'Создаёт и затем удаляет пользователей bench_buyer_* и товар; запускать на отдельной базе')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=20, help='Сколько покупателей (процессов)')
+        parser.add_argument('--attempts', type=int, default=20, help='Сколько попыток покупки у каждого')
+        parser.add_argument('--stock', type=int, default=1, help='Остаток товара перед распродажей')
+        parser.add_argument('--price', type=int, default=10, help='Цена товара')
+        parser.add_argument('--locking', action='store_true', help='Покупать прежним путём с блокировкой товара')
+        parser.add_argument('--keep', action='store_true', help='Не удалять тестовые данные после замера')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.ERROR('Бенчмарк рассчитан на PostgreSQL'))
+            return
+
+        user_ids, product = self.create_data(options)
+        try:
+            self.run(user_ids, product, options)
+        finally:
+            if not options['keep']:
+                User.objects.filter(id__in=user_ids).delete()
+                City.objects.filter(name=BENCH_NAME).delete()
+                self.stdout.write('🧹 Тестовые данные удалены')
+
+    def create_data(self, options):
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        City.objects.filter(name=BENCH_NAME).delete()
+
+        city = City.objects.create(name=BENCH_NAME)
+        category = ProductCategory.objects.create(name=BENCH_NAME, slug=BENCH_NAME, city=city)
+        product = Product.objects.create(name=BENCH_NAME, description='Товар распродажи', price=options['price'],
+                                         stock=options['stock'], category=category, city=city)
+
+        users = User.objects.bulk_create(
+            [User(username=f'{USERNAME_PREFIX}{i}', role='student', city=city) for i in range(options['buyers'])]
+        )
+        # Денег хватает на все попытки: отказы возможны только из-за остатка
+        balance = options['price'] * options['attempts']
+        Profile.objects.bulk_create([Profile(user=user, astrocoins=balance) for user in users])
+        self.stdout.write(f'👥 Создано {len(users)} покупателей, товар с остатком {options["stock"]} '
+                          f'по {options["price"]} AC')
+        return [user.pk for user in users], product
+
+    def run(self, user_ids, product, options):
+        balances = Profile.objects.filter(user_id__in=user_ids)
+        total_before = balances.aggregate(total=Sum('astrocoins'))['total']
+
+        # Дочерние процессы не должны делить соединение родителя
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        start = context.Event()
+        processes = [
+            context.Process(target=_worker,
+                            args=(user_id, product.id, options['attempts'], options['locking'], start, results))
+            for user_id in user_ids
+        ]
+        for process in processes:
+            process.start()
+        # Даём процессам подключиться к базе, чтобы все начали одновременно
+        time.sleep(1)
+
+        mode = 'с блокировкой товара' if options['locking'] else 'условным UPDATE'
+        self.stdout.write(f'🚀 {len(processes)} покупателей × {options["attempts"]} попыток ({mode})...')
+        started = time.perf_counter()
+        start.set()
+        stats = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        bought = sum(item['bought'] for item in stats)
+        sold_out = sum(item['sold_out'] for item in stats)
+        failed = sum(item['failed'] for item in stats)
+        latencies = sorted(latency for item in stats for latency in item['latencies'])
+        attempts = len(latencies)
+
+        product.refresh_from_db()
+        purchases = Purchase.objects.filter(product=product).count()
+        spent = total_before - balances.aggregate(total=Sum('astrocoins'))['total']
+        debited = -(Transaction.objects.filter(purchase__product=product, account_id__in=user_ids)
+                    .aggregate(total=Sum('delta'))['total'] or 0)
+
+        self.stdout.write(f'\n📊 Попыток: {attempts} за {elapsed:.2f} с — {attempts / elapsed:.0f} попыток/с, '
+                          f'куплено {bought}, отказов «нет в наличии» {sold_out}, ошибок {failed}')
+        self.stdout.write(f'   задержка попытки: медиана {statistics.median(latencies) * 1000:.1f} мс, '
+                          f'95% {latencies[int(attempts * 0.95) - 1] * 1000:.1f} мс, '
+                          f'макс {latencies[-1] * 1000:.1f} мс')
+        self.stdout.write(f'   остаток: {options["stock"]} → {product.stock}, покупок {purchases}, '
+                          f'списано {spent} AC, по журналу {debited} AC')
+
+        expected_sold = min(options['stock'], attempts)
+        if (bought == purchases == expected_sold and product.stock == options['stock'] - bought
+                and spent == debited == bought * options['price'] and not failed):
+            self.stdout.write(self.style.SUCCESS('✅ Перепродажи нет: продано ровно по остатку, списано ровно за проданное'))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'❌ Расхождение: ожидалось продать {expected_sold}, продано {bought}, покупок {purchases}, '
+                f'остаток {product.stock}, списано {spent} AC, ошибок {failed}'
+            ))
@@ -0,0 +1,102 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from core.models import Transaction, User
+
+
+class Command(BaseCommand):
+    help = ('Замеряет скорость ленты транзакций на дашборде на синтетических данных: '
+            'старый запрос с OR без составных индексов против UNION ALL с индексами. '
+            'Все данные создаются в транзакции и откатываются; запускать на отдельной базе (PostgreSQL)')
+
+    FEED_INDEXES = ['transaction_sender_idx', 'transaction_receiver_idx', 'transaction_type_idx']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Сколько транзакций сгенерировать')
+        parser.add_argument('--users', type=int, default=5000, help='Сколько синтетических пользователей')
+        parser.add_argument('--samples', type=int, default=200, help='Сколько лент загрузить в каждом замере')
+        parser.add_argument('--limit', type=int, default=15, help='Размер ленты (как на дашборде)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.ERROR('Бенчмарк рассчитан на PostgreSQL'))
+            return
+
+        with transaction.atomic():
+            users = self.create_users(options['users'])
+            self.generate_transactions(users, options['rows'])
+
+            sample = [random.choice(users) for _ in range(options['samples'])]
+            limit = options['limit']
+
+            # «До»: запрос с OR и только индексы внешних ключей. Индексы удаляются
+            # внутри savepoint и возвращаются его откатом
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for name in self.FEED_INDEXES:
+                        cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+                before = self.measure(lambda user: list(self.or_feed(user, limit)), sample)
+                transaction.set_rollback(True)
+
+            after = self.measure(lambda user: list(Transaction.objects.feed(user, limit)), sample)
+
+            self.report(options['rows'], before, after)
+            transaction.set_rollback(True)
+
+    def create_users(self, count):
+        self.stdout.write(f'👥 Создаём {count} пользователей...')
+        users = User.objects.bulk_create(
+            [User(username=f'bench_feed_{i}', role='student') for i in range(count)],
+            batch_size=1000
+        )
+        return users
+
+    def generate_transactions(self, users, rows):
+        self.stdout.write(f'🧾 Генерируем {rows} транзакций...')
+        started = time.perf_counter()
+        table = connection.ops.quote_name(Transaction._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                INSERT INTO {table} (sender_id, receiver_id, amount, transaction_type, description, created_at)
+                SELECT ids[1 + floor(random() * %s)::int],
+                       ids[1 + floor(random() * %s)::int],
+                       1 + floor(random() * 100)::int,
+                       (ARRAY['EARN', 'SPEND', 'TRANSFER'])[1 + floor(random() * 3)::int],
+                       'benchmark',
+                       now() - random() * interval '365 days'
+                FROM generate_series(1, %s), (SELECT %s::bigint[] AS ids) AS u
+                ''',
+                [len(users), len(users), rows, [user.pk for user in users]]
+            )
+            cursor.execute(f'ANALYZE {table}')
+        self.stdout.write(f'   готово за {time.perf_counter() - started:.1f} с')
+
+    def or_feed(self, user, limit):
+        # Запрос, который дашборд выполнял раньше
+        return Transaction.objects.filter(
+            Q(sender=user) | Q(receiver=user)
+        ).select_related('sender', 'receiver').order_by('-created_at')[:limit]
+
+    def measure(self, load_feed, sample):
+        timings = []
+        for user in sample:
+            started = time.perf_counter()
+            load_feed(user)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return {
+            'median': statistics.median(timings),
+            'p95': timings[int(len(timings) * 0.95) - 1],
+        }
+
+    def report(self, rows, before, after):
+        self.stdout.write(f'\n📊 Лента дашборда, {rows} транзакций:')
+        self.stdout.write(f"   до (OR, индексы FK):       медиана {before['median']:.2f} мс, p95 {before['p95']:.2f} мс")
+        self.stdout.write(f"   после (UNION ALL, индексы): медиана {after['median']:.2f} мс, p95 {after['p95']:.2f} мс")
+        if after['median']:
+            self.stdout.write(self.style.SUCCESS(f"   ускорение по медиане: x{before['median'] / after['median']:.1f}"))
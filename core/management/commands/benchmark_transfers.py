@@ -0,0 +1,133 @@
+import logging
+import multiprocessing
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.models import Sum
+from core import ledger
+from core.models import Profile, Transaction, User
+
+USERNAME_PREFIX = 'bench_transfer_'
+
+
+class _CountingHandler(logging.Handler):
+    """Считает предупреждения журнала о повторах перевода"""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+def _worker(user_ids, transfers, seed, results):
+    """Процесс нагрузки: случайные переводы между пользователями со своим соединением с БД"""
+    connections.close_all()
+    rng = random.Random(seed)
+    retries = _CountingHandler()
+    logging.getLogger(ledger.__name__).addHandler(retries)
+
+    users = list(User.objects.filter(id__in=user_ids))
+    done = insufficient = failed = 0
+    for _ in range(transfers):
+        sender, receiver = rng.sample(users, 2)
+        amount = rng.randint(20, 200)
+        try:
+            ledger.transfer(sender, receiver, amount, commission=int(amount * 0.05))
+            done += 1
+        except ledger.InsufficientFunds:
+            insufficient += 1
+        except Exception:
+            failed += 1
+
+    connections.close_all()
+    results.put({'done': done, 'insufficient': insufficient, 'failed': failed, 'retries': retries.count})
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест переводов: несколько процессов одновременно переводят монеты '
+            'между небольшим числом пользователей (встречные переводы неизбежны). Показывает '
+            'переводов в секунду и проверяет, что сумма балансов уменьшилась ровно на комиссию. '
+            'Создаёт и затем удаляет пользователей bench_transfer_*; запускать на отдельной базе')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Сколько параллельных процессов')
+        parser.add_argument('--users', type=int, default=10, help='Сколько пользователей участвуют в переводах')
+        parser.add_argument('--transfers', type=int, default=500, help='Сколько переводов делает каждый процесс')
+        parser.add_argument('--balance', type=int, default=10_000, help='Начальный баланс каждого пользователя')
+        parser.add_argument('--keep', action='store_true', help='Не удалять тестовых пользователей после замера')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.ERROR('Бенчмарк рассчитан на PostgreSQL'))
+            return
+
+        user_ids = self.create_users(options['users'], options['balance'])
+        try:
+            self.run(user_ids, options)
+        finally:
+            if not options['keep']:
+                User.objects.filter(id__in=user_ids).delete()
+                self.stdout.write('🧹 Тестовые пользователи удалены')
+
+    def create_users(self, count, balance):
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        users = User.objects.bulk_create(
+            [User(username=f'{USERNAME_PREFIX}{i}', role='student') for i in range(count)]
+        )
+        # Профили создаются напрямую: bulk_create не вызывает сигнал создания профиля
+        Profile.objects.bulk_create([Profile(user=user, astrocoins=balance) for user in users])
+        self.stdout.write(f'👥 Создано {count} пользователей с балансом {balance} AC')
+        return [user.pk for user in users]
+
+    def run(self, user_ids, options):
+        workers = options['workers']
+        balances = Profile.objects.filter(user_id__in=user_ids)
+        total_before = balances.aggregate(total=Sum('astrocoins'))['total']
+        last_entry = Transaction.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+        # Дочерние процессы не должны делить соединение родителя
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [
+            context.Process(target=_worker, args=(user_ids, options['transfers'], seed, results))
+            for seed in range(workers)
+        ]
+
+        self.stdout.write(f'🚀 {workers} процессов × {options["transfers"]} переводов...')
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        stats = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        done = sum(item['done'] for item in stats)
+        insufficient = sum(item['insufficient'] for item in stats)
+        failed = sum(item['failed'] for item in stats)
+        retries = sum(item['retries'] for item in stats)
+
+        total_after = balances.aggregate(total=Sum('astrocoins'))['total']
+        entries = Transaction.objects.filter(id__gt=last_entry, account_id__in=user_ids)
+        commission = entries.filter(kind=Transaction.KIND_TRANSFER_OUT).aggregate(
+            total=Sum('amount')
+        )['total'] or 0
+        commission -= entries.filter(kind=Transaction.KIND_TRANSFER_IN).aggregate(total=Sum('amount'))['total'] or 0
+        journal_delta = entries.aggregate(total=Sum('delta'))['total'] or 0
+
+        self.stdout.write(f'\n📊 Переводов: {done} за {elapsed:.2f} с — {done / elapsed:.0f} переводов/с')
+        self.stdout.write(f'   отказов из-за баланса: {insufficient}, ошибок: {failed}, повторов после конфликта: {retries}')
+        self.stdout.write(f'   сумма балансов: {total_before} → {total_after}, удержано комиссии: {commission}')
+
+        if total_before - commission == total_after and journal_delta == total_after - total_before and not failed:
+            self.stdout.write(self.style.SUCCESS('✅ Монеты сохранены: балансы сходятся с журналом и комиссией'))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'❌ Расхождение: ожидалось {total_before - commission}, получено {total_after}, '
+                f'по журналу изменение {journal_delta}, ошибок {failed}'
+            ))
@@ -0,0 +1,36 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core import recommendations
+from core.models import City
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рекомендации магазина по покупкам каждого города: «Популярное» и '
+            '«С этим также покупают» (top-k соседей товара по совместным покупкам). '
+            'Запускать раз в сутки, например из cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=recommendations.TOP_K,
+                            help='Сколько соседей хранить для товара')
+        parser.add_argument('--min-common', type=int, default=recommendations.MIN_COMMON,
+                            help='Минимум учеников, купивших оба товара')
+        parser.add_argument('--days', type=int, default=0,
+                            help='Учитывать покупки только за последние N дней (0 — все)')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days']) if options['days'] else None
+        started = time.perf_counter()
+        stats = recommendations.rebuild(top=options['top'], min_common=options['min_common'], since=since)
+        elapsed = time.perf_counter() - started
+
+        cities = dict(City.objects.filter(id__in=[city_id for city_id in stats if city_id]).values_list('id', 'name'))
+        for city_id, (pairs, products) in sorted(stats.items(), key=lambda item: item[0] or 0):
+            self.stdout.write(f'   🏙️ {cities.get(city_id, "Без города")}: пар «ученик — товар» {pairs}, '
+                              f'товаров с рекомендациями {products}')
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Рекомендации пересчитаны за {elapsed:.2f} с: '
+            f'{sum(products for _, products in stats.values())} товаров'
+        ))
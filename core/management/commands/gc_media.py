@@ -0,0 +1,109 @@
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core import catalog
+from core.models import Product
+from core.storage import BLOBS_DIR, product_images
+
+LEGACY_DIR = 'products'
+
+
+def _walk(storage, path):
+    """Все файлы каталога хранилища рекурсивно"""
+    if not storage.exists(path):
+        return
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield f'{path}/{name}'
+    for directory in directories:
+        yield from _walk(storage, f'{path}/{directory}')
+
+
+class Command(BaseCommand):
+    help = ('Удаляет изображения товаров, на которые не ссылается ни один Product.image. '
+            'С --adopt сначала переносит старые файлы products/* в хранилище по содержимому '
+            '(одинаковые картинки схлопываются в один файл) и удаляет прежние копии')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--adopt', action='store_true', help='Перенести старые файлы products/* в products/blobs')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет удалено')
+        parser.add_argument('--grace-hours', type=int, default=24,
+                            help='Не трогать файлы моложе N часов (загрузки, ещё не сохранённые в товаре)')
+
+    def handle(self, *args, **options):
+        storage = product_images
+        dry_run = options['dry_run']
+
+        if options['adopt']:
+            self.adopt(storage, dry_run)
+
+        referenced = set(Product.objects.exclude(image='').exclude(image__isnull=True)
+                         .values_list('image', flat=True))
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+
+        candidates = list(_walk(storage, BLOBS_DIR))
+        if options['adopt']:
+            # После переноса файлы прежней раскладки (кроме копий core.images) больше не нужны
+            _, legacy_files = storage.listdir(LEGACY_DIR) if storage.exists(LEGACY_DIR) else ([], [])
+            candidates += [f'{LEGACY_DIR}/{name}' for name in legacy_files]
+
+        kept = kept_bytes = removed = removed_bytes = 0
+        for name in candidates:
+            size = storage.size(name)
+            if name in referenced or storage.get_modified_time(name) > cutoff:
+                kept += 1
+                kept_bytes += size
+                continue
+            removed += 1
+            removed_bytes += size
+            if not dry_run:
+                storage.delete(name)
+
+        prefix = '🔍 Будет удалено' if dry_run else '🗑️ Удалено'
+        self.stdout.write(f'{prefix}: {removed} файлов, {removed_bytes / 1024 / 1024:.1f} МБ')
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ В хранилище: {kept} файлов, {kept_bytes / 1024 / 1024:.1f} МБ; '
+            f'ссылок из товаров: {len(referenced)}'
+        ))
+
+    def adopt(self, storage, dry_run):
+        """Переносит изображения товаров из прежней раскладки в хранилище по содержимому"""
+        products = (Product.objects.exclude(image='').exclude(image__isnull=True)
+                    .exclude(image__startswith=f'{BLOBS_DIR}/').order_by('id'))
+        adopted = missing = 0
+        blobs = set()
+        cities = set()
+        logical_bytes = 0
+        for product in products.iterator(chunk_size=200):
+            old_name = product.image.name
+            if not storage.exists(old_name):
+                missing += 1
+                self.stdout.write(self.style.WARNING(f'⚠️ {product.name}: нет файла {old_name}'))
+                continue
+            logical_bytes += storage.size(old_name)
+            if dry_run:
+                adopted += 1
+                continue
+            with storage.open(old_name, 'rb') as content:
+                new_name = storage.save(os.path.basename(old_name), content)
+            blobs.add(new_name)
+
+            # Содержимое то же, поэтому уменьшенные копии остаются действительными
+            variants = product.image_variants or {}
+            if variants.get('source') == old_name:
+                variants['source'] = new_name
+            Product.objects.filter(pk=product.pk).update(image=new_name, image_variants=variants)
+            cities.add(product.city_id)
+            adopted += 1
+
+        # Адреса картинок в закешированной сетке магазина изменились
+        for city_id in cities:
+            catalog.invalidate(city_id)
+
+        blob_bytes = sum(storage.size(name) for name in blobs)
+        self.stdout.write(f'📦 Перенесено изображений: {adopted}, без файла: {missing}')
+        if blobs:
+            self.stdout.write(f'   {logical_bytes / 1024 / 1024:.1f} МБ копий → {len(blobs)} уникальных файлов, '
+                              f'{blob_bytes / 1024 / 1024:.1f} МБ')
@@ -0,0 +1,44 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from core import catalog, images
+from core.models import Product
+
+
+class Command(BaseCommand):
+    help = ('Создаёт уменьшенные копии изображений товаров (WebP и JPEG нескольких ширин) '
+            'для товаров, у которых их ещё нет или оригинал изменился. '
+            'С --force пересоздаёт копии всех товаров')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Пересоздать копии для всех товаров')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image__isnull=True).order_by('id')
+        total = products.count()
+        self.stdout.write(f'🖼️ Товаров с изображениями: {total}')
+
+        processed = failed = 0
+        original_bytes = variant_bytes = 0
+        for product in products.iterator(chunk_size=100):
+            if not images.refresh_variants(product, force=options['force']):
+                continue
+            variants = product.image_variants
+            if not variants.get('webp'):
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'⚠️ {product.name}: не удалось обработать {product.image.name}'))
+                continue
+            processed += 1
+            catalog.invalidate(product.city_id)
+            # Для сравнения веса страницы: оригинал против самой узкой копии WebP
+            original_bytes += default_storage.size(product.image.name)
+            variant_bytes += default_storage.size(variants['webp'][0][1])
+            self.stdout.write(f'   ✓ {product.name}: {", ".join(str(width) for width, _ in variants["webp"])} px')
+
+        if processed:
+            self.stdout.write(
+                f'\n📉 Оригиналы: {original_bytes / 1024:.0f} КБ, '
+                f'копии {images.WIDTHS[0]} px (WebP): {variant_bytes / 1024:.0f} КБ'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Обработано: {processed}, без изменений: {total - processed - failed}, ошибок: {failed}'
+        ))
@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from core import gifts
+
+
+class Command(BaseCommand):
+    help = ('Начисляет подарок на день рождения всем сегодняшним именинникам-ученикам. '
+            'Запускать по расписанию (например, cron в 00:05); повторный запуск в тот же день '
+            'безопасен и доначисляет только тем, кто ещё не получил подарок')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Дата в формате ГГГГ-ММ-ДД (по умолчанию — сегодня)')
+        parser.add_argument('--amount', type=int, default=gifts.BIRTHDAY_GIFT_AMOUNT,
+                            help='Размер подарка в астрокоинах')
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            try:
+                today = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Дата должна быть в формате ГГГГ-ММ-ДД')
+
+        granted = gifts.grant_birthday_gifts(today, amount=options['amount'])
+        if granted:
+            self.stdout.write(self.style.SUCCESS(f"🎉 Подарки выданы: {len(granted)}"))
+            for user in granted:
+                self.stdout.write(f"   🎂 {user.get_full_name_with_middle()} ({user.username})")
+        else:
+            self.stdout.write("Новых именинников без подарка нет")
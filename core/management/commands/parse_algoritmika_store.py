@@ -3,7 +3,9 @@ from bs4 import BeautifulSoup
 import re
 from django.core.management.base import BaseCommand
 from django.core.files.base import ContentFile
+from core.http_cache import CachedSession, DEFAULT_CACHE_DIR
 from core.models import Product, ProductCategory
+from core.slugs import slugs_for_new
 from django.utils.text import slugify
 import time
 import random
@@ -22,9 +24,23 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be imported without actually creating products',
         )
+        parser.add_argument(
+            '--replay',
+            action='store_true',
+            help='Use recorded responses from the HTTP cache only, without network access',
+        )
+        parser.add_argument(
+            '--cache-dir',
+            default=DEFAULT_CACHE_DIR,
+            help=f'HTTP response cache directory (default: {DEFAULT_CACHE_DIR})',
+        )
 
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Starting to parse Algoritmika store...'))
+        # Страница магазина и картинки идут через кеш с перепроверкой по ETag
+        self.session = CachedSession(options['cache_dir'], replay=options['replay'])
+        if options['replay']:
+            self.stdout.write(self.style.WARNING(f"📼 Replay mode: responses from {options['cache_dir']}"))
         
         # Создаем основные категории, если их нет
         self.create_categories()
@@ -39,6 +55,11 @@ class Command(BaseCommand):
         else:
             self.create_products(products)
         
+        stats = self.session.stats
+        self.stdout.write(
+            f"🌐 HTTP: {stats['network']} downloaded, {stats['not_modified']} not modified, "
+            f"{stats['replayed']} replayed"
+        )
         self.stdout.write(self.style.SUCCESS('Parsing completed!'))
 
     def create_categories(self):
@@ -62,10 +83,11 @@ class Command(BaseCommand):
             {'name': 'Значки и бейджи', 'description': 'Значки и школьные бейджи'},
         ]
         
+        slugs = slugs_for_new(ProductCategory, [cat_data['name'] for cat_data in categories])
         for cat_data in categories:
             category, created = ProductCategory.objects.get_or_create(
                 name=cat_data['name'],
-                defaults={'description': cat_data['description']}
+                defaults={'description': cat_data['description'], 'slug': slugs.get(cat_data['name'], '')}
             )
             if created:
                 self.stdout.write(f"Created category: {category.name}")
@@ -82,7 +104,7 @@ class Command(BaseCommand):
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
             }
-            response = requests.get(base_url, headers=headers, timeout=30)
+            response = self.session.get(base_url, headers=headers, timeout=30)
             response.raise_for_status()
             
             soup = BeautifulSoup(response.content, 'html.parser')
@@ -340,7 +362,7 @@ class Command(BaseCommand):
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             }
-            response = requests.get(image_url, headers=headers, timeout=30)
+            response = self.session.get(image_url, headers=headers, timeout=30)
             response.raise_for_status()
             
             # Получаем расширение файла
@@ -709,6 +731,8 @@ class Command(BaseCommand):
         """Создаем товары в базе данных"""
         created_count = 0
         updated_count = 0
+        # Slug новым товарам выдаём сразу всей пачке
+        slugs = slugs_for_new(Product, [product_data['name'] for product_data in products])
         
         for product_data in products:
             try:
@@ -719,6 +743,7 @@ class Command(BaseCommand):
                 product, created = Product.objects.get_or_create(
                     name=product_data['name'],
                     defaults={
+                        'slug': slugs.get(product_data['name'], ''),
                         'description': product_data['description'],
                         'price': product_data['price'],
                         'stock': product_data['stock'],
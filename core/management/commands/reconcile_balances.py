@@ -0,0 +1,98 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from core import ledger
+from core.models import City, Profile
+
+
+def _reconcile_city(city_id, chunk_size):
+    """
+    Сверяет профили пользователей одного города (None — без города).
+    Пользователи читаются серверным курсором пачками по chunk_size; на каждую
+    пачку — один сгруппированный запрос. Возвращает (город, проверено, расхождения).
+    """
+    connections.close_all()
+    if city_id is None:
+        profiles = Profile.objects.filter(user__city__isnull=True)
+    else:
+        profiles = Profile.objects.filter(user__city_id=city_id)
+    user_ids = profiles.order_by('user_id').values_list('user_id', flat=True).iterator(chunk_size=chunk_size)
+
+    checked = 0
+    drifts = []
+    chunk = []
+    for user_id in user_ids:
+        chunk.append(user_id)
+        if len(chunk) >= chunk_size:
+            checked += _check_chunk(chunk, drifts)
+            chunk = []
+    if chunk:
+        checked += _check_chunk(chunk, drifts)
+
+    connections.close_all()
+    return city_id, checked, drifts
+
+
+def _check_chunk(user_ids, drifts):
+    for user_id, (actual, expected) in ledger.reconcile(user_ids).items():
+        if actual != expected:
+            drifts.append((user_id, actual, expected))
+    return len(user_ids)
+
+
+class Command(BaseCommand):
+    help = ('Сверяет балансы в профилях с журналом транзакций (последний снимок + записи после него) '
+            'и печатает отчёт о расхождениях. Работа делится между процессами по городам. '
+            'С --fix расхождения записываются в журнал корректирующими записями')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Сколько пользователей сверять одним запросом')
+        parser.add_argument('--workers', type=int, default=min(4, multiprocessing.cpu_count()),
+                            help='Сколько процессов использовать')
+        parser.add_argument('--fix', action='store_true', help='Записать расхождения в журнал')
+        parser.add_argument('--limit', type=int, default=50, help='Сколько расхождений показать в отчёте')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        city_ids = list(City.objects.order_by('id').values_list('id', flat=True)) + [None]
+        city_names = dict(City.objects.values_list('id', 'name'))
+
+        # Дочерние процессы не должны делить соединение родителя
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context) as pool:
+            results = list(pool.map(_reconcile_city, city_ids, [options['chunk_size']] * len(city_ids)))
+
+        checked = sum(result[1] for result in results)
+        drifts = []
+        for city_id, city_checked, city_drifts in results:
+            if city_drifts:
+                name = city_names.get(city_id, 'без города')
+                self.stdout.write(f'🏙️ {name}: проверено {city_checked}, расхождений {len(city_drifts)}')
+            drifts.extend(city_drifts)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f'\n📊 Проверено профилей: {checked} за {elapsed:.2f} с')
+        if not drifts:
+            self.stdout.write(self.style.SUCCESS('✅ Все балансы совпадают с журналом'))
+            return
+
+        drifts.sort(key=lambda item: abs(item[1] - item[2]), reverse=True)
+        total = sum(actual - expected for _, actual, expected in drifts)
+        self.stdout.write(self.style.WARNING(
+            f'⚠️ Расхождений: {len(drifts)}, суммарно {total:+d} AC (профиль минус журнал)'
+        ))
+        for user_id, actual, expected in drifts[:options['limit']]:
+            self.stdout.write(f'   user_id={user_id}: в профиле {actual}, по журналу {expected} ({actual - expected:+d})')
+
+        if options['fix']:
+            fixed = 0
+            for user_id, _, _ in drifts:
+                if ledger.correct_drift(user_id):
+                    fixed += 1
+            self.stdout.write(self.style.SUCCESS(f'✅ Записано корректирующих записей: {fixed}'))
+        else:
+            self.stdout.write('Запустите с --fix, чтобы записать расхождения в журнал')
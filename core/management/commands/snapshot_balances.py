@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from core import ledger
+
+
+class Command(BaseCommand):
+    help = 'Сохраняет снимки балансов по журналу транзакций (запускать по расписанию, например раз в сутки)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Размер пачки при записи снимков')
+
+    def handle(self, *args, **options):
+        created = ledger.take_snapshots(chunk_size=options['chunk_size'])
+        if created:
+            self.stdout.write(self.style.SUCCESS(f"✅ Создано снимков балансов: {created}"))
+        else:
+            self.stdout.write("Новых записей в журнале нет, снимки не нужны")
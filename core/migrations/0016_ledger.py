@@ -0,0 +1,77 @@
+# Generated by Django 4.2.23 on 2026-10-18 01:19
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def seed_balance_snapshots(apps, schema_editor):
+    # Начальная точка журнала: текущие балансы всех профилей
+    Profile = apps.get_model('core', 'Profile')
+    Transaction = apps.get_model('core', 'Transaction')
+    BalanceSnapshot = apps.get_model('core', 'BalanceSnapshot')
+
+    last_entry_id = Transaction.objects.aggregate(last=models.Max('id'))['last'] or 0
+    now = django.utils.timezone.now()
+    batch = []
+    for user_id, balance in Profile.objects.values_list('user_id', 'astrocoins').iterator(chunk_size=1000):
+        batch.append(BalanceSnapshot(user_id=user_id, balance=balance, last_entry_id=last_entry_id, created_at=now))
+        if len(batch) >= 1000:
+            BalanceSnapshot.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        BalanceSnapshot.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_add_middle_name_field'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.IntegerField(verbose_name='Баланс')),
+                ('last_entry_id', models.BigIntegerField(default=0, verbose_name='Последняя учтённая запись журнала')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата снимка')),
+            ],
+            options={
+                'verbose_name': 'Снимок баланса',
+                'verbose_name_plural': 'Снимки балансов',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='account',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to=settings.AUTH_USER_MODEL, verbose_name='Счёт'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='balance_after',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Баланс после операции'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='delta',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Изменение баланса'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', 'created_at'], name='transaction_account_idx'),
+        ),
+        migrations.AddField(
+            model_name='balancesnapshot',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='balancesnapshot',
+            index=models.Index(fields=['user', 'created_at'], name='snapshot_user_idx'),
+        ),
+        migrations.RunPython(seed_balance_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-18 01:40
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индексы строятся CONCURRENTLY, чтобы не блокировать запись в большую таблицу
+    atomic = False
+
+    dependencies = [
+        ('core', '0016_ledger'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['sender', 'created_at'], name='transaction_sender_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['receiver', 'created_at'], name='transaction_receiver_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['transaction_type', 'created_at'], name='transaction_type_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.23 on 2026-10-18 03:10
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индекс строится CONCURRENTLY, чтобы не блокировать запись в таблицу покупок
+    atomic = False
+
+    dependencies = [
+        ('core', '0017_transaction_feed_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='purchase',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='purchase_user_idx'),
+        ),
+    ]
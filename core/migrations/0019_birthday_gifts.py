@@ -0,0 +1,67 @@
+# Generated by Django 4.2.23 on 2026-10-18 01:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.functions.datetime
+import django.utils.timezone
+
+
+def import_inline_birthday_gifts(apps, schema_editor):
+    # Подарки, выданные раньше прямо из дашборда, помечались текстом в описании.
+    # Переносим их в AnnualGift, чтобы пакетная выдача не начислила их повторно
+    Transaction = apps.get_model('core', 'Transaction')
+    AnnualGift = apps.get_model('core', 'AnnualGift')
+
+    seen = set()
+    gifts = []
+    entries = (Transaction.objects
+               .filter(transaction_type='EARN', description__contains='BIRTHDAY_GIFT')
+               .values_list('receiver_id', 'amount', 'created_at')
+               .order_by('created_at'))
+    for user_id, amount, created_at in entries.iterator(chunk_size=1000):
+        key = (user_id, created_at.year)
+        if key in seen:
+            continue
+        seen.add(key)
+        gifts.append(AnnualGift(user_id=user_id, kind='BIRTHDAY', year=created_at.year,
+                                amount=amount, created_at=created_at))
+    AnnualGift.objects.bulk_create(gifts, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_purchase_user_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnnualGift',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('BIRTHDAY', 'День рождения')], max_length=20, verbose_name='Вид подарка')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Год')),
+                ('amount', models.PositiveIntegerField(verbose_name='Сумма')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата выдачи')),
+            ],
+            options={
+                'verbose_name': 'Ежегодный подарок',
+                'verbose_name_plural': 'Ежегодные подарки',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(django.db.models.functions.datetime.ExtractMonth('birth_date'), django.db.models.functions.datetime.ExtractDay('birth_date'), name='user_birthday_idx'),
+        ),
+        migrations.AddField(
+            model_name='annualgift',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='annual_gifts', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='annualgift',
+            constraint=models.UniqueConstraint(fields=('user', 'year', 'kind'), name='annual_gift_unique'),
+        ),
+        migrations.RunPython(import_inline_birthday_gifts, migrations.RunPython.noop),
+    ]
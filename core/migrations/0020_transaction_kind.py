@@ -0,0 +1,39 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_birthday_gifts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='award',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='core.coinaward', verbose_name='Награда'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='award_reason',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='core.awardreason', verbose_name='Причина награды'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='kind',
+            field=models.CharField(blank=True, choices=[('PURCHASE', 'Покупка'), ('AWARD', 'Награда'), ('AWARD_REVERSAL', 'Отмена награды'), ('BONUS', 'Начисление преподавателя'), ('BIRTHDAY_GIFT', 'Подарок на день рождения'), ('TRANSFER_OUT', 'Исходящий перевод'), ('TRANSFER_IN', 'Входящий перевод'), ('ADJUSTMENT', 'Корректировка баланса'), ('OTHER', 'Прочее')], max_length=20, verbose_name='Вид операции'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='metadata',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Данные операции'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='purchase',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='core.purchase', verbose_name='Покупка'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индексы строятся CONCURRENTLY, чтобы не блокировать запись в большую таблицу
+    atomic = False
+
+    dependencies = [
+        ('core', '0020_transaction_kind'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['kind', 'created_at'], name='transaction_kind_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('purchase__isnull', False)), fields=['purchase'], name='transaction_purchase_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('award__isnull', False)), fields=['award'], name='transaction_award_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('award_reason__isnull', False)), fields=['award_reason', 'created_at'], name='transaction_reason_idx'),
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 4.2.23 on 2026-10-18 03:40
+
+from datetime import date
+
+from django.db import migrations
+
+TABLE = 'core_transaction'
+OLD_TABLE = 'core_transaction_unpartitioned'
+# Секции заранее создаются на столько месяцев вперёд (дальше их создаёт archive_transactions)
+MONTHS_AHEAD = 3
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _swap_table(cursor, create_sql):
+    """
+    Пересоздаёт таблицу транзакций по create_sql и переносит в неё строки,
+    индексы и внешние ключи. Строки копируются одним INSERT ... SELECT,
+    поэтому миграцию нужно запускать в окно обслуживания.
+    """
+    cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s",
+                   [TABLE, f'{TABLE}_pkey'])
+    indexes = cursor.fetchall()
+    cursor.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                   "WHERE conrelid = %s::regclass AND contype = 'f'", [TABLE])
+    foreign_keys = cursor.fetchall()
+
+    cursor.execute(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE')
+    cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}')
+    # Имя первичного ключа освобождается для новой таблицы
+    cursor.execute(f'ALTER TABLE {OLD_TABLE} RENAME CONSTRAINT {TABLE}_pkey TO {OLD_TABLE}_pkey')
+    cursor.execute(create_sql)
+    cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {OLD_TABLE}')
+    cursor.execute(f'DROP TABLE {OLD_TABLE}')
+
+    for name, definition in indexes:
+        cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}')
+    cursor.execute(f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}")
+    cursor.execute(f'ANALYZE {TABLE}')
+
+
+def partition_transactions(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN(created_at) FROM {TABLE}')
+        first = cursor.fetchone()[0]
+        today = date.today()
+        month = date(first.year, first.month, 1) if first else date(today.year, today.month, 1)
+        last = _add_months(date(today.year, today.month, 1), MONTHS_AHEAD)
+
+        statements = [
+            f'CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS) '
+            f'PARTITION BY RANGE (created_at)',
+            # Ключ секционирования обязан входить в первичный ключ
+            f'ALTER TABLE {TABLE} ADD PRIMARY KEY (id, created_at)',
+        ]
+        while month <= last:
+            following = _add_months(month, 1)
+            statements.append(
+                f"CREATE TABLE {TABLE}_p{month:%Y%m} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')"
+            )
+            month = following
+        # Страховка для строк вне созданных месяцев; в норме остаётся пустой
+        statements.append(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+
+        _swap_table(cursor, '; '.join(statements))
+
+
+def unpartition_transactions(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        _swap_table(cursor, (
+            f'CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS); '
+            f'ALTER TABLE {TABLE} ADD PRIMARY KEY (id)'
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_transaction_kind_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_transactions, unpartition_transactions),
+    ]
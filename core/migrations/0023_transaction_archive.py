@@ -0,0 +1,31 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:08
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_partition_transactions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True, verbose_name='Месяц')),
+                ('row_count', models.PositiveIntegerField(verbose_name='Записей')),
+                ('first_id', models.BigIntegerField(verbose_name='Первая запись')),
+                ('last_id', models.BigIntegerField(verbose_name='Последняя запись')),
+                ('payload', models.BinaryField(verbose_name='Сжатые записи')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата архивации')),
+            ],
+            options={
+                'verbose_name': 'Архив транзакций',
+                'verbose_name_plural': 'Архивы транзакций',
+                'ordering': ['-month'],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:17
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+def _fold(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def index_products(apps, schema_editor):
+    # То же, что core.search.index_products, но без зависимости от текущих моделей
+    schema_editor.execute(
+        f"""
+        UPDATE core_product p SET search_vector =
+            setweight(to_tsvector('russian', {_fold('p.name')}), 'A')
+            || setweight(to_tsvector('russian', COALESCE(
+                (SELECT {_fold('c.name')} FROM core_productcategory c WHERE c.id = p.category_id), '')), 'B')
+            || setweight(to_tsvector('russian', {_fold('p.description')}), 'C')
+        """
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_product_image_variants'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(index_products, migrations.RunPython.noop),
+    ]
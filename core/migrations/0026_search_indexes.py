@@ -0,0 +1,33 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:18
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Индексы строятся CONCURRENTLY, чтобы не блокировать запись в таблицы пользователей и товаров
+    atomic = False
+
+    dependencies = [
+        ('core', '0025_product_search'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='parent',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['full_name'], name='parent_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='product_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['last_name', 'first_name', 'username'], name='user_name_trgm_idx', opclasses=['gin_trgm_ops', 'gin_trgm_ops', 'gin_trgm_ops']),
+        ),
+    ]
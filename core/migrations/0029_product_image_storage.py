@@ -0,0 +1,20 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:45
+
+import core.storage
+import core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_product_recommendation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.get_product_image_storage, upload_to='products/', validators=[core.validators.validate_file_type, core.validators.validate_file_size]),
+        ),
+    ]
@@ -1,8 +1,14 @@
-from django.db import models
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models.functions import ExtractDay, ExtractMonth
 from django.contrib.auth.models import AbstractUser, UserManager
 from django.utils import timezone
 from django.utils.text import slugify
+from .storage import get_product_image_storage
 from .validators import validate_file_type, validate_file_size
+from datetime import timedelta
 import uuid
 import re
 
@@ -23,29 +29,23 @@ class CaseInsensitiveUserManager(UserManager):
             pass
         return None
 
+# Таблица транслитерации кириллицы для str.translate
+CYRILLIC_TO_LATIN = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+    'А': 'A', 'Б': 'B', 'В': 'V', 'Г': 'G', 'Д': 'D', 'Е': 'E', 'Ё': 'YO',
+    'Ж': 'ZH', 'З': 'Z', 'И': 'I', 'Й': 'Y', 'К': 'K', 'Л': 'L', 'М': 'M',
+    'Н': 'N', 'О': 'O', 'П': 'P', 'Р': 'R', 'С': 'S', 'Т': 'T', 'У': 'U',
+    'Ф': 'F', 'Х': 'H', 'Ц': 'TS', 'Ч': 'CH', 'Ш': 'SH', 'Щ': 'SCH',
+    'Ъ': '', 'Ы': 'Y', 'Ь': '', 'Э': 'E', 'Ю': 'YU', 'Я': 'YA'
+})
+
 def create_cyrillic_slug(text):
     """Создает slug с поддержкой кириллицы"""
-    # Словарь для транслитерации кириллицы
-    cyrillic_to_latin = {
-        'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
-        'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
-        'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
-        'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
-        'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
-        'А': 'A', 'Б': 'B', 'В': 'V', 'Г': 'G', 'Д': 'D', 'Е': 'E', 'Ё': 'YO',
-        'Ж': 'ZH', 'З': 'Z', 'И': 'I', 'Й': 'Y', 'К': 'K', 'Л': 'L', 'М': 'M',
-        'Н': 'N', 'О': 'O', 'П': 'P', 'Р': 'R', 'С': 'S', 'Т': 'T', 'У': 'U',
-        'Ф': 'F', 'Х': 'H', 'Ц': 'TS', 'Ч': 'CH', 'Ш': 'SH', 'Щ': 'SCH',
-        'Ъ': '', 'Ы': 'Y', 'Ь': '', 'Э': 'E', 'Ю': 'YU', 'Я': 'YA'
-    }
-    
-    # Транслитерируем кириллицу
-    transliterated = ''
-    for char in text:
-        if char in cyrillic_to_latin:
-            transliterated += cyrillic_to_latin[char]
-        else:
-            transliterated += char
+    transliterated = text.translate(CYRILLIC_TO_LATIN)
     
     # Применяем стандартный slugify к транслитерированному тексту
     slug = slugify(transliterated)
@@ -73,6 +73,9 @@ class Parent(models.Model):
         verbose_name = 'Родитель'
         verbose_name_plural = 'Родители'
         ordering = ['full_name']
+        indexes = [
+            GinIndex(fields=['full_name'], opclasses=['gin_trgm_ops'], name='parent_name_trgm_idx'),
+        ]
 
     def __str__(self):
         return self.full_name
@@ -114,6 +117,15 @@ class User(AbstractUser):
     parent = models.ForeignKey('Parent', on_delete=models.SET_NULL, null=True, blank=True, 
                               related_name='students', verbose_name='Родитель')
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Поиск именинников дня по (месяц, день) без просмотра всей таблицы
+            models.Index(ExtractMonth('birth_date'), ExtractDay('birth_date'), name='user_birthday_idx'),
+            # Поиск учеников по фамилии, имени и логину (core.search)
+            GinIndex(fields=['last_name', 'first_name', 'username'], opclasses=['gin_trgm_ops'] * 3,
+                     name='user_name_trgm_idx'),
+        ]
+
     def is_teacher(self):
         return self.role == 'teacher' or self.role == 'city_admin'
     
@@ -179,6 +191,62 @@ class Profile(models.Model):
     def __str__(self):
         return f"{self.user.username}'s profile"
 
+class TransactionQuerySet(models.QuerySet):
+    """Запросы к истории транзакций"""
+
+    # Таблица секционирована по месяцам (core.partitions). Условие на created_at
+    # позволяет планировщику читать только свежие секции
+    HOT_PERIOD = timedelta(days=180)
+
+    def recent(self):
+        """
+        Только транзакции за HOT_PERIOD. Граница — начало местных суток: условие
+        не меняется в течение дня, поэтому кешируются и оценки COUNT по нему
+        (core.pagination.estimate_count строит ключ из SQL с параметрами)
+        """
+        today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        return self.filter(created_at__gte=today - self.HOT_PERIOD)
+
+    def involving(self, user, limit=None, condition=None, ordering=('-created_at', '-id')):
+        """
+        Транзакции, где user отправитель или получатель.
+        Вместо OR по двум колонкам собирается UNION ALL двух веток, каждая из которых
+        идёт по своему индексу (sender, created_at) / (receiver, created_at).
+        С limit в каждую ветку попадают только limit первых записей в порядке ordering,
+        condition (например, условие курсора) тоже применяется внутри веток.
+        """
+        sent = self.filter(sender=user)
+        # Записи, где пользователь и отправитель и получатель, уже есть в первой ветке
+        received = self.filter(receiver=user).exclude(sender=user)
+        if condition is not None:
+            sent = sent.filter(condition)
+            received = received.filter(condition)
+        sent = sent.order_by(*ordering).values('id')
+        received = received.order_by(*ordering).values('id')
+        if limit is not None:
+            sent = sent[:limit]
+            received = received[:limit]
+        return self.filter(id__in=sent.union(received, all=True))
+
+    def feed(self, user, limit):
+        """Последние limit транзакций пользователя за HOT_PERIOD для ленты на странице"""
+        return (self.recent()
+                .involving(user, limit)
+                .select_related('sender', 'receiver')
+                .order_by('-created_at', '-id')[:limit])
+
+    def history_page(self, user, cursor, per_page):
+        """Страница истории пользователя по курсору (см. core.pagination)"""
+        from .pagination import paginate
+
+        def fetch(condition, ordering, limit):
+            return (self.involving(user, limit, condition, ordering)
+                    .select_related('sender', 'receiver')
+                    .order_by(*ordering)[:limit])
+
+        return paginate(self, cursor, per_page, fetch=fetch)
+
+
 class Transaction(models.Model):
     TRANSACTION_TYPES = [
         ('EARN', 'Earned'),
@@ -186,6 +254,28 @@ class Transaction(models.Model):
         ('TRANSFER', 'Transfer'),
     ]
 
+    # Вид операции: по нему фильтруют отчёты вместо поиска по тексту описания
+    KIND_PURCHASE = 'PURCHASE'
+    KIND_AWARD = 'AWARD'
+    KIND_AWARD_REVERSAL = 'AWARD_REVERSAL'
+    KIND_BONUS = 'BONUS'
+    KIND_BIRTHDAY_GIFT = 'BIRTHDAY_GIFT'
+    KIND_TRANSFER_OUT = 'TRANSFER_OUT'
+    KIND_TRANSFER_IN = 'TRANSFER_IN'
+    KIND_ADJUSTMENT = 'ADJUSTMENT'
+    KIND_OTHER = 'OTHER'
+    KIND_CHOICES = [
+        (KIND_PURCHASE, 'Покупка'),
+        (KIND_AWARD, 'Награда'),
+        (KIND_AWARD_REVERSAL, 'Отмена награды'),
+        (KIND_BONUS, 'Начисление преподавателя'),
+        (KIND_BIRTHDAY_GIFT, 'Подарок на день рождения'),
+        (KIND_TRANSFER_OUT, 'Исходящий перевод'),
+        (KIND_TRANSFER_IN, 'Входящий перевод'),
+        (KIND_ADJUSTMENT, 'Корректировка баланса'),
+        (KIND_OTHER, 'Прочее'),
+    ]
+
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_transactions')
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_transactions')
     amount = models.IntegerField()  # Изменено на целые числа
@@ -193,9 +283,117 @@ class Transaction(models.Model):
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(default=timezone.now)
 
+    # Поля журнала (core.ledger): чей баланс изменила запись, на сколько и каким он стал.
+    # У записей, созданных до появления журнала, они пустые
+    account = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True,
+                                related_name='ledger_entries', verbose_name='Счёт')
+    delta = models.IntegerField(null=True, blank=True, verbose_name='Изменение баланса')
+    balance_after = models.IntegerField(null=True, blank=True, verbose_name='Баланс после операции')
+
+    # Структурированные данные операции. Пустой kind — старая запись, ещё не размеченная
+    # командой backfill_transaction_kinds. Индексы на ссылки — частичные, в Meta
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, blank=True, verbose_name='Вид операции')
+    purchase = models.ForeignKey('Purchase', on_delete=models.SET_NULL, null=True, blank=True, db_index=False,
+                                 related_name='ledger_entries', verbose_name='Покупка')
+    award = models.ForeignKey('CoinAward', on_delete=models.SET_NULL, null=True, blank=True, db_index=False,
+                              related_name='ledger_entries', verbose_name='Награда')
+    award_reason = models.ForeignKey('AwardReason', on_delete=models.SET_NULL, null=True, blank=True, db_index=False,
+                                     related_name='ledger_entries', verbose_name='Причина награды')
+    metadata = models.JSONField(default=dict, blank=True, verbose_name='Данные операции')
+
+    objects = TransactionQuerySet.as_manager()
+
+    class Meta:
+        # В PostgreSQL таблица секционирована по created_at (миграция 0022): первичный
+        # ключ — (id, created_at), а новые индексы создаются обычным AddIndex —
+        # CREATE INDEX CONCURRENTLY на секционированной таблице не поддерживается
+        indexes = [
+            models.Index(fields=['account', 'created_at'], name='transaction_account_idx'),
+            models.Index(fields=['sender', 'created_at'], name='transaction_sender_idx'),
+            models.Index(fields=['receiver', 'created_at'], name='transaction_receiver_idx'),
+            models.Index(fields=['transaction_type', 'created_at'], name='transaction_type_idx'),
+            models.Index(fields=['kind', 'created_at'], name='transaction_kind_idx'),
+            models.Index(fields=['purchase'], name='transaction_purchase_idx',
+                         condition=models.Q(purchase__isnull=False)),
+            models.Index(fields=['award'], name='transaction_award_idx',
+                         condition=models.Q(award__isnull=False)),
+            models.Index(fields=['award_reason', 'created_at'], name='transaction_reason_idx',
+                         condition=models.Q(award_reason__isnull=False)),
+        ]
+
     def __str__(self):
         return f"{self.transaction_type}: {self.amount} AstroCoins"
 
+
+class BalanceSnapshot(models.Model):
+    """
+    Периодический снимок баланса пользователя.
+    Баланс на любой момент считается от ближайшего снимка, а не с начала журнала.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='balance_snapshots')
+    balance = models.IntegerField(verbose_name='Баланс')
+    last_entry_id = models.BigIntegerField(default=0, verbose_name='Последняя учтённая запись журнала')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='Дата снимка')
+
+    class Meta:
+        verbose_name = 'Снимок баланса'
+        verbose_name_plural = 'Снимки балансов'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='snapshot_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.balance} AC ({self.created_at:%d.%m.%Y})"
+
+
+class TransactionArchive(models.Model):
+    """
+    Месяц журнала, убранный из таблицы транзакций командой archive_transactions:
+    строки секции в виде JSON (по строке на запись), сжатые gzip.
+    """
+    month = models.DateField(unique=True, verbose_name='Месяц')
+    row_count = models.PositiveIntegerField(verbose_name='Записей')
+    first_id = models.BigIntegerField(verbose_name='Первая запись')
+    last_id = models.BigIntegerField(verbose_name='Последняя запись')
+    payload = models.BinaryField(verbose_name='Сжатые записи')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='Дата архивации')
+
+    class Meta:
+        verbose_name = 'Архив транзакций'
+        verbose_name_plural = 'Архивы транзакций'
+        ordering = ['-month']
+
+    def __str__(self):
+        return f"{self.month:%m.%Y}: {self.row_count} записей"
+
+
+class AnnualGift(models.Model):
+    """
+    Ежегодный подарок пользователю. Уникальность (пользователь, год, вид) не даёт
+    выдать один и тот же подарок дважды, сколько бы раз ни запускалась выдача.
+    """
+    KIND_BIRTHDAY = 'BIRTHDAY'
+    KIND_CHOICES = [
+        (KIND_BIRTHDAY, 'День рождения'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='annual_gifts')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='Вид подарка')
+    year = models.PositiveSmallIntegerField(verbose_name='Год')
+    amount = models.PositiveIntegerField(verbose_name='Сумма')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='Дата выдачи')
+
+    class Meta:
+        verbose_name = 'Ежегодный подарок'
+        verbose_name_plural = 'Ежегодные подарки'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'year', 'kind'], name='annual_gift_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.get_kind_display()} {self.year} (+{self.amount} AC)"
+
 class ProductCategory(models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True)
@@ -210,6 +408,7 @@ class ProductCategory(models.Model):
                             null=True, blank=True)  # Временно nullable для миграции
     
     created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = 'Категория товаров'
@@ -221,17 +420,8 @@ class ProductCategory(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            # Используем нашу функцию с поддержкой кириллицы
-            base_slug = create_cyrillic_slug(self.name)
-            slug = base_slug
-            
-            # Проверяем уникальность slug
-            counter = 1
-            while ProductCategory.objects.filter(slug=slug).exclude(pk=self.pk).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            
-            self.slug = slug
+            from .slugs import allocate_slug
+            self.slug = allocate_slug(ProductCategory, self.name, exclude_pk=self.pk)
         super().save(*args, **kwargs)
 
 class Product(models.Model):
@@ -241,10 +431,13 @@ class Product(models.Model):
     price = models.IntegerField()  # Изменено на целые числа
     image = models.ImageField(
         upload_to='products/',
+        storage=get_product_image_storage,  # Одинаковые картинки хранятся один раз (core.storage)
         null=True,
         blank=True,
         validators=[validate_file_type, validate_file_size]
     )
+    # Уменьшенные копии изображения для магазина (core.images): исходник, размеры, имена файлов
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     category = models.ForeignKey(ProductCategory, on_delete=models.SET_NULL, null=True, related_name='products')
     available = models.BooleanField(default=True)
     stock = models.PositiveIntegerField(default=1)  # Количество в наличии
@@ -259,10 +452,18 @@ class Product(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Документ полнотекстового поиска (название, категория, описание); обновляется в core.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
     class Meta:
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
         ordering = ['-featured', '-created_at']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_idx'),
+            # Нечёткий поиск по названию (опечатки, часть слова)
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='product_name_trgm_idx'),
+        ]
     
     def clean(self):
         from django.core.exceptions import ValidationError
@@ -293,15 +494,9 @@ class Product(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            base_slug = create_cyrillic_slug(self.name)
-            self.slug = base_slug
-            
-            # Проверяем уникальность slug и добавляем номер если нужно
-            counter = 1
-            while Product.objects.filter(slug=self.slug).exclude(pk=self.pk).exists():
-                self.slug = f"{base_slug}-{counter}"
-                counter += 1
-                
+            from .slugs import allocate_slug
+            self.slug = allocate_slug(Product, self.name, exclude_pk=self.pk)
+
         super().save(*args, **kwargs)
 
     @property
@@ -322,6 +517,10 @@ class Purchase(models.Model):
         verbose_name = 'Покупка'
         verbose_name_plural = 'Покупки'
         ordering = ['-created_at']
+        indexes = [
+            # Постраничный вывод покупок пользователя по курсору (created_at, id)
+            models.Index(fields=['user', 'created_at', 'id'], name='purchase_user_idx'),
+        ]
 
     def __str__(self):
         user_name = self.user.username if self.user else "Неизвестный пользователь"
@@ -334,6 +533,26 @@ class Purchase(models.Model):
         self.delivered_date = timezone.now()
         self.save()
 
+class ProductRecommendation(models.Model):
+    """
+    Предрасчитанные рекомендации товара (core.recommendations): id товаров,
+    которые чаще всего покупают вместе с ним, по убыванию сходства
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True,
+                                   related_name='recommendation')
+    related = ArrayField(models.IntegerField(), default=list, blank=True)
+    scores = ArrayField(models.FloatField(), default=list, blank=True)
+    # Сколько разных учеников покупали товар — для блока «Популярное»
+    buyers = models.PositiveIntegerField(default=0)
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Рекомендации товара'
+        verbose_name_plural = 'Рекомендации товаров'
+
+    def __str__(self):
+        return f"Рекомендации для товара {self.product_id}"
+
 class City(models.Model):
     """
     Модель города
@@ -399,6 +618,7 @@ class Course(models.Model):
     duration_hours = models.PositiveIntegerField(default=0, verbose_name='Продолжительность (часы)')
     is_active = models.BooleanField(default=True, verbose_name='Активный курс')
     created_at = models.DateTimeField(default=timezone.now, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
 
     class Meta:
         verbose_name = 'Курс'
@@ -490,35 +710,39 @@ class CoinAward(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.pk:  # Только при создании
-            # Создаем транзакцию
-            Transaction.objects.create(
-                sender=self.teacher,
-                receiver=self.student,
-                amount=self.amount,
-                transaction_type='EARN',
-                description=f"{self.reason.name}\n{self.comment if self.comment else ''}"
-            )
-            
-            # Обновляем баланс студента
-            profile = self.student.profile
-            profile.astrocoins += self.amount
-            profile.save()
-            
+            from .ledger import credit
+
+            # Начисление и запись в журнале сохраняются вместе или не сохраняются вовсе
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                credit(
+                    self.student,
+                    self.amount,
+                    sender=self.teacher,
+                    kind=Transaction.KIND_AWARD,
+                    description=f"{self.reason.name}\n{self.comment if self.comment else ''}",
+                    award=self,
+                    award_reason=self.reason,
+                )
+            return
+
         super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
-        # Создаем отрицательную транзакцию при удалении награды
-        Transaction.objects.create(
-            sender=self.teacher,
-            receiver=self.student,
-            amount=-self.amount,
-            transaction_type='EARN',
-            description=f"Отмена: {self.reason.name}\n{self.comment if self.comment else ''}"
-        )
-        
-        # Обновляем баланс студента
-        profile = self.student.profile
-        profile.astrocoins -= self.amount
-        profile.save()
-        
-        super().delete(*args, **kwargs)
\ No newline at end of file
+        from .ledger import debit
+
+        # Отмена награды списывает монеты даже если ученик уже успел их потратить
+        with transaction.atomic():
+            debit(
+                self.student,
+                self.amount,
+                sender=self.teacher,
+                kind=Transaction.KIND_AWARD_REVERSAL,
+                description=f"Отмена: {self.reason.name}\n{self.comment if self.comment else ''}",
+                allow_negative=True,
+                award=self,
+                award_reason=self.reason,
+                # После удаления ссылка award обнулится, номер награды остаётся здесь
+                metadata={'award_id': self.pk},
+            )
+            return super().delete(*args, **kwargs)
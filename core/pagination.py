@@ -0,0 +1,157 @@
+"""
+Постраничный вывод лент по курсору (keyset pagination).
+
+Страница выбирается условием по паре (created_at, id) вместо OFFSET, поэтому
+любая страница стоит столько же, сколько первая, и COUNT(*) по всей выборке
+не нужен. Курсор — непрозрачная строка, которую шаблон подставляет в ссылку.
+"""
+import base64
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+# Оценка количества строк кешируется, чтобы не запускать EXPLAIN на каждый просмотр
+COUNT_CACHE_TIMEOUT = 300
+
+# Ниже этого порога оценка планировщика слишком грубая, а точный COUNT дёшев
+EXACT_COUNT_THRESHOLD = 1000
+
+
+class CursorPage:
+    """Страница ленты с курсорами на соседние страницы"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+def encode_cursor(obj, direction):
+    """Кодирует позицию записи obj и направление перехода в строку для URL"""
+    payload = json.dumps([obj.created_at.isoformat(), obj.pk, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (created_at, id, направление) или None, если курсор пустой или испорчен"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, pk, direction = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at = parse_datetime(created_at)
+        if created_at is None or direction not in (NEXT, PREVIOUS):
+            return None
+        return created_at, int(pk), direction
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_condition(created_at, pk, direction):
+    """Условие «строго после» (NEXT) или «строго до» (PREVIOUS) позиции в порядке убывания"""
+    if direction == NEXT:
+        return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+    return Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+
+
+def _default_fetch(queryset):
+    def fetch(condition, ordering, limit):
+        if condition is not None:
+            queryset_page = queryset.filter(condition)
+        else:
+            queryset_page = queryset
+        return queryset_page.order_by(*ordering)[:limit]
+    return fetch
+
+
+def paginate(queryset, cursor, per_page, fetch=None):
+    """
+    Возвращает CursorPage для курсора из запроса (None — первая страница).
+
+    fetch(condition, ordering, limit) позволяет передать своё построение запроса,
+    например когда условие нужно применить внутри каждой ветки UNION.
+    """
+    fetch = fetch or _default_fetch(queryset)
+    position = decode_cursor(cursor)
+
+    if position is None:
+        rows = list(fetch(None, ('-created_at', '-id'), per_page + 1))
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        has_next, has_previous = has_more, False
+    else:
+        created_at, pk, direction = position
+        condition = keyset_condition(created_at, pk, direction)
+        if direction == NEXT:
+            rows = list(fetch(condition, ('-created_at', '-id'), per_page + 1))
+            has_more = len(rows) > per_page
+            rows = rows[:per_page]
+            has_next, has_previous = has_more, True
+        else:
+            # Идём назад по возрастанию и переворачиваем страницу
+            rows = list(fetch(condition, ('created_at', 'id'), per_page + 1))
+            has_more = len(rows) > per_page
+            rows = rows[:per_page][::-1]
+            has_next, has_previous = True, has_more
+
+    return CursorPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1], NEXT) if rows and has_next else None,
+        previous_cursor=encode_cursor(rows[0], PREVIOUS) if rows and has_previous else None,
+    )
+
+
+def estimate_count(queryset):
+    """
+    Примерное количество строк выборки по оценке планировщика PostgreSQL.
+    Небольшие выборки считаются точно. Значение кешируется на COUNT_CACHE_TIMEOUT
+    секунд; на других СУБД — обычный COUNT.
+    """
+    sql, params = queryset.query.sql_with_params()
+    key = 'estimate_count:' + hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+    count = cache.get(key)
+    if count is not None:
+        return count
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        count = int(plan[0]['Plan']['Plan Rows'])
+        if count < EXACT_COUNT_THRESHOLD:
+            count = queryset.count()
+    else:
+        count = queryset.count()
+
+    cache.set(key, count, COUNT_CACHE_TIMEOUT)
+    return count
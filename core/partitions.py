@@ -0,0 +1,169 @@
+"""
+Помесячные секции таблицы транзакций (декларативное секционирование PostgreSQL).
+
+Таблица core_transaction секционирована по created_at миграцией
+0022_partition_transactions: секция на каждый месяц (core_transaction_pYYYYMM)
+и секция DEFAULT для строк вне созданных месяцев. Здесь — создание секций
+наперёд и архивирование старых месяцев: их итог сворачивается в снимки
+балансов, после чего секция отсоединяется или сжимается в TransactionArchive.
+"""
+import gzip
+import io
+import logging
+import re
+from datetime import date
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import BalanceSnapshot, Transaction, TransactionArchive
+
+logger = logging.getLogger(__name__)
+
+TABLE = Transaction._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+MONTHS_AHEAD = 3
+
+PARTITION_RE = re.compile(rf'^{TABLE}_p(\d{{4}})(\d{{2}})$')
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def current_month():
+    today = timezone.localdate()
+    return date(today.year, today.month, 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [TABLE])
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """Помесячные секции по возрастанию: [(имя, первое число месяца)]"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = %s::regclass',
+            [TABLE]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = []
+    for name in names:
+        match = PARTITION_RE.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda item: item[1])
+
+
+def create_partition(month):
+    """
+    Создаёт секцию месяца. Если строки этого месяца уже попали в DEFAULT,
+    они переносятся в новую секцию в той же транзакции.
+    """
+    name = partition_name(month)
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s)',
+                       [start, end])
+        stray = cursor.fetchone()[0]
+        if stray:
+            cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}')
+        cursor.execute(f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)", [start, end])
+        if stray:
+            cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {DEFAULT_PARTITION} '
+                           f'WHERE created_at >= %s AND created_at < %s', [start, end])
+            cursor.execute(f'DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s', [start, end])
+            cursor.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT')
+    logger.info(f'Создана секция {name}' + (' (строки перенесены из DEFAULT)' if stray else ''))
+    return name
+
+
+def ensure_partitions(months_ahead=MONTHS_AHEAD):
+    """Создаёт недостающие секции от текущего месяца на months_ahead вперёд"""
+    existing = {month for _, month in list_partitions()}
+    created = []
+    month = current_month()
+    for _ in range(months_ahead + 1):
+        if month not in existing:
+            created.append(create_partition(month))
+        month = add_months(month, 1)
+    return created
+
+
+def fold_into_snapshots(name):
+    """
+    Сохраняет итог секции в снимках балансов: для каждого счёта — баланс после
+    его последней записи в этой секции, если более свежего снимка ещё нет.
+    После этого balance_at и сверка балансов не нуждаются в строках секции.
+    """
+    snapshots = connection.ops.quote_name(BalanceSnapshot._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {snapshots} (user_id, balance, last_entry_id, created_at)
+            SELECT last.account_id, last.balance_after, last.id, last.created_at
+            FROM (
+                SELECT DISTINCT ON (account_id) account_id, balance_after, id, created_at
+                FROM {name}
+                WHERE account_id IS NOT NULL AND delta IS NOT NULL
+                ORDER BY account_id, created_at DESC, id DESC
+            ) last
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {snapshots} s
+                WHERE s.user_id = last.account_id AND s.last_entry_id >= last.id
+            )
+            """
+        )
+        return cursor.rowcount
+
+
+def compress_partition(name, month):
+    """Сжимает строки секции (JSON по строке на запись, gzip) в одну запись TransactionArchive"""
+    buffer = io.BytesIO()
+    row_count = 0
+    first_id = last_id = None
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as archive:
+        # Серверный курсор: секция не загружается в память целиком
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(f'SELECT id, row_to_json(t)::text FROM {name} t ORDER BY id')
+            for entry_id, row in cursor:
+                archive.write(row.encode() + b'\n')
+                row_count += 1
+                first_id = entry_id if first_id is None else first_id
+                last_id = entry_id
+    return TransactionArchive.objects.create(
+        month=month,
+        row_count=row_count,
+        first_id=first_id or 0,
+        last_id=last_id or 0,
+        payload=buffer.getvalue(),
+    )
+
+
+def archive_partition(name, month, compress=False):
+    """
+    Убирает секцию месяца из горячей таблицы: сворачивает её в снимки, затем
+    отсоединяет (таблица остаётся в базе, её можно выгрузить pg_dump и удалить)
+    или сжимает в TransactionArchive и удаляет. Возвращает число новых снимков.
+    """
+    with transaction.atomic():
+        folded = fold_into_snapshots(name)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+        if compress:
+            compress_partition(name, month)
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE {name}')
+    logger.info(f'Секция {name} архивирована ({"сжата" if compress else "отсоединена"}), снимков: {folded}')
+    return folded
@@ -0,0 +1,194 @@
+"""
+Импорт товаров из JSON (файлы *_batch.json, команда add_products_batch).
+
+Вся пачка записывается несколькими запросами: категории — по словарю
+«название → категория» из одного SELECT (новые создаются одним
+bulk_create), товары — одним INSERT ... ON CONFLICT (slug) DO UPDATE.
+Существующий товар находится по названию и обновляется по своему slug,
+новый получает slug из core.slugs. Изображения скачиваются пулом потоков
+через общую requests.Session прямо в память; в базу их записывает
+основной поток.
+"""
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from . import catalog, search
+from .models import Product, ProductCategory
+from .slugs import allocate_slugs
+
+REQUIRED_FIELDS = ('name', 'price', 'category')
+IMAGE_WORKERS = 8
+IMAGE_TIMEOUT = 30
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+
+# Поля, которые импорт перезаписывает у существующего товара
+UPDATE_FIELDS = ['description', 'price', 'stock', 'category', 'is_digital', 'featured', 'updated_at']
+
+
+@dataclass
+class ImportStats:
+    items: int = 0
+    created: int = 0
+    updated: int = 0
+    categories_created: int = 0
+    images: int = 0
+    image_bytes: int = 0
+    errors: list = field(default_factory=list)
+    db_seconds: float = 0.0
+    image_seconds: float = 0.0
+
+
+def _clean(item):
+    """Проверяет и приводит типы одного товара; ValueError с причиной"""
+    if not isinstance(item, dict):
+        raise ValueError('ожидался объект')
+    missing = [key for key in REQUIRED_FIELDS if key not in item]
+    if missing:
+        raise ValueError(f'отсутствуют обязательные поля ({", ".join(missing)})')
+    name = str(item['name']).strip()
+    if not name:
+        raise ValueError('пустое название')
+    return {
+        'name': name,
+        'category': str(item['category']).strip(),
+        'price': int(item['price']),
+        'stock': int(item.get('stock', 10)),
+        'description': item.get('description') or f'Товар {name} из магазина Алгоритмики',
+        'is_digital': bool(item.get('is_digital', False)),
+        'featured': bool(item.get('featured', False)),
+        'image_url': item.get('image_url') or '',
+    }
+
+
+def _categories(names, stats):
+    """{название: категория}: один SELECT и один bulk_create для новых"""
+    by_name = {}
+    for category in ProductCategory.objects.filter(name__in=names).order_by('id'):
+        by_name.setdefault(category.name, category)
+    new_names = [name for name in dict.fromkeys(names) if name not in by_name]
+    if new_names:
+        created = ProductCategory.objects.bulk_create([
+            ProductCategory(name=name, slug=slug, description=f'Категория {name}')
+            for name, slug in zip(new_names, allocate_slugs(ProductCategory, new_names))
+        ])
+        by_name.update((category.name, category) for category in created)
+        stats.categories_created = len(created)
+    return by_name
+
+
+def _upsert(items, stats):
+    """Записывает товары одним upsert; возвращает {название: товар}"""
+    names = [item['name'] for item in items]
+    categories = _categories([item['category'] for item in items], stats)
+
+    existing = {}
+    for name, slug in Product.objects.filter(name__in=names).order_by('id').values_list('name', 'slug'):
+        existing.setdefault(name, slug)
+    new_names = [name for name in names if name not in existing]
+    slugs = {**existing, **dict(zip(new_names, allocate_slugs(Product, new_names)))}
+
+    Product.objects.bulk_create(
+        [Product(
+            name=item['name'],
+            slug=slugs[item['name']],
+            description=item['description'],
+            price=item['price'],
+            stock=item['stock'],
+            category=categories[item['category']],
+            is_digital=item['is_digital'],
+            featured=item['featured'],
+            available=True,
+        ) for item in items],
+        update_conflicts=True,
+        unique_fields=['slug'],
+        update_fields=UPDATE_FIELDS,
+    )
+    stats.created += len(new_names)
+    stats.updated += len(names) - len(new_names)
+
+    # bulk_create не шлёт сигналы: поисковый документ и кеш каталога обновляем сами
+    products = Product.objects.filter(slug__in=slugs.values())
+    search.index_products(products)
+    products = {product.name: product for product in products}
+    for city_id in {product.city_id for product in products.values()}:
+        catalog.invalidate(city_id)
+    return products
+
+
+def _image_filename(image_url, product_name):
+    extension = os.path.splitext(urlparse(image_url).path)[1] or '.jpg'
+    safe_name = re.sub(r'[^\w\s-]', '', product_name).strip()
+    safe_name = re.sub(r'[-\s]+', '-', safe_name)
+    return f'{safe_name}{extension}'
+
+
+def _download(session, image_url):
+    response = session.get(image_url, timeout=IMAGE_TIMEOUT)
+    response.raise_for_status()
+    return response.content
+
+
+def _download_images(jobs, workers, stats):
+    """jobs — [(товар, url)]; скачивание в потоках, сохранение здесь же по мере готовности"""
+    with requests.Session() as session:
+        session.headers['User-Agent'] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_download, session, url): (product, url) for product, url in jobs}
+            for future in as_completed(futures):
+                product, url = futures[future]
+                try:
+                    content = future.result()
+                    # Сохранение запускает сигнал, который строит уменьшенные копии (core.images)
+                    product.image.save(_image_filename(url, product.name), ContentFile(content), save=True)
+                except Exception as e:
+                    stats.errors.append(f'Изображение {url} для «{product.name}»: {e}')
+                    continue
+                stats.images += 1
+                stats.image_bytes += len(content)
+
+
+def import_products(items, images=True, refresh_images=False, workers=IMAGE_WORKERS):
+    """
+    Импортирует список товаров (словари из *_batch.json). Повтор названия
+    в пачке перезаписывает предыдущий. Изображение скачивается, если у
+    товара его ещё нет (refresh_images — всегда). Возвращает ImportStats.
+    """
+    stats = ImportStats(items=len(items))
+    cleaned = {}
+    for number, item in enumerate(items, 1):
+        try:
+            item = _clean(item)
+        except (TypeError, ValueError) as e:
+            name = item.get('name') if isinstance(item, dict) else None
+            stats.errors.append(f'Товар {number}{f" «{name}»" if name else ""}: {e}')
+            continue
+        cleaned.pop(item['name'], None)
+        cleaned[item['name']] = item
+    if not cleaned:
+        return stats
+
+    started = time.perf_counter()
+    with transaction.atomic():
+        products = _upsert(list(cleaned.values()), stats)
+    stats.db_seconds = time.perf_counter() - started
+
+    if images:
+        jobs = [(products[name], item['image_url']) for name, item in cleaned.items()
+                if item['image_url'] and (refresh_images or not products[name].image)]
+        if jobs:
+            started = time.perf_counter()
+            _download_images(jobs, workers, stats)
+            stats.image_seconds = time.perf_counter() - started
+    return stats
@@ -0,0 +1,123 @@
+"""
+Покупки в магазине: одного товара (buy_product) или всей корзины (checkout).
+
+Остаток товара резервируется одним условным UPDATE (stock > 0, товар доступен,
+цена не изменилась), а монеты списываются условным UPDATE баланса из
+core.ledger. Строку товара заранее никто не блокирует: резервирование идёт
+последним шагом транзакции, поэтому покупатели одного товара ждут друг друга
+только на время коммита, а не всего запроса. Если остатка не хватило,
+транзакция откатывается вместе с уже проведённым списанием.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import catalog, ledger
+from .models import Product, Purchase, Transaction
+
+
+class PurchaseError(Exception):
+    """Покупка не может быть выполнена"""
+
+
+class OutOfStock(PurchaseError):
+    """Товар закончился или снят с продажи"""
+
+
+class PriceChanged(PurchaseError):
+    """Цена товара изменилась, пока покупатель оформлял покупку"""
+
+
+def reserve_stock(product_id, price, quantity=1):
+    """
+    Уменьшает остаток товара на quantity одним UPDATE, если его хватает, товар
+    доступен и цена всё ещё price. Возвращает новый остаток. Строка товара
+    остаётся заблокированной до конца транзакции, поэтому вызывать последним.
+    """
+    table = connection.ops.quote_name(Product._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET stock = stock - %s, updated_at = %s '
+            f'WHERE id = %s AND stock >= %s AND available AND price = %s '
+            f'RETURNING stock',
+            [quantity, timezone.now(), product_id, quantity, price]
+        )
+        row = cursor.fetchone()
+
+    if row is None:
+        # Медленный путь только для отказов: выясняем причину
+        current = Product.objects.filter(id=product_id, available=True).values_list('price', flat=True).first()
+        if current is not None and current != price:
+            raise PriceChanged(f'Цена товара {product_id} изменилась: {price} → {current} AC')
+        raise OutOfStock(f'Товар {product_id} закончился')
+    return row[0]
+
+
+def checkout(user, lines):
+    """
+    Оформляет корзину lines — [(товар, количество)] — одной транзакцией:
+    одна запись Purchase на товар (bulk_create), одно списание общей суммы и
+    одна запись журнала. Остатки резервируются последними, по возрастанию id
+    товара, по ценам, с которыми корзина была показана покупателю.
+    Всё или ничего: при OutOfStock, PriceChanged или ledger.InsufficientFunds
+    ничего не записывается. Возвращает созданные покупки.
+    """
+    if not lines:
+        raise PurchaseError('Корзина пуста')
+    # Один порядок блокировок для всех покупок: сначала баланс покупателя, затем товары по id
+    lines = sorted(lines, key=lambda line: line[0].id)
+
+    # Проверка без блокировки: когда товар распродан, покупатели получают отказ
+    # одним SELECT, не записывая и не откатывая покупку
+    stock = dict(Product.objects.filter(id__in=[product.id for product, _ in lines], available=True)
+                 .values_list('id', 'stock'))
+    for product, quantity in lines:
+        if stock.get(product.id, 0) < quantity:
+            raise OutOfStock(f'Товар «{product.name}» закончился')
+
+    total = sum(product.price * quantity for product, quantity in lines)
+    if len(lines) == 1:
+        description = f'Покупка {lines[0][0].name}'
+        metadata = {'product_id': lines[0][0].id}
+    else:
+        description = 'Покупка: ' + ', '.join(
+            product.name if quantity == 1 else f'{product.name} × {quantity}' for product, quantity in lines
+        )
+        metadata = {'items': [[product.id, quantity, product.price] for product, quantity in lines]}
+
+    with transaction.atomic():
+        # Покупки и списание блокируют только строку покупателя
+        orders = Purchase.objects.bulk_create([
+            Purchase(user=user, product=product, quantity=quantity, total_price=product.price * quantity)
+            for product, quantity in lines
+        ])
+        if len(orders) > 1:
+            metadata['purchase_ids'] = [order.id for order in orders]
+        ledger.debit(
+            user,
+            total,
+            kind=Transaction.KIND_PURCHASE,
+            description=description,
+            purchase=orders[0] if len(orders) == 1 else None,
+            metadata=metadata,
+        )
+        for product, quantity in lines:
+            try:
+                remaining = reserve_stock(product.id, product.price, quantity)
+            except OutOfStock:
+                raise OutOfStock(f'Товар «{product.name}» закончился') from None
+            except PriceChanged:
+                raise PriceChanged(f'Цена товара «{product.name}» изменилась') from None
+            product.stock = remaining
+            if remaining == 0:
+                # Кнопка «Купить» в закешированной сетке магазина должна смениться на «Нет в наличии»
+                catalog.invalidate(product.city_id)
+    return orders
+
+
+def buy_product(user, product):
+    """
+    Покупка одной единицы product пользователем user по цене product.price.
+    Выбрасывает OutOfStock, PriceChanged или ledger.InsufficientFunds;
+    в этих случаях ничего не записывается.
+    """
+    return checkout(user, [(product, 1)])[0]
@@ -0,0 +1,138 @@
+"""
+Рекомендации магазина: «Популярное» и «С этим также покупают».
+
+Ночная команда build_recommendations строит по покупкам каждого города
+разреженную матрицу «ученик × товар», умножением B.T @ B получает матрицу
+совместных покупок и сохраняет для каждого товара top-k соседей по
+косинусной мере в ProductRecommendation. Магазин только читает готовые
+списки: одна выборка по индексу, без вычислений в запросе.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import catalog
+from .models import Product, ProductRecommendation, Purchase
+
+TOP_K = 12
+# Пара товаров считается связанной, если её купили хотя бы столько разных учеников
+MIN_COMMON = 2
+POPULAR_LIMIT = 8
+ALSO_BOUGHT_LIMIT = 4
+
+
+def co_purchase_neighbours(user_ids, product_ids, top=TOP_K, min_common=MIN_COMMON):
+    """
+    По парам (ученик, товар) одного города находит для каждого товара top
+    товаров, которые покупают те же ученики.
+    Возвращает {товар: (число покупателей, [(товар, сходство), ...])}.
+    """
+    # Тяжёлые зависимости нужны только ночной задаче, а не веб-процессам
+    import numpy as np
+    from scipy import sparse
+
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    products, product_index = np.unique(product_ids, return_inverse=True)
+    baskets = sparse.csr_matrix(
+        (np.ones(len(user_index), dtype=np.float32), (user_index, product_index)),
+        shape=(len(users), len(products)),
+    )
+    # Повторные покупки одного товара учеником считаются одной
+    baskets.data[:] = 1
+
+    common = (baskets.T @ baskets).tocsr()
+    buyers = common.diagonal()
+    common.setdiag(0)
+    common.data[common.data < min_common] = 0
+    common.eliminate_zeros()
+
+    # Косинусная мера: общие покупатели / sqrt(покупатели A × покупатели B),
+    # чтобы самые ходовые товары не оказывались соседями у всех
+    norm = sparse.diags(1 / np.sqrt(buyers))
+    similarity = (norm @ common @ norm).tocsr()
+
+    result = {}
+    for row, product_id in enumerate(products):
+        start, end = similarity.indptr[row], similarity.indptr[row + 1]
+        columns = similarity.indices[start:end]
+        values = similarity.data[start:end]
+        if len(values) > top:
+            best = np.argpartition(-values, top)[:top]
+            columns, values = columns[best], values[best]
+        order = np.lexsort((products[columns], -values))
+        result[int(product_id)] = (
+            int(buyers[row]),
+            [(int(products[column]), round(float(value), 4)) for column, value in zip(columns[order], values[order])],
+        )
+    return result
+
+
+def rebuild(top=TOP_K, min_common=MIN_COMMON, since=None):
+    """
+    Пересчитывает рекомендации всех товаров по покупкам (since — только покупки
+    с этой даты) и заменяет таблицу одной транзакцией. Возвращает
+    {город: (покупок, товаров)} для отчёта.
+    """
+    import numpy as np
+
+    purchases = Purchase.objects.all()
+    if since:
+        purchases = purchases.filter(created_at__gte=since)
+    rows = np.array(
+        list(purchases.values_list('user_id', 'product_id', Coalesce('product__city_id', Value(0))).distinct()),
+        dtype=np.int64,
+    ).reshape(-1, 3)
+
+    now = timezone.now()
+    recommendations = []
+    stats = {}
+    for city_id in np.unique(rows[:, 2]):
+        city_rows = rows[rows[:, 2] == city_id]
+        neighbours = co_purchase_neighbours(city_rows[:, 0], city_rows[:, 1], top, min_common)
+        for product_id, (buyers, related) in neighbours.items():
+            recommendations.append(ProductRecommendation(
+                product_id=product_id,
+                related=[related_id for related_id, _ in related],
+                scores=[score for _, score in related],
+                buyers=buyers,
+                computed_at=now,
+            ))
+        stats[int(city_id) or None] = (len(city_rows), len(neighbours))
+
+    with transaction.atomic():
+        ProductRecommendation.objects.all().delete()
+        ProductRecommendation.objects.bulk_create(recommendations, batch_size=1000)
+        for city_id in stats:
+            # Блок «Популярное» входит в закешированную сетку магазина
+            catalog.invalidate(city_id)
+    return stats
+
+
+def popular_ids(city_id=None, limit=POPULAR_LIMIT):
+    """id самых покупаемых товаров в наличии (None — все города)"""
+    recommendations = ProductRecommendation.objects.filter(product__available=True, product__stock__gt=0)
+    if city_id:
+        recommendations = recommendations.filter(product__city_id=city_id)
+    return list(recommendations.order_by('-buyers', 'product_id').values_list('product_id', flat=True)[:limit])
+
+
+def also_bought(product_ids, city_id=None, limit=ALSO_BOUGHT_LIMIT):
+    """Товары в наличии, которые чаще всего покупают вместе с product_ids"""
+    scores = defaultdict(float)
+    for related, values in ProductRecommendation.objects.filter(product_id__in=product_ids).values_list('related', 'scores'):
+        for related_id, score in zip(related, values):
+            scores[related_id] += score
+    for product_id in product_ids:
+        scores.pop(product_id, None)
+    if not scores:
+        return []
+
+    candidates = sorted(scores, key=lambda product_id: (-scores[product_id], product_id))[:limit * 3]
+    products = Product.objects.filter(id__in=candidates, available=True, stock__gt=0)
+    if city_id:
+        products = products.filter(city_id=city_id)
+    found = {product.id: product for product in products}
+    return [found[product_id] for product_id in candidates if product_id in found][:limit]
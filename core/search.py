@@ -0,0 +1,160 @@
+"""
+Поиск товаров, учеников и родителей.
+
+Товары ищутся по документу Product.search_vector (русская конфигурация
+полнотекстового поиска: название, категория, описание) и по триграммам
+названия — так находятся и недописанные слова, и опечатки. Ученики и
+родители — по триграммам имени. Все условия обслуживаются GIN-индексами
+(см. миграции 0025–0026), поэтому подсказки отвечают за миллисекунды и на
+каталогах в тысячи позиций.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.core.files.storage import default_storage
+from django.db.models import F, OuterRef, Q, Subquery, TextField, Value
+from django.db.models.functions import Coalesce, Greatest, Replace
+
+from .models import Parent, Product, ProductCategory, User
+
+CONFIG = 'russian'
+MIN_QUERY_LENGTH = 2
+MAX_QUERY_WORDS = 6
+LIMIT = 10
+
+WORD_RE = re.compile(r'\w+')
+LATIN_RE = re.compile(r'[a-z]', re.IGNORECASE)
+
+# Запрос, набранный в английской раскладке вместо русской: «ghbdtn» → «привет»
+LAYOUT = str.maketrans(
+    'qwertyuiop[]asdfghjkl;\'zxcvbnm,.`QWERTYUIOP{}ASDFGHJKL:"ZXCVBNM<>~',
+    'йцукенгшщзхъфывапролджэячсмитьбюёЙЦУКЕНГШЩЗХЪФЫВАПРОЛДЖЭЯЧСМИТЬБЮЁ',
+)
+
+
+def _fold(expression):
+    # «ё» и «е» в поиске не различаются
+    folded = Replace(expression, Value('ё'), Value('е'), output_field=TextField())
+    return Replace(folded, Value('Ё'), Value('Е'), output_field=TextField())
+
+
+def normalize(query):
+    return ' '.join(query.replace('ё', 'е').replace('Ё', 'Е').split())
+
+
+def product_document():
+    """Выражение документа товара для UPDATE: название (A), категория (B), описание (C)"""
+    category_name = Subquery(ProductCategory.objects.filter(pk=OuterRef('category_id')).values('name')[:1])
+    return (
+        SearchVector(_fold(F('name')), weight='A', config=CONFIG)
+        + SearchVector(_fold(Coalesce(category_name, Value(''))), weight='B', config=CONFIG)
+        + SearchVector(_fold(F('description')), weight='C', config=CONFIG)
+    )
+
+
+def index_products(products):
+    """Пересчитывает search_vector для queryset товаров одним UPDATE"""
+    return products.update(search_vector=product_document())
+
+
+def _prefix_query(query):
+    """Каждое слово запроса — префикс: «косм кор» найдёт «Космический корабль»"""
+    words = WORD_RE.findall(query.lower())[:MAX_QUERY_WORDS]
+    if not words:
+        return None
+    return SearchQuery(' & '.join(f'{word}:*' for word in words), search_type='raw', config=CONFIG)
+
+
+def filter_products(products, query):
+    """Товары из products, подходящие под запрос, с оценкой rank (лучшие — с большей)"""
+    query = normalize(query)
+    text_query = _prefix_query(query)
+    condition = Q(name__trigram_word_similar=query)
+    rank = TrigramWordSimilarity(query, 'name')
+    if text_query is not None:
+        condition |= Q(search_vector=text_query)
+        rank = rank + SearchRank(F('search_vector'), text_query)
+    return products.filter(condition).annotate(rank=rank)
+
+
+def _with_layout_fallback(search, query):
+    results = search(query)
+    if not results and LATIN_RE.search(query):
+        results = search(query.translate(LAYOUT))
+    return results
+
+
+def _thumbnail_url(row):
+    variants = row['image_variants'] or {}
+    if variants.get('webp'):
+        return default_storage.url(variants['webp'][0][1])
+    return default_storage.url(row['image']) if row['image'] else None
+
+
+def search_products(query, city_id=None, limit=LIMIT):
+    """Подсказки товаров в наличии для магазина города (None — все города)"""
+    products = Product.objects.filter(available=True)
+    if city_id:
+        products = products.filter(city_id=city_id)
+
+    def search(text):
+        rows = (filter_products(products, text)
+                .order_by('-rank', 'id')
+                .values('id', 'name', 'price', 'stock', 'category__name', 'image', 'image_variants')[:limit])
+        return [{
+            'id': row['id'],
+            'name': row['name'],
+            'price': row['price'],
+            'in_stock': row['stock'] > 0,
+            'category': row['category__name'],
+            'image': _thumbnail_url(row),
+        } for row in rows]
+
+    return _with_layout_fallback(search, query)
+
+
+def search_students(query, city_id=None, teacher=None, limit=LIMIT):
+    """Ученики города по фамилии, имени или логину (teacher — только его группы)"""
+    students = User.objects.filter(role='student', is_active=True)
+    if city_id:
+        students = students.filter(city_id=city_id)
+    if teacher is not None:
+        students = students.filter(group__teacher=teacher)
+
+    def search(text):
+        text = normalize(text)
+        rows = (students
+                .filter(Q(last_name__trigram_word_similar=text)
+                        | Q(first_name__trigram_word_similar=text)
+                        | Q(username__trigram_word_similar=text))
+                .annotate(rank=Greatest(TrigramWordSimilarity(text, 'last_name'),
+                                        TrigramWordSimilarity(text, 'first_name'),
+                                        TrigramWordSimilarity(text, 'username')))
+                .order_by('-rank', 'id')
+                .values('id', 'username', 'first_name', 'last_name', 'group__name')[:limit])
+        return [{
+            'id': row['id'],
+            'username': row['username'],
+            'name': f"{row['last_name']} {row['first_name']}".strip() or row['username'],
+            'group': row['group__name'],
+        } for row in rows]
+
+    return _with_layout_fallback(search, query)
+
+
+def search_parents(query, city_id=None, limit=LIMIT):
+    """Родители учеников города по ФИО"""
+    parents = Parent.objects.all()
+    if city_id:
+        parents = parents.filter(id__in=User.objects.filter(city_id=city_id, parent__isnull=False).values('parent_id'))
+
+    def search(text):
+        text = normalize(text)
+        rows = (parents
+                .filter(full_name__trigram_word_similar=text)
+                .annotate(rank=TrigramWordSimilarity(text, 'full_name'))
+                .order_by('-rank', 'id')
+                .values('id', 'full_name', 'phone')[:limit])
+        return [{'id': row['id'], 'name': row['full_name'], 'phone': row['phone']} for row in rows]
+
+    return _with_layout_fallback(search, query)
@@ -1,6 +1,8 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from .models import User, Profile
+from . import catalog, images, search
+from .models import User, Profile, Product, ProductCategory
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -8,5 +10,38 @@ def create_user_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+def save_user_profile(sender, instance, created, **kwargs):
+    # Баланс меняется только через core.ledger: повторный save() профиля
+    # записал бы устаревшее значение astrocoins поверх свежего
+    if not created:
+        Profile.objects.get_or_create(user=instance)
+
+@receiver(post_save, sender=Product)
+def refresh_product_images(sender, instance, **kwargs):
+    # Новый или заменённый файл изображения — пересоздаём уменьшенные копии
+    # Обработчик стоит до invalidate_shop_catalog: сетка магазина сбросится уже с новыми копиями
+    if not kwargs.get('raw'):
+        images.refresh_variants(instance)
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, update_fields=None, **kwargs):
+    # Документ поиска зависит только от названия, описания и категории
+    if update_fields is None or {'name', 'description', 'category'} & set(update_fields):
+        search.index_products(Product.objects.filter(pk=instance.pk))
+
+@receiver(post_save, sender=ProductCategory)
+def index_category_products(sender, instance, created, **kwargs):
+    # Название категории входит в документ поиска её товаров
+    if not created:
+        search.index_products(Product.objects.filter(category=instance))
+
+@receiver(post_delete, sender=Product)
+def delete_product_images(sender, instance, **kwargs):
+    variants = instance.image_variants or {}
+    transaction.on_commit(lambda: images.delete_variants(variants))
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductCategory)
+def invalidate_shop_catalog(sender, instance, **kwargs):
+    # Закешированная сетка магазина города устарела
+    catalog.invalidate(instance.city_id)
@@ -0,0 +1,77 @@
+"""
+Уникальные slug для товаров и категорий.
+
+Занятые slug с тем же началом читаются одним запросом (LIKE 'base%' по
+индексу _like, который Django создаёт для уникального SlugField), а
+свободный номер подбирается в памяти: «stiker», «stiker-1», «stiker-2»...
+Для импорта allocate_slugs выдаёт slug сразу всей пачке названий за один
+запрос, и одинаковые названия внутри пачки тоже получают разные номера.
+"""
+from django.db.models import Q
+
+from .models import create_cyrillic_slug
+
+# Место под «-N» при обрезке длинного slug до max_length поля
+SUFFIX_RESERVE = 11
+
+
+def _prefix(base, max_length):
+    # Все кандидаты для base (в том числе обрезанные под номер) начинаются с этого префикса
+    return base[:max_length - SUFFIX_RESERVE]
+
+
+def _candidate(base, counter, max_length):
+    if not counter:
+        return base[:max_length]
+    suffix = f'-{counter}'
+    return base[:max_length - len(suffix)].rstrip('-') + suffix
+
+
+def allocate_slugs(model, names, exclude_pk=None):
+    """
+    Список уникальных slug для названий names (в том же порядке).
+    Читает занятые slug модели model одним запросом; exclude_pk — запись,
+    чей собственный slug занятым не считается.
+    """
+    max_length = model._meta.get_field('slug').max_length
+    bases = [create_cyrillic_slug(name) for name in names]
+    if not bases:
+        return []
+
+    prefixes = {_prefix(base, max_length) for base in bases}
+    condition = Q()
+    for prefix in prefixes:
+        condition |= Q(slug__startswith=prefix)
+    existing = model.objects.filter(condition)
+    if exclude_pk is not None:
+        existing = existing.exclude(pk=exclude_pk)
+    taken = set(existing.values_list('slug', flat=True))
+
+    slugs = []
+    next_counter = {}
+    for base in bases:
+        counter = next_counter.get(base, 0)
+        slug = _candidate(base, counter, max_length)
+        while slug in taken:
+            counter += 1
+            slug = _candidate(base, counter, max_length)
+        taken.add(slug)
+        next_counter[base] = counter + 1
+        slugs.append(slug)
+    return slugs
+
+
+def allocate_slug(model, name, exclude_pk=None):
+    """Уникальный slug для одного названия"""
+    return allocate_slugs(model, [name], exclude_pk=exclude_pk)[0]
+
+
+def slugs_for_new(model, names):
+    """
+    {название: slug} для названий из names, которых ещё нет среди записей
+    model (поиск по полю name). Два запроса на всю пачку импорта.
+    """
+    names = list(dict.fromkeys(names))
+    existing = set(model.objects.filter(name__in=names).values_list('name', flat=True))
+    new_names = [name for name in names if name not in existing]
+    return dict(zip(new_names, allocate_slugs(model, new_names)))
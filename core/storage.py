@@ -0,0 +1,56 @@
+"""
+Хранилище изображений товаров с адресацией по содержимому.
+
+Файл сохраняется под именем из SHA-256 своего содержимого:
+products/blobs/ab/ab12…ef.jpg. Одна и та же картинка у товаров разных
+городов или при повторном импорте хранится (и попадает в резервную копию)
+один раз: повторная загрузка возвращает имя уже существующего файла.
+Ссылки на файлы — значения Product.image; файлы, на которые никто не
+ссылается, удаляет команда gc_media.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+
+BLOBS_DIR = 'products/blobs'
+
+# Одинаковое содержимое с разными написаниями расширения — один файл
+EXTENSION_ALIASES = {'.jpeg': '.jpg', '.jpe': '.jpg'}
+
+
+def content_hash(content):
+    """SHA-256 содержимого файла (читается кусками, позиция сбрасывается)"""
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def blob_name(digest, original_name):
+    extension = os.path.splitext(original_name)[1].lower()
+    extension = EXTENSION_ALIASES.get(extension, extension)
+    return f'{BLOBS_DIR}/{digest[:2]}/{digest}{extension}'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def _save(self, name, content):
+        name = blob_name(content_hash(content), name)
+        if self.exists(name):
+            # Такое содержимое уже хранится — новый файл не пишем. Время изменения
+            # обновляем: иначе gc_media может удалить старый файл без ссылок раньше,
+            # чем товар с новой ссылкой на него будет сохранён
+            os.utime(self.path(name))
+            return name
+        return super()._save(name, content)
+
+
+product_images = ContentAddressedStorage()
+
+
+def get_product_image_storage():
+    return product_images
@@ -0,0 +1,37 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+register = template.Library()
+
+# Карточка товара занимает 1/4 ширины на больших экранах, 1/3 на средних и всю ширину на телефоне
+PRODUCT_CARD_SIZES = '(min-width: 992px) 25vw, (min-width: 768px) 33vw, 100vw'
+
+
+def _srcset(items):
+    return ', '.join(f'{default_storage.url(name)} {width}w' for width, name in items)
+
+
+@register.simple_tag
+def product_picture(product, sizes=PRODUCT_CARD_SIZES, css_class='', style=''):
+    """
+    <picture> с WebP и JPEG нужной ширины из product.image_variants.
+    Если копий ещё нет, выводит оригинал, как раньше.
+    """
+    variants = product.image_variants or {}
+    if not variants.get('jpeg'):
+        return format_html('<img src="{}" class="{}" alt="{}" style="{}" loading="lazy">',
+                           product.image.url, css_class, product.name, style)
+
+    smallest = variants['jpeg'][0]
+    height = round(variants['height'] * smallest[0] / variants['width'])
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" class="{}" alt="{}" style="{}" '
+        'loading="lazy" decoding="async">'
+        '</picture>',
+        _srcset(variants['webp']), sizes,
+        default_storage.url(smallest[1]), _srcset(variants['jpeg']), sizes,
+        smallest[0], height, css_class, product.name, style,
+    )
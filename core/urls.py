@@ -11,10 +11,18 @@ urlpatterns = [
     path('shop/category/delete/', views.delete_category, name='delete_category'),
     path('api/product/<int:product_id>/', views.get_product, name='get_product'),
     path('api/category/<int:category_id>/', views.get_category, name='get_category'),
+    path('api/products/', views.get_products, name='get_products'),
+    path('api/categories/', views.get_categories, name='get_categories'),
+    path('api/search/', views.search_autocomplete, name='search_autocomplete'),
     path('api/product/<int:product_id>/delete/', views.delete_product, name='delete_product'),
     path('api/purchase/<int:purchase_id>/deliver/', views.mark_purchase_delivered, name='mark_purchase_delivered'),
     path('api/purchase/<int:purchase_id>/undeliver/', views.mark_purchase_not_delivered, name='mark_purchase_not_delivered'),
+    path('api/purchases/deliver/', views.mark_purchases_delivered, name='mark_purchases_delivered'),
     path('purchase/<int:product_id>/', views.purchase_product, name='purchase_product'),
+    path('cart/', views.cart_view, name='cart'),
+    path('cart/add/<int:product_id>/', views.cart_add, name='cart_add'),
+    path('cart/update/<int:product_id>/', views.cart_update, name='cart_update'),
+    path('cart/checkout/', views.cart_checkout, name='cart_checkout'),
     path('transfer/', views.transfer_coins, name='transfer_coins'),
     path('profile/', views.profile, name='profile'),
     path('profile/edit/', views.profile_edit, name='profile_edit'),
@@ -23,6 +31,8 @@ urlpatterns = [
     path('groups/', views.groups, name='groups'),
     path('news/', views.news, name='news'),
     path('activity-monitoring/', views.activity_monitoring, name='activity_monitoring'),
+    path('pickup/', views.pickup_list, name='pickup_list'),
+    path('pickup/export/', views.pickup_list_export, name='pickup_list_export'),
     path('user-management/', views.user_management, name='user_management'),
     path('student/<int:student_id>/coins/', views.manage_coins, name='manage_coins'),
     path('student/<int:student_id>/profile/', views.student_profile, name='student_profile'),
@@ -1,14 +1,25 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Sum, Q
+from django.db.models import Count, Max, Sum, Q
 from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
 from .models import Profile, Transaction, Product, Purchase, Group, AwardReason, CoinAward, ProductCategory, Parent, City, School, Course
+from . import balances, catalog, fulfilment, gifts, ledger, recommendations, search
+from .awards import award_students, SKIP_COOLDOWN
+from .purchases import buy_product, checkout, OutOfStock, PriceChanged
+from .cart import Cart, MAX_ITEMS, MAX_QUANTITY
+from .pagination import paginate, estimate_count
+from .idempotency import idempotent
+from .conditional import conditional_json, make_etag, parse_ids
 # from decimal import Decimal - больше не нужен, используем int
 from django.contrib.auth.forms import UserChangeForm
 from django.contrib.auth import get_user_model
 from .forms import ParentForm, StudentParentLinkForm, CreateParentWithStudentForm, CityForm, SchoolForm, CourseForm, GroupForm, QuickCourseForm
+from urllib.parse import urlencode
+import csv
 import random
 
 User = get_user_model()
@@ -39,75 +50,27 @@ GAME_BACKGROUNDS = [
 
 @login_required
 def dashboard(request):
-    profile = Profile.objects.get_or_create(user=request.user)[0]
-    transactions = Transaction.objects.filter(
-        Q(sender=request.user) | Q(receiver=request.user)
-    ).order_by('-created_at')[:15]
+    transactions = Transaction.objects.feed(request.user, 15)
     
     # Выбираем случайный фон при каждом входе
     random_background = random.choice(GAME_BACKGROUNDS)
     
-    # Проверяем день рождения для учеников
+    # День рождения: подарок выдаёт команда grant_birthday_gifts, здесь только читаем выданную сумму
     is_birthday = False
-    birthday_coins_awarded = False
+    birthday_gift_amount = None
     
     if request.user.role == 'student' and request.user.birth_date:
-        from datetime import date
-        today = date.today()
-        
-        # Проверяем, сегодня ли день рождения (день и месяц)
-        if (today.day == request.user.birth_date.day and 
-            today.month == request.user.birth_date.month):
-            is_birthday = True
-            
-            # Проверяем, были ли уже начислены монеты за этот день рождения
-            birthday_award_today = Transaction.objects.filter(
-                receiver=request.user,
-                transaction_type='EARN',
-                description__icontains='BIRTHDAY_GIFT',
-                created_at__date=today
-            ).exists()
-            
-            # Дополнительная проверка через сессию (защита от быстрых перезагрузок)
-            session_key = f'birthday_gift_{request.user.id}_{today.strftime("%Y-%m-%d")}'
-            session_gift_given = request.session.get(session_key, False)
-            
-            # Если монеты еще не начислены - начисляем автоматически
-            if not birthday_award_today and not session_gift_given:
-                try:
-                    # Устанавливаем флаг в сессии ПЕРЕД начислением
-                    request.session[session_key] = True
-                    
-                    # Начисляем 100 астрокоинов
-                    profile.astrocoins += 100
-                    profile.save()
-                    
-                    # Создаем запись о транзакции с уникальным маркером
-                    Transaction.objects.create(
-                        sender=request.user,  # Указываем отправителя (системный подарок)
-                        receiver=request.user,
-                        amount=100,
-                        transaction_type='EARN',
-                        description=f'🎉 BIRTHDAY_GIFT: Поздравляем с днём рождения! Подарок от Астро-Маркета'
-                    )
-                    
-                    birthday_coins_awarded = True
-                    messages.success(request, '🎉 С днём рождения! Вам начислено 100 астрокоинов в подарок!')
-                    
-                except Exception as e:
-                    # Убираем флаг из сессии если произошла ошибка
-                    request.session.pop(session_key, None)
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.error(f'Ошибка при начислении монет за день рождения пользователю {request.user.username}: {str(e)}')
+        today = timezone.localdate()
+        is_birthday = gifts.is_birthday(request.user.birth_date, today)
+        if is_birthday:
+            birthday_gift_amount = gifts.birthday_gift_amount(request.user, today.year)
     
     context = {
-        'profile': profile,
         'transactions': transactions,
         'background_image': random_background['url'],
         'background_name': random_background['name'],
         'is_birthday': is_birthday,
-        'birthday_coins_awarded': birthday_coins_awarded,
+        'birthday_gift_amount': birthday_gift_amount,
     }
     return render(request, 'core/dashboard.html', context)
 
@@ -119,31 +82,18 @@ def shop(request):
     if request.user.is_teacher() and not request.user.is_superuser:
         raise PermissionDenied("Преподаватели не могут совершать покупки в магазине")
     
-    # Получаем категории в зависимости от роли
-    if hasattr(request.user, 'city') and request.user.city:
-        # Показываем только категории из города пользователя
-        categories = ProductCategory.objects.filter(city=request.user.city).order_by('order')
-    else:
-        # Если у пользователя нет города (главный суперадмин) - видит все
-        categories = ProductCategory.objects.all().order_by('order')
-    
-    # Фильтруем товары в каждой категории по городу пользователя
-    for category in categories:
-        # Товары уже привязаны к тому же городу что и категория
-        category.filtered_products = category.products.filter(
-            city=category.city
-        ).order_by('-featured', '-created_at')
-    
-    # Убираем категории без товаров ТОЛЬКО для учеников
-    # Администраторы должны видеть все категории, чтобы добавлять в них товары
-    if request.user.role == 'student':
-        categories = [cat for cat in categories if cat.filtered_products.exists()]
+    # Категории для форм администратора; запрос выполнится, только если формы выводятся
+    categories = ProductCategory.objects.order_by('order')
+    if request.user.city_id:
+        categories = categories.filter(city_id=request.user.city_id)
     
     # Добавляем случайный фон и для магазина
     random_background = random.choice(GAME_BACKGROUNDS)
     
     context = {
         'categories': categories,
+        'catalog_html': catalog.catalog_html(request.user),
+        'cart_count': len(Cart(request.session)),
         'background_image': random_background['url'],
         'background_name': random_background['name'],
     }
@@ -226,35 +176,99 @@ def edit_product(request):
         
         return redirect('shop')
 
+def _city_denied(user, city_id):
+    # Администратор города получает только данные своего города
+    return user.role == 'city_admin' and user.city_id and city_id != user.city_id
+
+def _product_data(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'description': product.description,
+        'price': str(product.price),
+        'stock': product.stock,
+        'category': product.category_id,
+        'is_digital': product.is_digital,
+        'featured': product.featured,
+        'city': product.city_id,  # ID города товара
+        'city_name': product.city.name if product.city else 'Без города'  # Название города
+    }
+
 @login_required
 def get_product(request, product_id):
     if not (request.user.is_superuser or request.user.role == 'city_admin'):
         raise PermissionDenied("Только администраторы могут получать данные товаров")
     
-    try:
-        product = Product.objects.get(id=product_id)
-        
-        # Проверяем права доступа - администратор может получать только товары своего города
-        if (request.user.role == 'city_admin' and 
-            hasattr(request.user, 'city') and request.user.city and 
-            product.city != request.user.city):
-            return JsonResponse({'error': 'Доступ запрещен'}, status=403)
-        
-        data = {
-            'id': product.id,
-            'name': product.name,
-            'description': product.description,
-            'price': str(product.price),
-            'stock': product.stock,
-            'category': product.category_id if product.category else None,
-            'is_digital': product.is_digital,
-            'featured': product.featured,
-            'city': product.city.id if product.city else None,  # ID города товара
-            'city_name': product.city.name if product.city else 'Без города'  # Название города
-        }
-        return JsonResponse(data)
-    except Product.DoesNotExist:
+    # Штамп версии без чтения всего товара; при совпадении ETag — 304
+    stamp = Product.objects.filter(id=product_id).values_list('updated_at', 'city_id', 'city__name').first()
+    if stamp is None:
         return JsonResponse({'error': 'Товар не найден'}, status=404)
+    if _city_denied(request.user, stamp[1]):
+        return JsonResponse({'error': 'Доступ запрещен'}, status=403)
+    
+    return conditional_json(
+        request,
+        make_etag('product', product_id, *stamp),
+        lambda: _product_data(Product.objects.select_related('city').get(id=product_id)),
+    )
+
+@login_required
+def get_products(request):
+    """Несколько товаров одним запросом: /api/products/?ids=1,2,3"""
+    if not (request.user.is_superuser or request.user.role == 'city_admin'):
+        raise PermissionDenied("Только администраторы могут получать данные товаров")
+    try:
+        ids = parse_ids(request.GET.get('ids', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Неверный список товаров'}, status=400)
+    
+    products = Product.objects.filter(id__in=ids)
+    if request.user.role == 'city_admin' and request.user.city_id:
+        products = products.filter(city_id=request.user.city_id)
+    stamp = products.aggregate(count=Count('id'), updated=Max('updated_at'))
+    
+    def build():
+        found = {product.id: product for product in products.select_related('city')}
+        return {'products': [_product_data(found[product_id]) for product_id in ids if product_id in found]}
+    
+    return conditional_json(request, make_etag('products', ids, stamp['count'], stamp['updated']), build)
+
+# Короткое кеширование подсказок в браузере: повтор того же запроса при наборе не доходит до сервера
+SEARCH_MAX_AGE = 60
+
+@login_required
+def search_autocomplete(request):
+    """
+    Подсказки поиска в JSON для города пользователя.
+    type=products (по умолчанию) доступен всем, students — преподавателям
+    (только ученики их групп) и администраторам, parents — администраторам.
+    """
+    query = request.GET.get('q', '').strip()[:100]
+    kind = request.GET.get('type', 'products')
+    user = request.user
+
+    if kind == 'products':
+        find = search.search_products
+    elif kind == 'students' and (user.is_superuser or user.role in ('teacher', 'city_admin')):
+        find = search.search_students
+    elif kind == 'parents' and (user.is_superuser or user.role == 'city_admin'):
+        find = search.search_parents
+    else:
+        return JsonResponse({'error': 'Доступ запрещен'}, status=403)
+
+    scope = {'city_id': user.city_id}
+    if find is search.search_students and user.role == 'teacher' and not user.is_superuser:
+        # Обычный учитель видит только своих учеников
+        scope['teacher'] = user
+
+    results = []
+    if len(query) >= search.MIN_QUERY_LENGTH:
+        # Суперадмин без города ищет по всем городам
+        results = find(query, **scope)
+
+    response = JsonResponse({'query': query, 'results': results})
+    patch_cache_control(response, private=True, max_age=SEARCH_MAX_AGE)
+    return response
 
 @login_required
 def delete_product(request, product_id):
@@ -275,6 +289,7 @@ def delete_product(request, product_id):
         return JsonResponse({'status': 'ok'})
 
 @login_required
+@idempotent
 def purchase_product(request, product_id):
     if request.method != 'POST':
         return redirect('shop')
@@ -306,65 +321,113 @@ def purchase_product(request, product_id):
         messages.error(request, 'Товар закончился на складе!')
         return redirect('shop')
     
-    profile = Profile.objects.get(user=request.user)
-    
     # Дополнительная валидация цены
     if product.price <= 0:
         messages.error(request, 'Некорректная цена товара!')
         return redirect('shop')
     
-    if profile.astrocoins < product.price:
+    # Остаток резервируется условным UPDATE в конце транзакции, без блокировки товара на весь запрос
+    try:
+        buy_product(request.user, product)
+    except OutOfStock:
+        messages.error(request, 'Товар закончился на складе!')
+        return redirect('shop')
+    except PriceChanged:
+        messages.error(request, 'Цена товара изменилась, проверьте её и повторите покупку')
+        return redirect('shop')
+    except ledger.InsufficientFunds:
         messages.error(request, 'Недостаточно AstroCoins для покупки!')
         return redirect('shop')
     
-    # Используем транзакцию базы данных для атомарности
-    with transaction.atomic():
-        # Повторно проверяем наличие и блокируем товар
-        product = Product.objects.select_for_update().get(id=product_id, available=True)
-        
-        if product.stock <= 0:
-            messages.error(request, 'Товар закончился на складе!')
-            return redirect('shop')
-        
-        # Повторно проверяем баланс пользователя
-        profile = Profile.objects.select_for_update().get(user=request.user)
-        
-        if profile.astrocoins < product.price:
-            messages.error(request, 'Недостаточно AstroCoins для покупки!')
-            return redirect('shop')
-        
-        # Создаем транзакцию покупки
-        Purchase.objects.create(
-            user=request.user,
-            product=product,
-            total_price=product.price
-        )
-        
-        # Списываем AstroCoins
-        profile.astrocoins -= product.price
-        profile.save()
-        
-        # Уменьшаем количество товара на складе
-        product.stock -= 1
-        product.save()
-        
-        # Записываем транзакцию
-        Transaction.objects.create(
-            sender=request.user,
-            receiver=request.user,  # В случае покупки отправитель и получатель совпадают
-            amount=product.price,
-            transaction_type='SPEND',
-            description=f'Покупка {product.name}'
-        )
-    
     messages.success(request, f'Вы успешно приобрели {product.name}!')
     return redirect('shop')
 
+def _cart_city_id(user):
+    # Ученик покупает только товары своего города
+    return user.city_id if user.is_student() else None
+
+@login_required
+def cart_view(request):
+    if request.user.is_teacher() and not request.user.is_superuser:
+        raise PermissionDenied("Преподаватели не могут совершать покупки в магазине")
+    
+    lines = Cart(request.session).lines(_cart_city_id(request.user))
+    items = [{'product': product, 'quantity': quantity, 'total': product.price * quantity}
+             for product, quantity in lines]
+    context = {
+        'items': items,
+        'total': sum(item['total'] for item in items),
+        'max_quantity': MAX_QUANTITY,
+        # «С этим также покупают» — готовые списки из core.recommendations
+        'also_bought': recommendations.also_bought([product.id for product, _ in lines], _cart_city_id(request.user)),
+    }
+    return render(request, 'core/cart.html', context)
+
+@login_required
+def cart_add(request, product_id):
+    if request.method != 'POST':
+        return redirect('shop')
+    if request.user.is_teacher() and not request.user.is_superuser:
+        return JsonResponse({'success': False, 'error': 'Преподаватели не могут совершать покупки в магазине'}, status=403)
+    
+    products = Product.objects.filter(id=product_id, available=True)
+    city_id = _cart_city_id(request.user)
+    if city_id:
+        products = products.filter(city_id=city_id)
+    if not products.exists():
+        return JsonResponse({'success': False, 'error': 'Товар недоступен'}, status=404)
+    
+    cart = Cart(request.session)
+    if not cart.add(product_id):
+        return JsonResponse({'success': False, 'error': f'В корзине может быть не больше {MAX_ITEMS} разных товаров'})
+    return JsonResponse({'success': True, 'count': len(cart)})
+
+@login_required
+def cart_update(request, product_id):
+    if request.method == 'POST':
+        try:
+            quantity = int(request.POST.get('quantity', 0))
+        except ValueError:
+            quantity = 0
+        Cart(request.session).set(product_id, quantity)
+    return redirect('cart')
+
+@login_required
+@idempotent
+def cart_checkout(request):
+    if request.method != 'POST':
+        return redirect('cart')
+    if request.user.is_teacher() and not request.user.is_superuser:
+        messages.error(request, 'Преподаватели не могут совершать покупки в магазине!')
+        return redirect('shop')
+    
+    cart = Cart(request.session)
+    lines = cart.lines(_cart_city_id(request.user))
+    if not lines:
+        messages.error(request, 'Корзина пуста')
+        return redirect('cart')
+    
+    # Одна транзакция на всю корзину: одно списание, одна запись журнала
+    try:
+        orders = checkout(request.user, lines)
+    except (OutOfStock, PriceChanged) as error:
+        messages.error(request, f'{error}. Проверьте корзину и повторите оформление')
+        return redirect('cart')
+    except ledger.InsufficientFunds:
+        messages.error(request, 'Недостаточно AstroCoins для оформления корзины!')
+        return redirect('cart')
+    
+    cart.clear()
+    total = sum(order.total_price for order in orders)
+    messages.success(request, f'Заказ оформлен: {sum(order.quantity for order in orders)} шт. на {total:.0f} AC')
+    return redirect('shop')
+
 from django.http import JsonResponse
 from django.db import transaction
 from django.template.loader import render_to_string
 
 @login_required
+@idempotent
 def transfer_coins(request):
     if request.method == 'POST':
         receiver_username = request.POST.get('receiver')
@@ -377,67 +440,40 @@ def transfer_coins(request):
             if amount < 20:
                 return JsonResponse({'success': False, 'error': 'Минимальная сумма перевода: 20 AC'})
             
-            with transaction.atomic():
-                receiver = User.objects.select_for_update().get(username=receiver_username)
-                sender_profile = Profile.objects.select_for_update().get(user=request.user)
-                receiver_profile = Profile.objects.select_for_update().get(user=receiver)
-                
-                if receiver == request.user:
-                    return JsonResponse({'success': False, 'error': 'Нельзя переводить AstroCoins самому себе!'})
-                
-                # Рассчитываем комиссию 5% за перевод
-                commission = int(amount * 0.05)  # 5% комиссия, округляем до целого
-                total_cost = amount + commission  # Общая сумма к списанию
-                
-                if sender_profile.astrocoins < total_cost:
-                    return JsonResponse({
-                        'success': False, 
-                        'error': f'Недостаточно AstroCoins! Нужно {total_cost} AC (перевод {amount} AC + комиссия {commission} AC)'
-                    })
-                
-                # Выполняем перевод с комиссией
-                sender_profile.astrocoins -= total_cost  # Списываем сумму + комиссию
-                receiver_profile.astrocoins += amount    # Получатель получает только основную сумму
-                
-                sender_profile.save()
-                receiver_profile.save()
-                
-                # Записываем транзакцию для отправителя (с комиссией)
-                Transaction.objects.create(
-                    sender=request.user,
-                    receiver=receiver,
-                    amount=total_cost,
-                    transaction_type='TRANSFER',
-                    description=f'Перевод к {receiver_username} ({amount} AC + комиссия {commission} AC)'
-                )
-                
-                # Записываем транзакцию для получателя (без комиссии)
-                Transaction.objects.create(
-                    sender=request.user,
-                    receiver=receiver,
-                    amount=amount,
-                    transaction_type='TRANSFER',
-                    description=f'Перевод от {request.user.username}'
-                )
+            receiver = User.objects.get(username=receiver_username)
+            
+            if receiver == request.user:
+                return JsonResponse({'success': False, 'error': 'Нельзя переводить AstroCoins самому себе!'})
+            
+            # Рассчитываем комиссию 5% за перевод
+            commission = int(amount * 0.05)  # 5% комиссия, округляем до целого
+            total_cost = amount + commission  # Общая сумма к списанию
+            
+            # Списываем сумму + комиссию, получатель получает только основную сумму
+            try:
+                outgoing, incoming = ledger.transfer(request.user, receiver, amount, commission=commission)
+            except ledger.InsufficientFunds:
+                return JsonResponse({
+                    'success': False, 
+                    'error': f'Недостаточно AstroCoins! Нужно {total_cost} AC (перевод {amount} AC + комиссия {commission} AC)'
+                })
+            
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                # Создаем HTML для новой транзакции
+                transaction_html = render_to_string('core/transaction_item.html', {
+                    'transaction': outgoing,
+                    'user': request.user
+                })
                 
-                if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                    # Создаем HTML для новой транзакции
-                    transaction_html = render_to_string('core/transaction_item.html', {
-                        'transaction': Transaction.objects.filter(
-                            Q(sender=request.user) | Q(receiver=request.user)
-                        ).latest('created_at'),
-                        'user': request.user
-                    })
-                    
-                    return JsonResponse({
-                        'success': True,
-                        'message': f'Успешно переведено {amount} AC пользователю {receiver_username}! Комиссия: {commission} AC',
-                        'new_balance': str(sender_profile.astrocoins),
-                        'transaction_html': transaction_html
-                    })
-                else:
-                    messages.success(request, f'Успешно переведено {amount} AC пользователю {receiver_username}! Списано: {total_cost} AC (включая комиссию {commission} AC)')
-                    return redirect('dashboard')
+                return JsonResponse({
+                    'success': True,
+                    'message': f'Успешно переведено {amount} AC пользователю {receiver_username}! Комиссия: {commission} AC',
+                    'new_balance': str(outgoing.balance_after),
+                    'transaction_html': transaction_html
+                })
+            else:
+                messages.success(request, f'Успешно переведено {amount} AC пользователю {receiver_username}! Списано: {total_cost} AC (включая комиссию {commission} AC)')
+                return redirect('dashboard')
                 
         except User.DoesNotExist:
             error_message = 'Получатель не найден!'
@@ -455,20 +491,16 @@ def transfer_coins(request):
 @login_required
 def profile(request):
     profile = Profile.objects.get(user=request.user)
-    transactions = Transaction.objects.filter(
-        Q(sender=request.user) | Q(receiver=request.user)
-    ).order_by('-created_at')
-    purchases = Purchase.objects.filter(user=request.user).order_by('-created_at')
     
-    # Пагинация для транзакций
-    transactions_paginator = Paginator(transactions, 10)
-    transactions_page = request.GET.get('transactions_page')
-    transactions = transactions_paginator.get_page(transactions_page)
-    
-    # Пагинация для покупок
-    purchases_paginator = Paginator(purchases, 10)
-    purchases_page = request.GET.get('purchases_page')
-    purchases = purchases_paginator.get_page(purchases_page)
+    # Пагинация по курсору: любая страница стоит как первая, без COUNT(*) и OFFSET
+    transactions = Transaction.objects.history_page(
+        request.user, request.GET.get('transactions_cursor'), 10
+    )
+    purchases = paginate(
+        Purchase.objects.filter(user=request.user).select_related('product'),
+        request.GET.get('purchases_cursor'),
+        10
+    )
     
     context = {
         'profile': profile,
@@ -660,19 +692,15 @@ def groups(request):
                 
                 try:
                     student = User.objects.get(id=student_id, role='student')
-                    student_profile = Profile.objects.get(user=student)
                     
                     # Начисляем AstroCoins
-                    student_profile.astrocoins += amount
-                    student_profile.save()
-                    
-                    # Создаем транзакцию
-                    Transaction.objects.create(
+                    ledger.credit(
+                        student,
+                        amount,
                         sender=request.user,
-                        receiver=student,
-                        amount=amount,
-                        transaction_type='EARN',
-                        description=f'Награда от преподавателя: {reason}'
+                        kind=Transaction.KIND_BONUS,
+                        description=f'Награда от преподавателя: {reason}',
+                        metadata={'reason': reason},
                     )
                     
                     messages.success(request, f'Успешно начислено {amount} AstroCoins ученику {student.username}')
@@ -697,36 +725,19 @@ def groups(request):
                         return redirect('groups')
                     
                     # Получаем всех учеников группы
-                    students = group.students.filter(role='student')
+                    students = list(group.students.filter(role='student'))
                     
-                    if not students.exists():
+                    if not students:
                         messages.warning(request, 'В группе нет учеников для начисления')
                         return redirect('groups')
                     
-                    # Начисляем астрокоины каждому ученику
-                    import logging
-                    logger = logging.getLogger(__name__)
+                    # Начисляем астрокоины всей группе одним пакетом
+                    result = award_students(students, request.user, reason, comment)
                     
-                    awards_count = 0
-                    for student in students:
-                        try:
-                            logger.info(f"Групповое начисление: student_id={student.id}, teacher_id={request.user.id}, reason_id={reason.id}, amount={reason.coins}")
-                            
-                            award = CoinAward.objects.create(
-                                student=student,
-                                teacher=request.user,
-                                reason=reason,
-                                amount=reason.coins,
-                                comment=comment
-                            )
-                            awards_count += 1
-                            logger.info(f"Групповая награда создана: award_id={award.id} для student_id={student.id}")
-                            
-                        except Exception as e:
-                            logger.error(f"Ошибка при групповом начислении для student_id={student.id}: {e}")
-                            messages.error(request, f'Ошибка при начислении ученику {student.get_full_name() or student.username}: {str(e)}')
+                    for student, code in result.skipped:
+                        messages.warning(request, f'{student.get_full_name() or student.username}: {result.skip_message(code)}')
                     
-                    messages.success(request, f'Успешно начислено {reason.coins} AC каждому из {awards_count} учеников группы "{group.name}"')
+                    messages.success(request, f'Успешно начислено {reason.coins} AC каждому из {result.awarded_count} учеников группы "{group.name}"')
                     
                 except Group.DoesNotExist:
                     messages.error(request, 'Группа не найдена')
@@ -751,27 +762,13 @@ def groups(request):
                         messages.error(request, 'У вас нет прав для начисления астрокоинов этому ученику')
                         return redirect('groups')
                     
-                    # Создаем награду
-                    import logging
-                    logger = logging.getLogger(__name__)
+                    # Создаем награду с теми же проверками, что и для группы
+                    result = award_students([student], request.user, reason, comment)
                     
-                    try:
-                        logger.info(f"Создание награды: student_id={student.id}, teacher_id={request.user.id}, reason_id={reason.id}, amount={reason.coins}")
-                        
-                        award = CoinAward.objects.create(
-                            student=student,
-                            teacher=request.user,
-                            reason=reason,
-                            amount=reason.coins,
-                            comment=comment
-                        )
-                        
-                        logger.info(f"Награда создана успешно: award_id={award.id}")
+                    if result.skipped:
+                        messages.error(request, f'Ошибка при начислении: {result.skip_message(result.skipped[0][1])}')
+                    else:
                         messages.success(request, f'Успешно начислено {reason.coins} AC ученику {student.get_full_name() or student.username}')
-                        
-                    except Exception as e:
-                        logger.error(f"Ошибка при создании награды: {e}")
-                        messages.error(request, f'Ошибка при начислении: {str(e)}')
                     
                 except User.DoesNotExist:
                     messages.error(request, 'Ученик не найден')
@@ -887,6 +884,7 @@ def news(request):
     return render(request, 'core/news.html')
 
 @login_required
+@idempotent
 def manage_coins(request, student_id):
     if not request.user.is_teacher():
         raise PermissionDenied("Только преподаватели могут управлять астрокоинами")
@@ -930,39 +928,18 @@ def manage_coins(request, student_id):
                     messages.error(request, 'Слишком большая сумма для одного начисления!')
                     return redirect('manage_coins', student_id=student_id)
                 
-                # Проверяем ограничение по времени
-                if reason.cooldown_days > 0:
-                    last_award = CoinAward.objects.filter(
-                        student=student,
-                        reason=reason,
-                        created_at__gte=timezone.now() - timedelta(days=reason.cooldown_days)
-                    ).first()
-                    
-                    if last_award:
-                        messages.error(request, f'Эту награду можно выдать только раз в {reason.cooldown_days} дней')
-                        return redirect('manage_coins', student_id=student_id)
-                
-                # Проверяем лимит начислений в день (защита от спама)
-                today_awards = CoinAward.objects.filter(
-                    student=student,
-                    teacher=request.user,
-                    created_at__date=timezone.now().date()
-                ).count()
+                # Ограничение по времени и дневной лимит проверяются вместе с начислением
+                result = award_students([student], request.user, reason, comment)
                 
-                if today_awards >= 10:  # Максимум 10 начислений в день от одного учителя
-                    messages.error(request, 'Превышен дневной лимит начислений для этого ученика!')
+                if result.skipped:
+                    code = result.skipped[0][1]
+                    if code == SKIP_COOLDOWN:
+                        messages.error(request, f'Эту награду можно выдать только раз в {reason.cooldown_days} дней')
+                    else:
+                        messages.error(request, 'Превышен дневной лимит начислений для этого ученика!')
                     return redirect('manage_coins', student_id=student_id)
                 
-                # Используем транзакцию базы данных для атомарности
-                with transaction.atomic():
-                    award = CoinAward.objects.create(
-                        student=student,
-                        teacher=request.user,
-                        reason=reason,
-                        amount=reason.coins,
-                        comment=comment
-                    )
-                    messages.success(request, f'Начислено {reason.coins} AC ученику {student.get_full_name() or student.username}')
+                messages.success(request, f'Начислено {reason.coins} AC ученику {student.get_full_name() or student.username}')
                 
             except AwardReason.DoesNotExist:
                 messages.error(request, 'Причина не найдена')
@@ -1007,9 +984,7 @@ def student_profile(request, student_id):
     if not request.user.is_superuser and student.group.teacher != request.user:
         raise PermissionDenied("Вы можете просматривать только своих учеников")
     
-    transactions = Transaction.objects.filter(
-        Q(sender=student) | Q(receiver=student)
-    ).order_by('-created_at')
+    transactions = Transaction.objects.involving(student).select_related('sender').order_by('-created_at')
     
     purchases = Purchase.objects.filter(user=student).order_by('-created_at')
     awards = CoinAward.objects.filter(student=student).order_by('-created_at')
@@ -1032,14 +1007,16 @@ def activity_monitoring(request):
     group_filter = request.GET.get('group_filter', '')
     hide_delivered = request.GET.get('hide_delivered', '') == 'on'
     
-    # Определяем какие пользователи доступны для просмотра
+    # Определяем какие пользователи доступны для просмотра.
+    # Перевод — две записи журнала; показываем входящую, в ней сумма без комиссии.
+    # Переводы берутся за HOT_PERIOD, чтобы запрос читал только свежие секции журнала
     if request.user.is_superuser:
         if request.user.role == 'city_admin' and hasattr(request.user, 'city') and request.user.city:
             # Администратор города видит данные только своего города
             available_users = User.objects.filter(role='student', city=request.user.city).select_related('profile', 'group')
             purchases = Purchase.objects.filter(user__city=request.user.city).select_related('user', 'product', 'user__profile', 'user__group')
-            transfers = Transaction.objects.filter(
-                transaction_type='TRANSFER'
+            transfers = Transaction.objects.recent().filter(
+                kind=Transaction.KIND_TRANSFER_IN
             ).filter(
                 Q(sender__city=request.user.city) | Q(receiver__city=request.user.city)
             ).select_related('sender', 'receiver', 'sender__profile', 'receiver__profile', 'sender__group', 'receiver__group')
@@ -1048,14 +1025,14 @@ def activity_monitoring(request):
             # Главный суперадмин видит всех
             available_users = User.objects.filter(role='student').select_related('profile', 'group')
             purchases = Purchase.objects.all().select_related('user', 'product', 'user__profile', 'user__group')
-            transfers = Transaction.objects.filter(transaction_type='TRANSFER').select_related('sender', 'receiver', 'sender__profile', 'receiver__profile', 'sender__group', 'receiver__group')
+            transfers = Transaction.objects.recent().filter(kind=Transaction.KIND_TRANSFER_IN).select_related('sender', 'receiver', 'sender__profile', 'receiver__profile', 'sender__group', 'receiver__group')
             available_groups = Group.objects.all().order_by('name')
     else:
         # Обычный учитель видит только своих учеников
         available_users = User.objects.filter(role='student', group__teacher=request.user).select_related('profile', 'group')
         purchases = Purchase.objects.filter(user__group__teacher=request.user).select_related('user', 'product', 'user__profile', 'user__group')
-        transfers = Transaction.objects.filter(
-            transaction_type='TRANSFER'
+        transfers = Transaction.objects.recent().filter(
+            kind=Transaction.KIND_TRANSFER_IN
         ).filter(
             Q(sender__group__teacher=request.user) | Q(receiver__group__teacher=request.user)
         ).select_related('sender', 'receiver', 'sender__profile', 'receiver__profile', 'sender__group', 'receiver__group')
@@ -1072,80 +1049,135 @@ def activity_monitoring(request):
     if hide_delivered:
         purchases = purchases.filter(delivered=False)
     
-    # Сортировка по дате
-    purchases = purchases.order_by('-created_at')
-    transfers = transfers.order_by('-created_at')
+    # Общее количество — оценка планировщика (с кешем), а не COUNT(*) по всей выборке
+    purchases_count = estimate_count(purchases)
+    transfers_count = estimate_count(transfers)
     
-    # Пагинация для покупок
-    purchases_paginator = Paginator(purchases, 20)
-    purchases_page = request.GET.get('purchases_page')
-    purchases = purchases_paginator.get_page(purchases_page)
+    # Пагинация по курсору, сортировка по дате (created_at, id)
+    purchases = paginate(purchases, request.GET.get('purchases_cursor'), 20)
+    transfers = paginate(transfers, request.GET.get('transfers_cursor'), 20)
     
-    # Пагинация для переводов
-    transfers_paginator = Paginator(transfers, 20)
-    transfers_page = request.GET.get('transfers_page')
-    transfers = transfers_paginator.get_page(transfers_page)
+    # Фильтры сохраняются в ссылках пагинации
+    filter_params = {}
+    if group_filter:
+        filter_params['group_filter'] = group_filter
+    if hide_delivered:
+        filter_params['hide_delivered'] = 'on'
     
     context = {
         'available_users': available_users,
         'available_groups': available_groups,
         'purchases': purchases,
         'transfers': transfers,
+        'purchases_count': purchases_count,
+        'transfers_count': transfers_count,
+        'filter_query': urlencode(filter_params),
         'is_superuser': request.user.is_superuser,
         'group_filter': group_filter,
         'hide_delivered': hide_delivered,
     }
     return render(request, 'core/activity_monitoring.html', context)
 
-@login_required
-def mark_purchase_delivered(request, purchase_id):
-    """API endpoint для отметки товара как выданного"""
+def _mark_purchase(request, purchase_id, delivered):
     if not (request.user.is_superuser or request.user.is_teacher()):
         return JsonResponse({'success': False, 'error': 'Недостаточно прав'})
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Неверный метод запроса'})
     
-    if request.method == 'POST':
-        try:
-            purchase = Purchase.objects.get(id=purchase_id)
-            
-            # Проверяем права доступа: учитель может отмечать выдачу только для своих учеников
-            if not request.user.is_superuser:
-                if not (purchase.user.group and purchase.user.group.teacher == request.user):
-                    return JsonResponse({'success': False, 'error': 'Вы можете отмечать выдачу только для своих учеников'})
-            
-            purchase.mark_as_delivered()
-            return JsonResponse({'success': True})
-        except Purchase.DoesNotExist:
+    # Один UPDATE; покупки чужих учеников под него не попадают
+    if not fulfilment.set_delivered(request.user, [purchase_id], delivered):
+        if not Purchase.objects.filter(id=purchase_id).exists():
             return JsonResponse({'success': False, 'error': 'Покупка не найдена'})
-        except Exception as e:
-            return JsonResponse({'success': False, 'error': str(e)})
-    
-    return JsonResponse({'success': False, 'error': 'Неверный метод запроса'})
+        if not fulfilment.scope_purchases(request.user).filter(id=purchase_id).exists():
+            return JsonResponse({'success': False, 'error': 'Вы можете отмечать выдачу только для своих учеников'})
+    return JsonResponse({'success': True})
+
+@login_required
+def mark_purchase_delivered(request, purchase_id):
+    """API endpoint для отметки товара как выданного"""
+    return _mark_purchase(request, purchase_id, True)
 
 @login_required
 def mark_purchase_not_delivered(request, purchase_id):
     """API endpoint для отмены выдачи товара"""
+    return _mark_purchase(request, purchase_id, False)
+
+@login_required
+def mark_purchases_delivered(request):
+    """API endpoint для отметки выдачи сразу нескольких покупок (ids=…&delivered=1|0)"""
     if not (request.user.is_superuser or request.user.is_teacher()):
-        return JsonResponse({'success': False, 'error': 'Недостаточно прав'})
+        return JsonResponse({'success': False, 'error': 'Недостаточно прав'}, status=403)
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Неверный метод запроса'}, status=405)
     
-    if request.method == 'POST':
-        try:
-            purchase = Purchase.objects.get(id=purchase_id)
-            
-            # Проверяем права доступа: учитель может отменять выдачу только для своих учеников
-            if not request.user.is_superuser:
-                if not (purchase.user.group and purchase.user.group.teacher == request.user):
-                    return JsonResponse({'success': False, 'error': 'Вы можете отменять выдачу только для своих учеников'})
-            
-            purchase.delivered = False
-            purchase.delivered_date = None
-            purchase.save()
-            return JsonResponse({'success': True})
-        except Purchase.DoesNotExist:
-            return JsonResponse({'success': False, 'error': 'Покупка не найдена'})
-        except Exception as e:
-            return JsonResponse({'success': False, 'error': str(e)})
+    try:
+        purchase_ids = [int(purchase_id) for purchase_id in request.POST.getlist('ids')]
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Неверный список покупок'}, status=400)
+    if len(purchase_ids) > fulfilment.MAX_BATCH:
+        return JsonResponse({'success': False, 'error': f'Не больше {fulfilment.MAX_BATCH} покупок за раз'}, status=400)
     
-    return JsonResponse({'success': False, 'error': 'Неверный метод запроса'})
+    delivered = request.POST.get('delivered', '1') != '0'
+    updated = fulfilment.set_delivered(request.user, purchase_ids, delivered)
+    return JsonResponse({'success': True, 'updated': updated})
+
+def _pickup_purchases(request):
+    if not (request.user.is_superuser or request.user.is_teacher()):
+        raise PermissionDenied("Только преподаватели и администраторы могут выдавать товары")
+    
+    groups = fulfilment.scope_groups(request.user).order_by('name')
+    group_id = request.GET.get('group', '')
+    if group_id and not (group_id.isdigit() and groups.filter(id=group_id).exists()):
+        raise PermissionDenied("Нет доступа к этой группе")
+    include_delivered = request.GET.get('include_delivered', '') == 'on'
+    purchases = fulfilment.pickup_purchases(request.user, group_id or None, include_delivered)
+    return purchases, groups, group_id, include_delivered
+
+@login_required
+def pickup_list(request):
+    """Список товаров к выдаче по группам и ученикам с отметкой выдачи пачкой"""
+    purchases, groups, group_id, include_delivered = _pickup_purchases(request)
+    pickup_groups, totals = fulfilment.pickup_list(purchases)
+    
+    filter_params = {}
+    if group_id:
+        filter_params['group'] = group_id
+    if include_delivered:
+        filter_params['include_delivered'] = 'on'
+    
+    context = {
+        'pickup_groups': pickup_groups,
+        'totals': totals,
+        'available_groups': groups,
+        'group_filter': group_id,
+        'include_delivered': include_delivered,
+        'filter_query': urlencode(filter_params),
+    }
+    return render(request, 'core/pickup_list.html', context)
+
+@login_required
+def pickup_list_export(request):
+    """Упаковочный лист в CSV (открывается в Excel)"""
+    purchases, groups, group_id, include_delivered = _pickup_purchases(request)
+    
+    response = HttpResponse(content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="pickup-{timezone.localdate():%Y-%m-%d}.csv"'
+    # BOM, чтобы Excel распознал UTF-8
+    response.write('\ufeff')
+    writer = csv.writer(response, delimiter=';')
+    writer.writerow(['Группа', 'Ученик', 'Логин', 'Товар', 'Количество', 'Дата покупки', 'Выдан'])
+    for purchase in purchases:
+        student = purchase.user
+        writer.writerow([
+            student.group.name if student.group else 'Без группы',
+            student.get_full_name() or student.username,
+            student.username,
+            purchase.product.name,
+            purchase.quantity,
+            timezone.localtime(purchase.created_at).strftime('%d.%m.%Y %H:%M'),
+            'да' if purchase.delivered else 'нет',
+        ])
+    return response
 
 @login_required
 def user_management(request):
@@ -1359,20 +1391,10 @@ def user_management(request):
                         try:
                             new_balance = int(balance)
                             if new_balance >= 0:
-                                profile = Profile.objects.get_or_create(user=user)[0]
-                                old_balance = profile.astrocoins
-                                profile.astrocoins = new_balance
-                                profile.save()
+                                Profile.objects.get_or_create(user=user)
                                 
-                                # Записываем транзакцию об изменении баланса администратором
-                                if old_balance != new_balance:
-                                    Transaction.objects.create(
-                                        sender=request.user,
-                                        receiver=user,
-                                        amount=abs(new_balance - old_balance),
-                                        transaction_type='EARN' if new_balance > old_balance else 'SPEND',
-                                        description=f'Корректировка баланса администратором (было: {old_balance}, стало: {new_balance})'
-                                    )
+                                # Разница с текущим балансом записывается в журнал
+                                ledger.set_balance(user, new_balance, actor=request.user)
                             else:
                                 messages.error(request, 'Баланс не может быть отрицательным')
                                 return redirect('user_management')
@@ -1651,33 +1673,54 @@ def delete_category(request):
         
         return redirect('shop')
 
+def _category_data(category):
+    return {
+        'id': category.id,
+        'name': category.name,
+        'description': category.description,
+        'icon': category.icon,
+        'is_featured': category.is_featured,
+        'order': category.order,
+        'city': category.city_id
+    }
+
 @login_required
 def get_category(request, category_id):
     if not (request.user.is_superuser or request.user.role == 'city_admin'):
         raise PermissionDenied("Только администратор может получать данные категорий")
     
-    try:
-        category = ProductCategory.objects.get(id=category_id)
-        
-        # Проверяем права доступа - администратор может получать только категории своего города
-        if (request.user.role == 'city_admin' and 
-            hasattr(request.user, 'city') and request.user.city and 
-            category.city != request.user.city):
-            return JsonResponse({'error': 'Доступ запрещен'}, status=403)
-        
-        data = {
-            'id': category.id,
-            'name': category.name,
-            'description': category.description,
-            'icon': category.icon,
-            'is_featured': category.is_featured,
-            'order': category.order,
-            'city': category.city.id if category.city else None
-        }
-        return JsonResponse(data)
-    except ProductCategory.DoesNotExist:
+    stamp = ProductCategory.objects.filter(id=category_id).values_list('updated_at', 'city_id').first()
+    if stamp is None:
         return JsonResponse({'error': 'Категория не найдена'}, status=404)
+    if _city_denied(request.user, stamp[1]):
+        return JsonResponse({'error': 'Доступ запрещен'}, status=403)
+    
+    return conditional_json(
+        request,
+        make_etag('category', category_id, *stamp),
+        lambda: _category_data(ProductCategory.objects.get(id=category_id)),
+    )
 
+@login_required
+def get_categories(request):
+    """Несколько категорий одним запросом: /api/categories/?ids=1,2,3"""
+    if not (request.user.is_superuser or request.user.role == 'city_admin'):
+        raise PermissionDenied("Только администратор может получать данные категорий")
+    try:
+        ids = parse_ids(request.GET.get('ids', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Неверный список категорий'}, status=400)
+    
+    categories = ProductCategory.objects.filter(id__in=ids)
+    if request.user.role == 'city_admin' and request.user.city_id:
+        categories = categories.filter(city_id=request.user.city_id)
+    stamp = categories.aggregate(count=Count('id'), updated=Max('updated_at'))
+    
+    def build():
+        found = {category.id: category for category in categories}
+        return {'categories': [_category_data(found[category_id]) for category_id in ids if category_id in found]}
+    
+    return conditional_json(request, make_etag('categories', ids, stamp['count'], stamp['updated']), build)
 
 # ===============================
 # УПРАВЛЕНИЕ РОДИТЕЛЯМИ
@@ -1889,9 +1932,17 @@ def get_parent_data(request, parent_id):
     if not request.user.is_superuser:
         return JsonResponse({'error': 'Доступ запрещен'}, status=403)
     
-    try:
-        parent = Parent.objects.get(id=parent_id)
-        data = {
+    # Версия: правка родителя (updated_at) и показываемые поля привязанных учеников —
+    # у User нет updated_at, поэтому переименование видно только по самим полям
+    updated_at = Parent.objects.filter(id=parent_id).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return JsonResponse({'error': 'Родитель не найден'}, status=404)
+    students = list(User.objects.filter(parent_id=parent_id).order_by('id')
+                    .values_list('id', 'username', 'first_name', 'last_name'))
+    
+    def build():
+        parent = Parent.objects.prefetch_related('students').get(id=parent_id)
+        return {
             'id': parent.id,
             'full_name': parent.full_name,
             'phone': parent.phone,
@@ -1908,10 +1959,8 @@ def get_parent_data(request, parent_id):
                 for student in parent.students.all()
             ]
         }
-        return JsonResponse(data)
-    except Parent.DoesNotExist:
-        return JsonResponse({'error': 'Родитель не найден'}, status=404)
-
+    
+    return conditional_json(request, make_etag('parent', parent_id, updated_at, students), build)
 
 # ===============================
 # УПРАВЛЕНИЕ ШКОЛЬНОЙ СИСТЕМОЙ
@@ -2163,66 +2212,6 @@ def delete_course(request, course_id):
 
 
 
-@login_required
-def get_courses_by_school(request, school_id):
-    """
-    API для получения курсов по школе (для динамической загрузки в формах)
-    """
-    try:
-        school = School.objects.get(id=school_id)
-        courses = school.courses.filter(is_active=True).order_by('name')
-        data = {
-            'courses': [
-                {
-                    'id': course.id,
-                    'name': course.name,
-                    'description': course.description,
-                    'duration_hours': course.duration_hours
-                }
-                for course in courses
-            ]
-        }
-        return JsonResponse(data)
-    except School.DoesNotExist:
-        return JsonResponse({'error': 'Школа не найдена'}, status=404)
-
-
-@login_required
-def get_group_students(request, group_id):
-    """
-    API для получения списка учеников группы
-    """
-    try:
-        group = Group.objects.get(id=group_id)
-        
-        # Проверяем права доступа: либо преподаватель этой группы, либо суперпользователь
-        if not (request.user.is_superuser or 
-                (request.user.is_teacher and group.teacher == request.user)):
-            return JsonResponse({'error': 'Доступ запрещен'}, status=403)
-        
-        students = group.students.all().order_by('last_name', 'first_name', 'username')
-        data = {
-            'students': [
-                {
-                    'id': student.id,
-                    'username': student.username,
-                    'full_name': student.get_full_name() or student.username,
-                    'first_name': student.first_name,
-                    'last_name': student.last_name,
-                    'astrocoins': student.profile.astrocoins,
-                    'email': student.email,
-                    'date_joined': student.date_joined.strftime('%d.%m.%Y'),
-                }
-                for student in students
-            ],
-            'group_name': group.name,
-            'total_students': students.count()
-        }
-        return JsonResponse(data)
-    except Group.DoesNotExist:
-        return JsonResponse({'error': 'Группа не найдена'}, status=404)
-
-
 # ===============================
 # КАСТОМНЫЕ СТРАНИЦЫ ОШИБОК
 # ===============================
@@ -2243,80 +2232,75 @@ def custom_permission_denied_view(request, exception):
 @login_required
 def get_courses_by_school(request, school_id):
     """
-    API endpoint для получения курсов по школе
+    API для получения активных курсов школы (для динамической загрузки в формах)
     """
-    try:
-        school = School.objects.get(id=school_id)
-        courses = Course.objects.filter(school=school, is_active=True).order_by('name')
-        
-        courses_data = []
-        for course in courses:
-            courses_data.append({
-                'id': course.id,
-                'name': course.name,
-                'description': course.description,
-            })
-        
-        return JsonResponse({
+    # Версия: число, последний id и последняя правка курсов школы (включая неактивные)
+    stamp = (School.objects.filter(id=school_id)
+             .annotate(courses_count=Count('courses'), courses_max=Max('courses__id'),
+                       courses_updated=Max('courses__updated_at'))
+             .values_list('courses_count', 'courses_max', 'courses_updated').first())
+    if stamp is None:
+        return JsonResponse({'success': False, 'error': 'Школа не найдена'}, status=404)
+    
+    def build():
+        courses = Course.objects.filter(school_id=school_id, is_active=True).order_by('name')
+        return {
             'success': True,
-            'courses': courses_data
-        })
+            'courses': [
+                {
+                    'id': course.id,
+                    'name': course.name,
+                    'description': course.description,
+                    'duration_hours': course.duration_hours
+                }
+                for course in courses
+            ]
+        }
     
-    except School.DoesNotExist:
-        return JsonResponse({
-            'success': False,
-            'error': 'Школа не найдена'
-        })
-    except Exception as e:
-        return JsonResponse({
-            'success': False,
-            'error': str(e)
-        })
+    return conditional_json(request, make_etag('courses', school_id, *stamp), build)
 
 
 @login_required
 def get_group_students(request, group_id):
     """
-    API endpoint для получения учеников группы
+    API для получения списка учеников группы
     """
-    try:
-        group = Group.objects.get(id=group_id)
-        
-        # Проверяем права доступа
-        if not (request.user.is_superuser or 
-                (request.user.is_teacher() and group.teacher == request.user)):
-            return JsonResponse({
-                'success': False,
-                'error': 'Недостаточно прав для просмотра учеников группы'
-            })
-        
-        students = User.objects.filter(group=group, role='student').order_by('username')
-        
-        students_data = []
-        for student in students:
-            students_data.append({
+    group = Group.objects.filter(id=group_id).values_list('name', 'teacher_id').first()
+    if group is None:
+        return JsonResponse({'success': False, 'error': 'Группа не найдена'}, status=404)
+    group_name, teacher_id = group
+    
+    # Проверяем права доступа: либо преподаватель этой группы, либо суперпользователь
+    if not (request.user.is_superuser or
+            (request.user.is_teacher() and teacher_id == request.user.id)):
+        return JsonResponse({'success': False, 'error': 'Недостаточно прав для просмотра учеников группы'}, status=403)
+    
+    students = User.objects.filter(group_id=group_id, role='student')
+    # Версия: показываемые поля учеников (у User нет updated_at) и версии
+    # балансов из кеша (core.balances) — без профилей и сериализации
+    rows = list(students.order_by('id').values_list('id', 'username', 'first_name', 'last_name', 'email', 'date_joined'))
+    versions = balances.versions([row[0] for row in rows])
+    etag = make_etag('group_students', group_id, group_name, rows, [versions[row[0]] for row in rows])
+    
+    def build():
+        students_data = [
+            {
                 'id': student.id,
                 'username': student.username,
                 'full_name': student.get_full_name() or student.username,
+                'first_name': student.first_name,
+                'last_name': student.last_name,
                 'email': student.email,
                 'astrocoins': student.profile.astrocoins if hasattr(student, 'profile') else 0,
                 'date_joined': student.date_joined.strftime('%d.%m.%Y'),
-            })
-        
-        return JsonResponse({
+            }
+            for student in students.select_related('profile').order_by('username')
+        ]
+        return {
             'success': True,
-            'group_name': group.name,
+            'group_name': group_name,
             'total_students': len(students_data),
             'students': students_data
-        })
+        }
     
-    except Group.DoesNotExist:
-        return JsonResponse({
-            'success': False,
-            'error': 'Группа не найдена'
-        })
-    except Exception as e:
-        return JsonResponse({
-            'success': False,
-            'error': str(e)
-        })
\ No newline at end of file
+    return conditional_json(request, etag, build)
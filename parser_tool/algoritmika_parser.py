@@ -3,10 +3,10 @@
 Парсер для переноса данных с algoritmika25.ru в новую систему
 """
 
+import argparse
 import os
 import sys
 import django
-import requests
 from bs4 import BeautifulSoup
 import json
 from datetime import datetime, date
@@ -21,6 +21,8 @@ django.setup()
 
 # Импортируем модели Django
 from core.models import User, Group, City, School, Course, Parent, Profile
+from core.accounts import bulk_create_students, hash_passwords
+from core.http_cache import CachedSession, DEFAULT_CACHE_DIR
 from django.contrib.auth.hashers import make_password
 from django.db import transaction
 
@@ -28,9 +30,11 @@ from django.db import transaction
 class AlgoritmikaParser:
     """Парсер для algoritmika25.ru"""
     
-    def __init__(self, base_url="https://algoritmika25.ru"):
+    def __init__(self, base_url="https://algoritmika25.ru", cache_dir=DEFAULT_CACHE_DIR, replay=False, workers=None):
         self.base_url = base_url
-        self.session = requests.Session()
+        self.workers = workers  # Процессы для хеширования паролей (None — все ядра)
+        # Ответы пишутся в дисковый кеш; replay — весь импорт по записанным ответам
+        self.session = CachedSession(cache_dir, replay=replay)
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
@@ -58,6 +62,8 @@ class AlgoritmikaParser:
         """Авторизация на старом сайте через email"""
         try:
             print(f"🔐 Авторизация для {email}...")
+            # Ответы кешируются отдельно для каждого учителя
+            self.session.namespace = email
             
             # Получаем страницу входа
             login_page = self.session.get(self.login_url)
@@ -352,7 +358,9 @@ class AlgoritmikaParser:
                     defaults={'description': 'Базовый курс программирования'}
                 )
                 
-                # Создаем группы и учеников
+                # Создаем группы; учеников собираем и создаем пачками после цикла
+                new_students = []
+                reserved = set()
                 for group_data in groups_data:
                     # Создаем группу
                     group, created = Group.objects.get_or_create(
@@ -369,29 +377,22 @@ class AlgoritmikaParser:
                         print(f"✅ Создана группа: {group_data['name']}")
                         self.stats['groups'] += 1
                     
-                    # Создаем учеников
                     for student_name in group_data['students']:
                         # Генерируем username из имени
-                        username = self.generate_username(student_name)
-                        
-                        student, created = User.objects.get_or_create(
+                        username = self.generate_username(student_name, reserved)
+                        reserved.add(username)
+                        new_students.append(User(
                             username=username,
-                            defaults={
-                                'role': 'student',
-                                'city': city,
-                                'group': group,
-                                'first_name': student_name.split()[1] if len(student_name.split()) > 1 else '',
-                                'last_name': student_name.split()[0] if student_name.split() else student_name,
-                                'email': f'{username}@student.{teacher_city.lower()}.ru',
-                                'password': make_password('ученик123')
-                            }
-                        )
-                        
-                        if created:
-                            print(f"✅ Создан ученик: {student_name} (username: {username})")
-                            # Создаем профиль
-                            Profile.objects.get_or_create(user=student, defaults={'astrocoins': 0})
-                            self.stats['students'] += 1
+                            role='student',
+                            city=city,
+                            group=group,
+                            first_name=student_name.split()[1] if len(student_name.split()) > 1 else '',
+                            last_name=student_name.split()[0] if student_name.split() else student_name,
+                            email=f'{username}@student.{teacher_city.lower()}.ru',
+                        ))
+                
+                if new_students:
+                    self.bulk_create_students(new_students, 'ученик123')
                 
                 print(f"\n🎉 Импорт завершен!")
                 print(f"📊 Статистика:")
@@ -402,7 +403,31 @@ class AlgoritmikaParser:
             print(f"❌ Ошибка при создании пользователей: {str(e)}")
             self.stats['errors'].append(f"Database creation error: {str(e)}")
     
-    def generate_username(self, full_name):
+    def bulk_create_students(self, users, password):
+        """Хеширует пароли в пуле процессов и создает учеников с профилями пачками"""
+        total = len(users)
+        print(f"\n🔐 Хеширование паролей: {total} учеников...")
+        
+        def report(done, total):
+            print(f"\r  ⏳ {done}/{total}", end='', flush=True)
+        
+        started = time.perf_counter()
+        # У каждого хеша своя соль, поэтому одинаковый пароль хешируется для каждого
+        hashed = hash_passwords([password] * total, self.workers, report)
+        hash_seconds = time.perf_counter() - started
+        print(f"\n  ⚡ {total} паролей за {hash_seconds:.1f} с ({total / max(hash_seconds, 1e-6):.0f}/с)")
+        
+        for user, password_hash in zip(users, hashed):
+            user.password = password_hash
+        
+        started = time.perf_counter()
+        created = bulk_create_students(users, progress=report)
+        print(f"\n  💾 Записано {len(created)} учеников с профилями за {time.perf_counter() - started:.1f} с")
+        for user in created:
+            print(f"✅ Создан ученик: {user.last_name} {user.first_name} (username: {user.username})")
+        self.stats['students'] += len(created)
+    
+    def generate_username(self, full_name, reserved=()):
         """Генерация username из полного имени"""
         # Транслитерация и очистка
         name_parts = full_name.lower().replace(' ', '_').replace('.', '')
@@ -412,7 +437,7 @@ class AlgoritmikaParser:
         # Проверяем уникальность
         counter = 1
         original_username = username
-        while User.objects.filter(username=username).exists():
+        while username in reserved or User.objects.filter(username=username).exists():
             username = f"{original_username}_{counter}"
             counter += 1
             
@@ -448,8 +473,14 @@ class AlgoritmikaParser:
 
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Импорт данных с algoritmika25.ru')
+    arg_parser.add_argument('--replay', action='store_true', help='Работать по записанным ответам, без сети')
+    arg_parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Каталог кеша HTTP-ответов')
+    arg_parser.add_argument('--workers', type=int, help='Процессов для хеширования паролей (по умолчанию все ядра)')
+    args = arg_parser.parse_args()
+    
     # Пример использования
-    parser = AlgoritmikaParser()
+    parser = AlgoritmikaParser(cache_dir=args.cache_dir, replay=args.replay, workers=args.workers)
     
     # Данные для импорта
     TEACHER_EMAIL = "depressed7kk1d@vk.com"
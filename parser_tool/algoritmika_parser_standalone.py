@@ -4,22 +4,28 @@ Standalone парсер для algoritmika25.ru (без подключения 
 Только извлекает и выводит данные в JSON формате
 """
 
-import requests
+import argparse
+import os
+import sys
 from bs4 import BeautifulSoup
 import json
 from datetime import datetime, date
 import time
 import re
 
+# Общий слой загрузки с дисковым кешем лежит в core (без Django)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.http_cache import CachedSession, DEFAULT_CACHE_DIR
+
 
 class AlgoritmikaParserStandalone:
     """Standalone парсер для algoritmika25.ru"""
     
-    def __init__(self, base_url="https://algoritmika25.ru"):
+    def __init__(self, base_url="https://algoritmika25.ru", cache_dir=DEFAULT_CACHE_DIR, replay=False):
         self.base_url = base_url
         
-        # Создаем сессию для сохранения cookies
-        self.session = requests.Session()
+        # Сессия сохраняет cookies и пишет ответы в кеш (replay — только из кеша)
+        self.session = CachedSession(cache_dir, replay=replay)
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
@@ -49,6 +55,8 @@ class AlgoritmikaParserStandalone:
         """Авторизация на сайте"""
         try:
             print(f"🔐 Авторизация для {email}...")
+            # Ответы кешируются отдельно для каждого учителя
+            self.session.namespace = email
             
             # Получаем страницу входа
             login_page = self.session.get(self.login_url)
@@ -350,6 +358,7 @@ class AlgoritmikaParserStandalone:
             'login_url': self.login_url,
             'groups_url': self.groups_url,
             'session_cookies': dict(self.session.cookies),
+            'http_cache': self.session.stats,
             'parsed_counts': {
                 'students': len(self.parsed_data['students']),
                 'groups': len(self.parsed_data['groups']),
@@ -360,14 +369,23 @@ class AlgoritmikaParserStandalone:
 
 def main():
     """Главная функция для тестирования"""
-    parser = AlgoritmikaParserStandalone()
+    arg_parser = argparse.ArgumentParser(description='Standalone парсер algoritmika25.ru')
+    arg_parser.add_argument('--replay', action='store_true', help='Работать по записанным ответам, без сети')
+    arg_parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Каталог кеша HTTP-ответов')
+    arg_parser.add_argument('--email', help='Email учителя')
+    args = arg_parser.parse_args()
+    
+    parser = AlgoritmikaParserStandalone(cache_dir=args.cache_dir, replay=args.replay)
     
     print("🔄 Standalone парсер algoritmika25.ru")
+    if args.replay:
+        print(f"📼 Режим replay: ответы из {args.cache_dir}")
     print("=" * 40)
     
     # Тест авторизации
-    email = input("Введите email учителя: ").strip()
-    password = input("Введите пароль: ").strip()
+    email = args.email or input("Введите email учителя: ").strip()
+    # При воспроизведении пароль не проверяется
+    password = '' if args.replay else input("Введите пароль: ").strip()
     
     if parser.login(email, password):
         print("\n✅ Авторизация успешна!")
@@ -7,6 +7,7 @@ import os
 import sys
 import django
 import json
+import time
 from datetime import datetime
 
 # Добавляем путь к Django проекту
@@ -17,8 +18,9 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'astrocoins.settings')
 django.setup()
 
 # Импортируем модели Django
+from core import ledger
+from core.accounts import BATCH_SIZE, bulk_create_students, hash_passwords
 from core.models import User, Group, City, School, Course, Parent, Profile
-from django.contrib.auth.hashers import make_password
 from django.db import transaction
 from django.contrib.auth import get_user_model
 
@@ -27,8 +29,10 @@ User = get_user_model()
 class DatabaseImporter:
     """Импортер данных в Django БД"""
     
-    def __init__(self, json_file_path):
+    def __init__(self, json_file_path, workers=None, dry_run=False):
         self.json_file_path = json_file_path
+        self.workers = workers  # Процессы для хеширования паролей (None — все ядра)
+        self.dry_run = dry_run  # Только вывести план, база не меняется
         self.data = None
         self.teacher_user = None  # AlexanderX
         self.curator_user = None  # adminVld
@@ -41,6 +45,8 @@ class DatabaseImporter:
             'courses_created': 0,
             'students_created': 0,
             'students_updated': 0,
+            'students_unchanged': 0,
+            'balances_updated': 0,
             'errors': []
         }
     
@@ -164,18 +170,18 @@ class DatabaseImporter:
                         self.stats['groups_created'] += 1
                     else:
                         print(f"👥 Найдена группа: {group.name}")
-                        # Обновляем связи если нужно
+                        # Обновляем связи если нужно (сравниваем id, без загрузки связанных объектов)
                         updated = False
-                        if group.course != course:
+                        if group.course_id != course.pk:
                             group.course = course
                             updated = True
-                        if group.school != self.default_school:
+                        if group.school_id != self.default_school.pk:
                             group.school = self.default_school
                             updated = True
-                        if group.teacher != self.teacher_user:
+                        if group.teacher_id != self.teacher_user.pk:
                             group.teacher = self.teacher_user
                             updated = True
-                        if group.curator != self.curator_user:
+                        if group.curator_id != self.curator_user.pk:
                             group.curator = self.curator_user
                             updated = True
                         if updated:
@@ -207,118 +213,183 @@ class DatabaseImporter:
         else:
             return parts[0] if parts else '', '', ''
 
-    def create_students(self):
-        """Создает студентов из JSON данных"""
-        try:
-            print(f"\n👨‍🎓 Создание студентов...")
+    def plan_students(self):
+        """
+        Сравнивает студентов из JSON с базой и возвращает план импорта.
+        Группы, пользователи и профили загружаются тремя запросами в словари,
+        дальше сравнение идет в памяти.
+        """
+        students_data = self.data.get('students', [])
+        plan = {
+            'create': {},     # login → (пользователь, пароль, баланс)
+            'update': {},     # login → (пользователь, {поле: (было, стало)})
+            'balances': {},   # login → (пользователь, было, стало)
+            'profiles': {},   # login → (пользователь без профиля, баланс)
+            'unchanged': [],
+            'skipped': [],
+        }
+        
+        rows = {}
+        for student_data in students_data:
+            # Парсим данные студента
+            login = student_data.get('login', '').strip()
+            full_name = student_data.get('full_name', '').strip()
             
-            students_data = self.data.get('students', [])
+            # Парсим ФИО из full_name или берем из отдельных полей
+            if full_name:
+                first_name, last_name, middle_name = self.parse_full_name(full_name)
+            else:
+                first_name = student_data.get('first_name', '').strip()
+                last_name = student_data.get('last_name', '').strip()
+                middle_name = ''
             
-            for student_data in students_data:
-                try:
-                    # Парсим данные студента
-                    login = student_data.get('login', '').strip()
-                    password = student_data.get('password', '123456')
-                    balance = int(student_data.get('balance', 0))
-                    group_name = student_data.get('group_name', '').strip()
-                    full_name = student_data.get('full_name', '').strip()
-                    
-                    # Парсим ФИО из full_name или берем из отдельных полей
-                    if full_name:
-                        first_name, last_name, middle_name = self.parse_full_name(full_name)
-                    else:
-                        first_name = student_data.get('first_name', '').strip()
-                        last_name = student_data.get('last_name', '').strip()
-                        middle_name = ''
-                    
-                    if not first_name or not last_name or not login:
-                        print(f"⚠️ Пропускаем студента с неполными данными: {student_data}")
-                        continue
-                    
-                    print(f"  📝 Обрабатываем: {last_name} {first_name} {middle_name} (login: {login})")
-                    
-                    # Находим группу для студента
-                    try:
-                        group = Group.objects.get(name=group_name)
-                    except Group.DoesNotExist:
-                        print(f"❌ Группа {group_name} не найдена для студента {first_name} {last_name}")
-                        continue
-                    
-                    # Создаем/обновляем пользователя-студента
-                    user, created = User.objects.get_or_create(
-                        username=login,
-                        defaults={
-                            'first_name': first_name,
-                            'last_name': last_name,
-                            'middle_name': middle_name,
-                            'email': f"{login}@algoritmika.local",
-                            'password': make_password(password),
-                            'is_active': True,
-                            'role': 'student',  # Правильное поле role вместо user_type
-                            'group': group,  # Привязываем к группе
-                            'city': self.default_city  # Привязываем к городу
-                        }
-                    )
-                    
-                    if created:
-                        print(f"👤 Создан пользователь: {user.username} ({last_name} {first_name})")
-                        self.stats['students_created'] += 1
-                    else:
-                        # Обновляем данные если пользователь уже существует
-                        updated = False
-                        if user.first_name != first_name:
-                            user.first_name = first_name
-                            updated = True
-                        if user.last_name != last_name:
-                            user.last_name = last_name
-                            updated = True
-                        if user.middle_name != middle_name:
-                            user.middle_name = middle_name
-                            updated = True
-                        if user.role != 'student':
-                            user.role = 'student'
-                            updated = True
-                        if user.group != group:
-                            user.group = group
-                            updated = True
-                        if user.city != self.default_city:
-                            user.city = self.default_city
-                            updated = True
-                        
-                        if updated:
-                            user.save()
-                            print(f"👤 Обновлен пользователь: {user.username}")
-                            self.stats['students_updated'] += 1
-                        else:
-                            print(f"👤 Пользователь актуален: {user.username}")
-                    
-                    # Создаем/обновляем профиль студента
-                    profile, profile_created = Profile.objects.get_or_create(
-                        user=user,
-                        defaults={
-                            'astrocoins': balance  # Правильное поле astrocoins вместо balance
-                        }
-                    )
-                    
-                    if not profile_created:
-                        # Обновляем баланс если изменился
-                        if profile.astrocoins != balance:
-                            old_balance = profile.astrocoins
-                            profile.astrocoins = balance
-                            profile.save()
-                            print(f"  💰 Обновлен баланс: {old_balance} → {balance} AC")
-                        else:
-                            print(f"  💰 Баланс актуален: {balance} AC")
-                    else:
-                        print(f"  💰 Создан профиль с балансом: {balance} AC")
-                    
-                    print(f"  ✅ Студент в группе: {group.name}")
-                
-                except Exception as e:
-                    error_msg = f"Ошибка создания студента {student_data}: {e}"
-                    print(f"❌ {error_msg}")
-                    self.stats['errors'].append(error_msg)
+            if not first_name or not last_name or not login:
+                plan['skipped'].append(f"неполные данные: {student_data}")
+                continue
+            try:
+                balance = int(student_data.get('balance', 0))
+            except (TypeError, ValueError):
+                balance = -1
+            if balance < 0:
+                plan['skipped'].append(f"{login}: некорректный баланс {student_data.get('balance')!r}")
+                continue
+            # Повтор логина в файле перезаписывает предыдущую запись
+            rows.pop(login, None)
+            rows[login] = {
+                'login': login,
+                'password': student_data.get('password', '123456'),
+                'balance': balance,
+                'group_name': student_data.get('group_name', '').strip(),
+                'first_name': first_name,
+                'last_name': last_name,
+                'middle_name': middle_name,
+            }
+        rows = list(rows.values())
+        
+        groups = {}
+        for group in Group.objects.filter(name__in={row['group_name'] for row in rows}).order_by('id'):
+            groups.setdefault(group.name, group)
+        users = User.objects.in_bulk([row['login'] for row in rows], field_name='username')
+        profiles = {profile.user_id: profile for profile in Profile.objects.filter(user__in=users.values())}
+        
+        for row in rows:
+            login = row['login']
+            group = groups.get(row['group_name'])
+            if group is None:
+                plan['skipped'].append(f"{login}: группа {row['group_name']} не найдена")
+                continue
+            
+            user = users.get(login)
+            if user is None:
+                # Новых создаём разом: пароли хешируются пулом процессов
+                plan['create'][login] = (User(
+                    username=login,
+                    first_name=row['first_name'],
+                    last_name=row['last_name'],
+                    middle_name=row['middle_name'],
+                    email=f"{login}@algoritmika.local",
+                    is_active=True,
+                    role='student',  # Правильное поле role вместо user_type
+                    group=group,  # Привязываем к группе
+                    city=self.default_city  # Привязываем к городу
+                ), row['password'], row['balance'])
+                continue
             
+            wanted = {
+                'first_name': row['first_name'],
+                'last_name': row['last_name'],
+                'middle_name': row['middle_name'],
+                'role': 'student',
+                'group_id': group.pk,
+                'city_id': self.default_city.pk,
+            }
+            changes = {field: (getattr(user, field), value) for field, value in wanted.items()
+                       if getattr(user, field) != value}
+            if changes:
+                plan['update'][login] = (user, changes)
+            
+            profile = profiles.get(user.pk)
+            if profile is None:
+                plan['profiles'][login] = (user, row['balance'])
+            elif profile.astrocoins != row['balance']:
+                plan['balances'][login] = (user, profile.astrocoins, row['balance'])
+            elif not changes:
+                plan['unchanged'].append(login)
+        
+        return plan
+    
+    def print_plan(self, plan, details=False):
+        """Выводит план импорта: сводку, а с details — каждое изменение"""
+        print(f"\n📋 План импорта студентов:")
+        print(f"   ➕ Создать: {len(plan['create'])}")
+        print(f"   ✏️ Обновить: {len(plan['update'])}")
+        print(f"   💰 Изменить баланс: {len(plan['balances'])}")
+        print(f"   🧾 Создать профиль: {len(plan['profiles'])}")
+        print(f"   ✅ Без изменений: {len(plan['unchanged'])}")
+        print(f"   ⚠️ Пропустить: {len(plan['skipped'])}")
+        if not details:
+            return
+        
+        for login, (user, _, balance) in plan['create'].items():
+            print(f"  ➕ {login}: {user.last_name} {user.first_name} {user.middle_name}".rstrip()
+                  + f", группа {user.group.name}, {balance} AC")
+        for login, (_, changes) in plan['update'].items():
+            described = ', '.join(f"{field}: {old!r} → {new!r}" for field, (old, new) in changes.items())
+            print(f"  ✏️ {login}: {described}")
+        for login, (_, old, new) in plan['balances'].items():
+            print(f"  💰 {login}: {old} → {new} AC")
+        for login, (_, balance) in plan['profiles'].items():
+            print(f"  🧾 {login}: профиль с балансом {balance} AC")
+        for reason in plan['skipped']:
+            print(f"  ⚠️ {reason}")
+    
+    def apply_plan(self, plan):
+        """Применяет план пачками bulk_create/bulk_update и журналом (вызывается в транзакции импорта)"""
+        if plan['update']:
+            updated = [user for user, _ in plan['update'].values()]
+            fields = set()
+            for user, changes in plan['update'].values():
+                for field, (_, value) in changes.items():
+                    setattr(user, field, value)
+                fields.update(field.removesuffix('_id') for field in changes)
+            User.objects.bulk_update(updated, sorted(fields), batch_size=BATCH_SIZE)
+            self.stats['students_updated'] += len(updated)
+        
+        if plan['profiles']:
+            # Профиль открывается с нулем, баланс проводится через журнал вместе с остальными
+            Profile.objects.bulk_create(
+                [Profile(user=user) for user, _ in plan['profiles'].values()], batch_size=BATCH_SIZE
+            )
+        
+        # Балансы меняются только через журнал: профили блокируются, а разница с
+        # актуальным значением (не с прочитанным при планировании) записывается
+        # корректировкой, так что начисления между планом и записью не теряются
+        targets = {user: balance for user, _, balance in plan['balances'].values()}
+        targets.update((user, balance) for user, balance in plan['profiles'].values() if balance)
+        if targets:
+            entries = ledger.bulk_set_balance(
+                targets,
+                actor=self.curator_user,
+                description='Баланс из импорта',
+                metadata={'source': 'import'},
+            )
+            self.stats['balances_updated'] += len(entries)
+        
+        if plan['create']:
+            self.bulk_create_students(list(plan['create'].values()))
+        
+        self.stats['students_unchanged'] += len(plan['unchanged'])
+        for reason in plan['skipped']:
+            print(f"⚠️ Пропущен студент: {reason}")
+    
+    def create_students(self):
+        """Создает и обновляет студентов из JSON данных по плану"""
+        try:
+            print(f"\n👨‍🎓 Создание студентов...")
+            plan = self.plan_students()
+            self.print_plan(plan, details=self.dry_run)
+            if not self.dry_run:
+                self.apply_plan(plan)
             return True
             
         except Exception as e:
@@ -326,6 +397,34 @@ class DatabaseImporter:
             self.stats['errors'].append(f"Students error: {e}")
             return False
     
+    def bulk_create_students(self, new_students):
+        """Хеширует пароли новых студентов в пуле процессов и создает их пачками"""
+        total = len(new_students)
+        print(f"\n🔐 Хеширование паролей: {total} новых студентов...")
+        
+        def report(done, total):
+            print(f"\r  ⏳ {done}/{total}", end='', flush=True)
+        
+        started = time.perf_counter()
+        hashed = hash_passwords([password for _, password, _ in new_students], self.workers, report)
+        hash_seconds = time.perf_counter() - started
+        print(f"\n  ⚡ {total} паролей за {hash_seconds:.1f} с ({total / max(hash_seconds, 1e-6):.0f}/с)")
+        
+        users = []
+        for (user, _, _), password in zip(new_students, hashed):
+            user.password = password
+            users.append(user)
+        
+        started = time.perf_counter()
+        created = bulk_create_students(
+            users,
+            astrocoins={user.username: balance for user, _, balance in new_students},
+            progress=report,
+        )
+        db_seconds = time.perf_counter() - started
+        print(f"\n  💾 Записано {len(created)} студентов с профилями за {db_seconds:.1f} с")
+        self.stats['students_created'] += len(created)
+    
     def print_statistics(self):
         """Выводит статистику импорта"""
         print(f"\n📊 Статистика импорта:")
@@ -333,6 +432,8 @@ class DatabaseImporter:
         print(f"   👥 Групп создано: {self.stats['groups_created']}")
         print(f"   👨‍🎓 Студентов создано: {self.stats['students_created']}")
         print(f"   👤 Студентов обновлено: {self.stats['students_updated']}")
+        print(f"   💰 Балансов обновлено: {self.stats['balances_updated']}")
+        print(f"   ✅ Студентов без изменений: {self.stats['students_unchanged']}")
         
         if self.stats['errors']:
             print(f"\n❌ Ошибки ({len(self.stats['errors'])}):")
@@ -352,13 +453,13 @@ class DatabaseImporter:
         if not self.load_json_data():
             return False
         
-        # Настраиваем базовые данные
-        if not self.setup_basic_data():
-            return False
-        
         # Используем транзакцию для атомарности
         try:
             with transaction.atomic():
+                # Настраиваем базовые данные
+                if not self.setup_basic_data():
+                    return False
+                
                 # Создаем курсы и группы
                 if not self.create_courses_and_groups():
                     raise Exception("Ошибка создания курсов и групп")
@@ -367,6 +468,12 @@ class DatabaseImporter:
                 if not self.create_students():
                     raise Exception("Ошибка создания студентов")
                 
+                if self.dry_run:
+                    # Город, школа и группы, созданные для построения плана, откатываются
+                    transaction.set_rollback(True)
+                    print(f"\n🔍 Пробный запуск: изменения в базу не записаны")
+                    return True
+                
                 print(f"\n✅ Импорт завершен успешно!")
                 self.print_statistics()
                 return True
@@ -380,8 +487,14 @@ class DatabaseImporter:
 
 def main():
     """Главная функция"""
+    import argparse
     import glob
     
+    arg_parser = argparse.ArgumentParser(description='Импорт данных парсера в Django БД')
+    arg_parser.add_argument('--workers', type=int, help='Процессов для хеширования паролей (по умолчанию все ядра)')
+    arg_parser.add_argument('--dry-run', action='store_true', help='Показать план импорта, не изменяя базу')
+    args = arg_parser.parse_args()
+    
     # Ищем последний JSON файл
     json_files = glob.glob("algoritmika_data_*.json")
     if not json_files:
@@ -392,15 +505,18 @@ def main():
     latest_file = max(json_files, key=os.path.getctime)
     print(f"📄 Используем файл: {latest_file}")
     
-    # Подтверждение
-    confirm = input(f"\n❓ Импортировать данные из {latest_file} в базу данных? (y/N): ")
-    if confirm.lower() not in ['y', 'yes', 'да']:
-        print("❌ Импорт отменен")
-        return
+    # Подтверждение (пробный запуск базу не меняет)
+    if not args.dry_run:
+        confirm = input(f"\n❓ Импортировать данные из {latest_file} в базу данных? (y/N): ")
+        if confirm.lower() not in ['y', 'yes', 'да']:
+            print("❌ Импорт отменен")
+            return
     
     # Запускаем импорт
-    importer = DatabaseImporter(latest_file)
+    importer = DatabaseImporter(latest_file, workers=args.workers, dry_run=args.dry_run)
     success = importer.run_import()
+    if args.dry_run:
+        return
     
     if success:
         print(f"\n🎉 Импорт завершен успешно!")
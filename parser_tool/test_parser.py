@@ -1,8 +1,15 @@
 #!/usr/bin/env python3
 """
 Тестовый скрипт для парсера algoritmika25.ru
+
+С флагом --replay все запросы обслуживаются из дискового кеша
+(.http_cache или ALGORITMIKA_HTTP_CACHE) и тесты работают без сети.
 """
 
+import sys
+
+REPLAY = '--replay' in sys.argv
+
 try:
     from algoritmika_parser_standalone import AlgoritmikaParserStandalone as AlgoritmikaParser
     print("🔧 Используем standalone версию парсера (без Django)")
@@ -26,7 +33,7 @@ def test_login():
     if not password:
         password = default_password
     
-    parser = AlgoritmikaParser()
+    parser = AlgoritmikaParser(replay=REPLAY)
     success = parser.login(email, password)
     
     if success:
@@ -168,6 +175,8 @@ def debug_html():
 def main():
     """Главное меню"""
     print("🔄 Парсер algoritmika25.ru")
+    if REPLAY:
+        print("📼 Режим replay: ответы из кеша, без сети")
     print("=" * 30)
     print("1. Тест авторизации")
     print("2. Тест парсинга групп") 